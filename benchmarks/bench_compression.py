@@ -0,0 +1,132 @@
+"""#### Benchmark: Compresión de Mensajes de Membresía
+
+Mide bytes ahorrados vs. costo de CPU de compress_frame()/parse_message()
+con los frames de membresía que emite el servidor (y el SYNC de gossip),
+con 100/1k/10k peers:
+
+- REGISTER_ACK con la lista completa y con JOIN_CONTACTS contactos (cliente lazy)
+- SYNC_PEERS_RESPONSE con la lista completa
+- PEER_LIST_UPDATE de una sola alta o una sola baja (el servidor no agrupa)
+
+Uso:
+    python benchmarks/bench_compression.py [--sizes 100 1000 10000] [--json salida.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.local_link import HOST_ID, uds_path
+from common.protocol import (
+    create_message, parse_message, compress_frame,
+    MSG_REGISTER_ACK, MSG_SYNC_PEERS_RESPONSE, MSG_PEER_LIST_UPDATE,
+    CODEC_ZLIB, CODEC_ZLIB_DICT
+)
+from peer.partial_view import JOIN_CONTACTS
+
+CODECS = [None, CODEC_ZLIB, CODEC_ZLIB_DICT]
+
+
+def make_peer_list(n: int, seed: int = 42) -> dict:
+    """Lista de peers con la misma forma que la del servidor (peer_entry con enlace local)."""
+    rng = random.Random(seed)
+    peers = {}
+    for i in range(n):
+        username = f"user_{rng.randint(100, 999)}_{i}"
+        ip = f"192.168.{rng.randint(0, 3)}.{rng.randint(2, 254)}"
+        port = rng.randint(10000, 11000)
+        peers[f"{username}@{ip}:{port}"] = {"ip": ip, "port": port, "username": username,
+                                            "host_id": HOST_ID, "uds": uds_path(port)}
+    return peers
+
+
+def make_frames(n: int) -> dict:
+    peer_list = make_peer_list(n)
+    some_id = next(iter(peer_list))
+    contacts = dict(list(peer_list.items())[:JOIN_CONTACTS + 1])
+    ack = {"peer_id": some_id, "compression": CODEC_ZLIB_DICT, "udp_port": 9999}
+    return {
+        "REGISTER_ACK": create_message(
+            MSG_REGISTER_ACK, sender_id="server", to=some_id,
+            content={"peer_id": some_id, "peer_list": peer_list, **ack}
+        ),
+        "REGISTER_ACK lazy": create_message(
+            MSG_REGISTER_ACK, sender_id="server", to=some_id,
+            content={"peer_id": some_id, "peer_list": contacts, **ack}
+        ),
+        "SYNC_PEERS_RESPONSE": create_message(
+            MSG_SYNC_PEERS_RESPONSE, sender_id=some_id, to=some_id,
+            content={"peer_list": peer_list}
+        ),
+        # broadcast_peer_update manda un mensaje por alta o baja
+        "PEER_LIST_UPDATE alta": create_message(
+            MSG_PEER_LIST_UPDATE, sender_id="server",
+            content={"new_peer": {some_id: peer_list[some_id]}}
+        ),
+        "PEER_LIST_UPDATE baja": create_message(
+            MSG_PEER_LIST_UPDATE, sender_id="server",
+            content={"removed_peer": some_id}
+        ),
+    }
+
+
+def measure(frame: bytes, codec: str | None, min_time: float = 0.2) -> dict:
+    """Repite compress + parse hasta juntar min_time segundos."""
+    encoded = compress_frame(frame, codec)
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        compress_frame(frame, codec)
+        rounds += 1
+        if time.perf_counter() - start >= min_time:
+            break
+    encode_us = (time.perf_counter() - start) / rounds * 1e6
+
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        parse_message(encoded[:-1])
+        rounds += 1
+        if time.perf_counter() - start >= min_time:
+            break
+    decode_us = (time.perf_counter() - start) / rounds * 1e6
+
+    return {
+        "codec": codec or "none",
+        "raw_bytes": len(frame),
+        "wire_bytes": len(encoded),
+        "ratio": round(len(encoded) / len(frame), 4),
+        "encode_us": round(encode_us, 2),
+        "decode_us": round(decode_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'peers':>6} {'mensaje':<22} {'codec':<10} {'bytes':>10} {'en red':>10} {'ratio':>6} {'enc µs':>10} {'dec µs':>10}")
+    for n in args.sizes:
+        for name, frame in make_frames(n).items():
+            for codec in CODECS:
+                r = measure(frame, codec)
+                r.update({"peers": n, "message": name})
+                results.append(r)
+                print(f"{n:>6} {name:<22} {r['codec']:<10} {r['raw_bytes']:>10} {r['wire_bytes']:>10} "
+                      f"{r['ratio']:>6.2f} {r['encode_us']:>10.1f} {r['decode_us']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "compression", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
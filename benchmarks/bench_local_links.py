@@ -0,0 +1,184 @@
+"""#### Benchmark: TCP Loopback vs. Socket Unix entre Peers Locales
+
+Compara los dos transportes que usa un peer hacia otro de la misma máquina
+(common/local_link.py), con los mismos frames y el mismo FrameReader:
+
+- Latencia: ida y vuelta de un mensaje de chat (eco), p50 y p99.
+- Throughput: frames de chat en ráfagas (msgs/s) y bloques de 64 KiB como
+  los de una transferencia de archivo (MiB/s).
+- Costo de conexión: connect + close (send_direct y los SYNC de gossip
+  abren una conexión por mensaje).
+
+Uso:
+    python benchmarks/bench_local_links.py [--round-trips 20000] [--messages 200000] [--json salida.json]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.local_link import connect_peer
+from common.protocol import create_message, MSG_CHAT
+from common.stream import FrameReader
+
+BLOCK_SIZE = 64 * 1024
+BURST = 256
+
+
+def open_server(transport: str) -> tuple[socket.socket, tuple]:
+    """Socket de escucha y la dirección que le pasaría el outbox a connect_peer()."""
+    if transport == "tcp":
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        addr = server.getsockname()
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        addr = ('127.0.0.1', 0, path) # El puerto no se usa: connect_peer va directo al socket Unix
+    server.listen(128) # Con poco backlog los SYN descartados agregan reintentos de 1 s a TCP
+    return server, addr
+
+
+def close_server(server: socket.socket):
+    name = server.getsockname()
+    server.close()
+    if isinstance(name, str):
+        os.unlink(name)
+        os.rmdir(os.path.dirname(name))
+
+
+def serve(server: socket.socket, handler, connections: int = 1):
+    def run():
+        for _ in range(connections):
+            conn, _ = server.accept()
+            with conn:
+                handler(conn)
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t
+
+
+def echo(conn: socket.socket):
+    for frame in FrameReader(conn):
+        conn.sendall(bytes(frame) + b'\n')
+
+
+def count_frames(conn: socket.socket, result: list):
+    result.append(sum(1 for _ in FrameReader(conn)))
+
+
+def drain(conn: socket.socket, result: list):
+    total = 0
+    buf = bytearray(BLOCK_SIZE)
+    while n := conn.recv_into(buf):
+        total += n
+    result.append(total)
+
+
+def bench_latency(transport: str, frame: bytes, round_trips: int) -> dict:
+    server, addr = open_server(transport)
+    t = serve(server, echo)
+    samples = []
+    with connect_peer(addr) as s:
+        reader = FrameReader(s)
+        for _ in range(round_trips):
+            start = time.perf_counter()
+            s.sendall(frame)
+            reader.read_frame()
+            samples.append(time.perf_counter() - start)
+        s.shutdown(socket.SHUT_WR)
+    t.join()
+    close_server(server)
+    samples.sort()
+    return {
+        "rtt_p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "rtt_p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+        "rtt_mean_us": round(statistics.fmean(samples) * 1e6, 1),
+    }
+
+
+def bench_throughput(transport: str, frame: bytes, messages: int, blocks: int) -> dict:
+    server, addr = open_server(transport)
+    counted, drained = [], []
+    t = serve(server, lambda conn: count_frames(conn, counted))
+    burst = frame * BURST
+    with connect_peer(addr) as s:
+        start = time.perf_counter()
+        for _ in range(messages // BURST):
+            s.sendall(burst)
+        s.shutdown(socket.SHUT_WR)
+        t.join()
+        msgs_wall = time.perf_counter() - start
+    assert counted == [messages // BURST * BURST], counted
+
+    t = serve(server, lambda conn: drain(conn, drained))
+    block = b"x" * BLOCK_SIZE
+    with connect_peer(addr) as s:
+        start = time.perf_counter()
+        for _ in range(blocks):
+            s.sendall(block)
+        s.shutdown(socket.SHUT_WR)
+        t.join()
+        bulk_wall = time.perf_counter() - start
+    assert drained == [blocks * BLOCK_SIZE], drained
+    close_server(server)
+    return {
+        "msgs_per_s": round(counted[0] / msgs_wall),
+        "bulk_mib_per_s": round(blocks * BLOCK_SIZE / bulk_wall / 2**20),
+    }
+
+
+def bench_connect(transport: str, connections: int) -> dict:
+    server, addr = open_server(transport)
+    t = serve(server, lambda conn: None, connections)
+    samples = []
+    for _ in range(connections):
+        start = time.perf_counter()
+        connect_peer(addr).close()
+        samples.append(time.perf_counter() - start)
+    t.join()
+    close_server(server)
+    return {"connect_p50_us": round(statistics.median(samples) * 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--round-trips", type=int, default=20_000)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--blocks", type=int, default=16_384, help="Bloques de 64 KiB (1 GiB por defecto)")
+    parser.add_argument("--connections", type=int, default=2_000)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    frame = create_message(MSG_CHAT, sender_id="bench@127.0.0.1:10001",
+                           to="peer@127.0.0.1:10002", content="x" * 80,
+                           rel={"epoch": "abcd1234", "seq": 1, "base": 1})
+    results = []
+    for transport in ("tcp", "unix"):
+        result = {"transport": transport}
+        result.update(bench_latency(transport, frame, args.round_trips))
+        result.update(bench_throughput(transport, frame, args.messages, args.blocks))
+        result.update(bench_connect(transport, args.connections))
+        results.append(result)
+
+    print(f"{'transporte':<10} {'RTT p50 µs':>11} {'RTT p99 µs':>11} {'msgs/s':>10} {'MiB/s':>8} {'connect p50 µs':>15}")
+    for r in results:
+        print(f"{r['transport']:<10} {r['rtt_p50_us']:>11} {r['rtt_p99_us']:>11} {r['msgs_per_s']:>10} "
+              f"{r['bulk_mib_per_s']:>8} {r['connect_p50_us']:>15}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "local_links", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""#### Benchmark: Lector de Frames vs. Bucle recv + concatenación
+
+Compara el bucle original (`recv(1024)`, `buffer += data`, `split(b'\\n', 1)`)
+con common.stream.FrameReader sobre un socketpair local:
+
+- Throughput sin límite (mensajes/s).
+- CPU por mensaje a una tasa fija (10k msgs/s por defecto).
+- Pico de memoria asignada durante la lectura (tracemalloc).
+- Memoria residente por conexión con muchas conexiones ociosas abiertas
+  (el servidor tiene un lector por peer registrado): RSS tras leer un
+  heartbeat en cada una, descontando los sockets.
+
+Uso:
+    python benchmarks/bench_stream_reader.py [--messages 200000] [--rate 10000] [--connections 5000] [--json salida.json]
+"""
+
+import argparse
+import gc
+import json
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.protocol import create_message, parse_message, MSG_CHAT, MSG_HEARTBEAT
+from common.stream import FrameReader
+
+
+def legacy_reader(sock: socket.socket, parse: bool) -> int:
+    """El bucle de recepción tal como estaba en handle_p2p_connection."""
+    count = 0
+    buffer = b""
+    while True:
+        data = sock.recv(1024)
+        if not data:
+            break
+        buffer += data
+        while b'\n' in buffer:
+            message_data, buffer = buffer.split(b'\n', 1)
+            if not message_data:
+                continue
+            if parse:
+                parse_message(message_data)
+            count += 1
+    return count
+
+
+def frame_reader(sock: socket.socket, parse: bool) -> int:
+    count = 0
+    for message_data in FrameReader(sock):
+        if parse:
+            parse_message(message_data)
+        count += 1
+    return count
+
+
+READERS = {"legacy": legacy_reader, "frame_reader": frame_reader}
+
+
+def writer(sock: socket.socket, frame: bytes, messages: int, rate: float | None):
+    """Envía `messages` frames; con rate, en ráfagas de 1 ms para sostener la tasa."""
+    if rate is None:
+        burst = frame * 256
+        for _ in range(messages // 256):
+            sock.sendall(burst)
+        sock.sendall(frame * (messages % 256))
+    else:
+        per_tick = max(1, int(rate / 1000))
+        start = time.perf_counter()
+        sent = 0
+        while sent < messages:
+            n = min(per_tick, messages - sent)
+            sock.sendall(frame * n)
+            sent += n
+            delay = start + sent / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    sock.shutdown(socket.SHUT_WR)
+
+
+def rss_bytes() -> int:
+    """Memoria residente actual (Linux: /proc; si no, el pico de getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def rss_per_connection(name: str, connections: int) -> dict:
+    """RSS que agrega el estado de lectura de cada conexión tras un heartbeat."""
+    frame = create_message(MSG_HEARTBEAT, sender_id="bench@127.0.0.1:10001")
+    pairs = [socket.socketpair() for _ in range(connections)]
+    gc.collect()
+    before = rss_bytes()
+    states = []
+    for a, b in pairs:
+        a.sendall(frame)
+        if name == "legacy":
+            # Estado del bucle original entre recv: el resto del buffer
+            message_data, buffer = b.recv(1024).split(b'\n', 1)
+            states.append(buffer)
+        else:
+            reader = FrameReader(b)
+            reader.read_frame()
+            states.append(reader)
+    gc.collect()
+    per_conn = (rss_bytes() - before) / connections
+    for a, b in pairs:
+        a.close()
+        b.close()
+    return {"reader": name, "connections": connections, "rss_kib_per_conn": round(per_conn / 1024, 2)}
+
+
+def run_case(name: str, messages: int, rate: float | None, parse: bool, trace_memory: bool) -> dict:
+    frame = create_message(MSG_CHAT, sender_id="bench@127.0.0.1:10001",
+                           to="peer@127.0.0.1:10002", content="x" * 80,
+                           rel={"epoch": "abcd1234", "seq": 1, "base": 1})
+    a, b = socket.socketpair()
+    t = threading.Thread(target=writer, args=(a, frame, messages, rate), daemon=True)
+
+    if trace_memory:
+        # tracemalloc frena todo: se mide en una corrida aparte, sin tasa fija
+        tracemalloc.start()
+    cpu_start = time.thread_time()
+    wall_start = time.perf_counter()
+    t.start()
+    count = READERS[name](b, parse)
+    wall = time.perf_counter() - wall_start
+    cpu = time.thread_time() - cpu_start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    t.join()
+    a.close()
+    b.close()
+
+    assert count == messages, f"{name}: {count} != {messages}"
+    return {
+        "reader": name,
+        "messages": messages,
+        "rate": rate or "max",
+        "parse": parse,
+        "msgs_per_s": round(messages / wall),
+        "cpu_us_per_msg": round(cpu / messages * 1e6, 3),
+        "peak_kib": round(peak / 1024, 1) if peak is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--rate", type=float, default=10_000, help="Tasa fija en msgs/s para medir CPU")
+    parser.add_argument("--connections", type=int, default=5_000, help="Conexiones ociosas para medir RSS por conexión")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    # Primero, con el proceso aún chico: el RSS no arrastra memoria de las otras corridas
+    memory = [rss_per_connection(name, args.connections) for name in READERS]
+
+    results = []
+    for parse in (False, True):
+        for name in READERS:
+            results.append(run_case(name, args.messages, None, parse, trace_memory=False))
+            results.append(run_case(name, min(args.messages, int(args.rate * 3)), args.rate, parse, trace_memory=False))
+            results.append(run_case(name, min(args.messages, 20_000), None, parse, trace_memory=True))
+
+    print(f"{'lector':<13} {'parse':<6} {'tasa':>7} {'msgs':>8} {'msgs/s':>10} {'CPU µs/msg':>11} {'pico KiB':>9}")
+    for r in results:
+        print(f"{r['reader']:<13} {str(r['parse']):<6} {str(r['rate']):>7} {r['messages']:>8} "
+              f"{r['msgs_per_s']:>10} {r['cpu_us_per_msg']:>11} {str(r['peak_kib'] or '-'):>9}")
+
+    print(f"\n{'lector':<13} {'conexiones':>10} {'RSS KiB/conexión':>17}")
+    for m in memory:
+        print(f"{m['reader']:<13} {m['connections']:>10} {m['rss_kib_per_conn']:>17}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "stream_reader", "results": results, "memory": memory}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""#### Suite de Benchmarks: Servidor de Descubrimiento y Malla de Peers
+
+Para cada tamaño de red levanta un DiscoveryServer (en otro proceso) y un
+enjambre de peers simulados en loopback, y mide:
+
+- registration: tasa de registros y latencia REGISTER -> REGISTER_ACK
+- heartbeats: heartbeats procesados por segundo por el servidor
+- fanout: latencia de PEER_LIST_UPDATE desde que un peer nuevo se registra
+- chat: latencia extremo a extremo de un broadcast desde un PeerNode real
+- gossip: tiempo de convergencia de PeerNodes reales sin servidor
+
+Con --server-workers N el servidor corre en N procesos con SO_REUSEPORT
+(discovery_server/workers.py), para comparar cómo escala con los cores.
+
+La salida en JSON (--json) incluye metadatos (commit, python, host) para
+comparar corridas y detectar regresiones.
+
+Uso:
+    python benchmarks/run_benchmarks.py --sizes 10 100 1000 [--json resultados.json]
+    python benchmarks/run_benchmarks.py --sizes 1000 --phases registration heartbeats --server-workers 4
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.swarm import Swarm, percentiles
+from common.log import ROOT_LOGGER, set_level
+from common.protocol import create_message, MSG_HEARTBEAT
+from discovery_server.discovery_server import DiscoveryServer
+from discovery_server.workers import run_workers
+from peer.peer_node import PeerNode
+
+PHASES = ["registration", "heartbeats", "fanout", "chat", "gossip"]
+HEARTBEAT_LOADERS = 16       # Conexiones que inyectan heartbeats en paralelo
+HEARTBEATS_PER_LOADER = 5000
+GOSSIP_MAX_NODES = 50        # PeerNodes reales (con sus hilos) en la fase de gossip
+GOSSIP_INTERVAL = 0.1
+PHASE_TIMEOUT = 300.0
+QUIET_DRAIN = 1.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _serve(port: int, workers: int):
+    set_level("WARNING") # Como en producción: el log de cada registro no se formatea
+    sys.stdout = open(os.devnull, "w") # Los avisos del servidor no cuentan como resultado
+    if workers > 1:
+        run_workers('127.0.0.1', port, workers)
+    else:
+        DiscoveryServer('127.0.0.1', port).start()
+
+
+def start_server(port: int, workers: int = 1) -> multiprocessing.Process:
+    # Un proceso daemon no puede lanzar los workers; terminate() los detiene igual
+    proc = multiprocessing.Process(target=_serve, args=(port, workers), daemon=workers == 1)
+    proc.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError("El servidor no arrancó")
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silencia el log de PeerNode durante una fase."""
+    level = logging.getLogger(ROOT_LOGGER).level
+    set_level(logging.ERROR)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+            time.sleep(QUIET_DRAIN) # Los hilos de un PeerNode detenido siguen logueando un momento
+    finally:
+        set_level(level)
+
+
+# --- Fases ---
+
+def bench_registration(swarm: Swarm, n: int) -> dict:
+    start = time.perf_counter()
+    peers = swarm.add_peers(n, timeout=PHASE_TIMEOUT)
+    elapsed = time.perf_counter() - start
+    return {
+        "peers": n,
+        "seconds": round(elapsed, 3),
+        "per_second": round(n / elapsed, 1),
+        "latency_ms": percentiles([p.registered_at - p.started_at for p in peers]),
+    }
+
+
+def bench_heartbeats(server_addr: tuple, swarm: Swarm) -> dict:
+    """
+    Varias conexiones (sin REGISTER) envían ráfagas de heartbeats de peers
+    registrados. El servidor cierra cada conexión recién al procesar todo.
+    """
+    ids = [p.peer_id for p in swarm.peers if p.peer_id]
+    blobs = []
+    for i in range(HEARTBEAT_LOADERS):
+        frames = [create_message(MSG_HEARTBEAT, sender_id=ids[(i + j) % len(ids)])
+                  for j in range(HEARTBEATS_PER_LOADER)]
+        blobs.append(b"".join(frames))
+
+    socks = [socket.create_connection(server_addr) for _ in range(HEARTBEAT_LOADERS)]
+    start = time.perf_counter()
+
+    def push(sock, blob):
+        sock.sendall(blob)
+        sock.shutdown(socket.SHUT_WR)
+
+    senders = [threading.Thread(target=push, args=pair) for pair in zip(socks, blobs)]
+    for t in senders:
+        t.start()
+    for sock in socks:
+        while sock.recv(4096):
+            pass
+        sock.close()
+    elapsed = time.perf_counter() - start
+    for t in senders:
+        t.join()
+
+    total = HEARTBEAT_LOADERS * HEARTBEATS_PER_LOADER
+    return {"heartbeats": total, "seconds": round(elapsed, 3), "per_second": round(total / elapsed, 1)}
+
+
+def bench_fanout(swarm: Swarm) -> dict:
+    """Un peer más se registra; el resto debe recibir el PEER_LIST_UPDATE."""
+    expected = sum(1 for p in swarm.peers if p.sock and p.peer_id)
+    before = len(swarm.update_times)
+    start = time.perf_counter()
+    swarm.add_peers(1, timeout=PHASE_TIMEOUT)
+    done = swarm.run_until(lambda: len(swarm.update_times) - before >= expected, PHASE_TIMEOUT)
+    received = swarm.update_times[before:before + expected]
+    return {
+        "recipients": expected,
+        "complete": done,
+        "latency_ms": percentiles([t - start for t in received]),
+    }
+
+
+def bench_chat(server_addr: tuple, swarm: Swarm) -> dict:
+    """Un PeerNode real se registra y hace broadcast; los peers simulados miden la latencia."""
+    expected = sum(1 for p in swarm.peers if p.peer_id)
+    with quiet():
+        sender = PeerNode("bench_sender", free_port(), *server_addr)
+        sender.start()
+        learned = swarm.run_until(
+            lambda: sender.discovery_server_status == "UP" and len(sender.peer_list) > expected,
+            PHASE_TIMEOUT,
+        )
+        before = len(swarm.chat_latencies)
+        sender.broadcast_chat_message(json.dumps({"t": time.time()}))
+        done = swarm.run_until(lambda: len(swarm.chat_latencies) - before >= expected, PHASE_TIMEOUT)
+        sender.stop()
+    return {
+        "recipients": expected,
+        "complete": learned and done,
+        "latency_ms": percentiles(swarm.chat_latencies[before:]),
+    }
+
+
+def bench_gossip(n: int) -> dict:
+    """
+    PeerNodes reales sin servidor, cada uno conociendo solo al siguiente
+    (anillo). Mide cuánto tarda el gossip en que todos conozcan a todos.
+    """
+    count = min(n, GOSSIP_MAX_NODES)
+    dead_server_port = free_port() # Nadie escucha: modo P2P puro
+    with quiet():
+        nodes = [PeerNode(f"g{i}", free_port(), '127.0.0.1', dead_server_port) for i in range(count)]
+        infos = [{"ip": "127.0.0.1", "port": node.listening_port, "username": node.username} for node in nodes]
+        for i, node in enumerate(nodes):
+            node.gossip_interval = GOSSIP_INTERVAL
+            nxt = (i + 1) % count
+            node.merge_peer_lists({node.peer_id: infos[i], nodes[nxt].peer_id: infos[nxt]})
+        start = time.perf_counter()
+        for node in nodes:
+            node.start()
+
+        converged = False
+        deadline = start + PHASE_TIMEOUT
+        while time.perf_counter() < deadline:
+            if all(len(node.peer_list) >= count for node in nodes):
+                converged = True
+                break
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        for node in nodes:
+            node.stop()
+    return {
+        "nodes": count,
+        "gossip_interval_s": GOSSIP_INTERVAL,
+        "converged": converged,
+        "seconds": round(elapsed, 3),
+        "rounds": round(elapsed / GOSSIP_INTERVAL, 1),
+    }
+
+
+def run_size(n: int, phases: list[str], server_workers: int = 1) -> dict:
+    port = free_port()
+    server = start_server(port, server_workers)
+    server_addr = ('127.0.0.1', port)
+    swarm = Swarm(server_addr)
+    result = {"size": n}
+    try:
+        # El registro siempre corre: las demás fases necesitan la red armada
+        result["registration"] = bench_registration(swarm, n)
+        if "heartbeats" in phases:
+            result["heartbeats"] = bench_heartbeats(server_addr, swarm)
+        if "fanout" in phases:
+            result["fanout"] = bench_fanout(swarm)
+        if "chat" in phases:
+            result["chat"] = bench_chat(server_addr, swarm)
+    finally:
+        swarm.close()
+        server.terminate()
+        server.join()
+    if "gossip" in phases:
+        result["gossip"] = bench_gossip(n)
+    return result
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=PHASES)
+    parser.add_argument("--server-workers", type=int, default=1,
+                        help="Procesos del servidor con SO_REUSEPORT (1 = un solo proceso)")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    # Miles de sockets: subir el límite blando de descriptores al máximo permitido
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    report = {"benchmark": "mesh", "meta": metadata() | {"server_workers": args.server_workers}, "results": []}
+    for n in args.sizes:
+        print(f"--- {n} peers ---", flush=True)
+        result = run_size(n, args.phases, args.server_workers)
+        report["results"].append(result)
+        for phase in PHASES:
+            if phase in result:
+                print(f"{phase:<13} {json.dumps(result[phase])}", flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""#### Enjambre de Peers Simulados
+
+Peers livianos que hablan el protocolo real (REGISTER, HEARTBEAT,
+PEER_LIST_UPDATE, CHAT/BATCH) pero sin UI ni hilos propios: todos los
+sockets de un enjambre se atienden desde un único loop con selectors.
+
+Para no agotar descriptores con miles de peers, los peers simulados
+comparten un pool de sockets de escucha (el ID del servidor incluye el
+username, así que varios peers pueden anunciar el mismo puerto); el
+destinatario real de cada CHAT se obtiene del campo "to".
+"""
+
+import json
+import os
+import selectors
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.protocol import (
+    create_message, parse_message,
+    MSG_REGISTER, MSG_HEARTBEAT, MSG_CHAT, MSG_BATCH
+)
+from common.stream import FrameReader
+
+LISTENER_POOL_SIZE = 32
+REGISTER_IN_FLIGHT = 64 # Registros simultáneos (no saturar el backlog del servidor)
+HEARTBEAT_EVERY = 5.0   # Mantener vivos a los peers durante corridas largas
+
+
+def percentiles(values: list[float], points=(50, 90, 99)) -> dict:
+    """Percentiles (en ms) de una lista de segundos."""
+    if not values:
+        return {f"p{p}": None for p in points} | {"max": None, "count": 0}
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        result[f"p{p}"] = round(ordered[index] * 1000, 3)
+    result["max"] = round(ordered[-1] * 1000, 3)
+    result["count"] = len(ordered)
+    return result
+
+
+class SimPeer:
+    __slots__ = ("index", "username", "sock", "reader", "peer_id", "started_at", "registered_at", "port")
+
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.username = f"sim{index}"
+        self.port = port
+        self.sock = None
+        self.reader = None
+        self.peer_id = None
+        self.started_at = None
+        self.registered_at = None
+
+
+class Swarm:
+    def __init__(self, server_addr: tuple[str, int], listeners: int = LISTENER_POOL_SIZE):
+        self.server_addr = server_addr
+        self.selector = selectors.DefaultSelector()
+        self.peers = []
+        self.by_id = {}
+        self.registered_count = 0
+
+        # Eventos observados (time.perf_counter al recibir)
+        self.update_times = []   # PEER_LIST_UPDATE recibidos
+        self.chat_latencies = [] # Latencia extremo a extremo de cada CHAT recibido
+        self.chat_received = set()
+        self.p2p_conns = []
+        self.last_heartbeat = time.perf_counter()
+
+        self.listeners = []
+        for _ in range(listeners):
+            ls = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            ls.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            ls.bind(('127.0.0.1', 0))
+            ls.listen(512)
+            ls.setblocking(False)
+            self.listeners.append(ls)
+            self.selector.register(ls, selectors.EVENT_READ, ("accept", None))
+
+    # --- Loop de Eventos ---
+
+    def poll(self, timeout: float = 0.05):
+        if time.perf_counter() - self.last_heartbeat > HEARTBEAT_EVERY:
+            self.heartbeat_all()
+        for key, _ in self.selector.select(timeout):
+            kind, owner = key.data
+            if kind == "accept":
+                try:
+                    conn, _ = key.fileobj.accept()
+                except BlockingIOError:
+                    continue
+                conn.setblocking(True)
+                self.p2p_conns.append(conn)
+                self.selector.register(conn, selectors.EVENT_READ, ("p2p", FrameReader(conn)))
+            elif kind == "discovery":
+                self._read_discovery(owner)
+            elif kind == "p2p":
+                self._read_p2p(key.fileobj, owner)
+
+    def run_until(self, predicate, timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        while not predicate():
+            if time.perf_counter() > deadline:
+                return False
+            self.poll()
+        return True
+
+    def _read_discovery(self, peer: SimPeer):
+        try:
+            if not peer.reader.fill():
+                self._close_peer(peer)
+                return
+        except OSError:
+            self._close_peer(peer)
+            return
+        now = time.perf_counter()
+        while (frame := peer.reader.next_frame()) is not None:
+            # Clasificar por el prefijo sin parsear listas enormes
+            head = bytes(frame[:40])
+            if peer.registered_at is None and b'"REGISTER_ACK"' in head:
+                msg = parse_message(frame)
+                peer.peer_id = msg['content']['peer_id']
+                peer.registered_at = now
+                self.by_id[peer.peer_id] = peer
+                self.registered_count += 1
+            elif b'"PEER_LIST_UPDATE"' in head:
+                self.update_times.append(now)
+
+    def _read_p2p(self, conn: socket.socket, reader: FrameReader):
+        try:
+            if not reader.fill():
+                self.selector.unregister(conn)
+                conn.close()
+                return
+        except OSError:
+            self.selector.unregister(conn)
+            conn.close()
+            return
+        now = time.time()
+        while (frame := reader.next_frame()) is not None:
+            msg = parse_message(frame)
+            if not msg:
+                continue
+            inner = msg['content'] if msg['type'] == MSG_BATCH else [msg]
+            for m in inner:
+                if m['type'] != MSG_CHAT:
+                    continue
+                key = (m['to'], m['content'])
+                if key in self.chat_received:
+                    continue # Retransmisión: los peers simulados no mandan ACK
+                self.chat_received.add(key)
+                sent_at = json.loads(m['content'])['t']
+                self.chat_latencies.append(now - sent_at)
+
+    def _close_peer(self, peer: SimPeer):
+        if peer.sock:
+            try:
+                self.selector.unregister(peer.sock)
+            except (KeyError, ValueError):
+                pass
+            peer.sock.close()
+            peer.sock = None
+
+    # --- Acciones ---
+
+    def add_peers(self, n: int, timeout: float = 300.0) -> list[SimPeer]:
+        """Registra n peers nuevos (con a lo sumo REGISTER_IN_FLIGHT a la vez)."""
+        new_peers = []
+        for _ in range(n):
+            index = len(self.peers)
+            port = self.listeners[index % len(self.listeners)].getsockname()[1]
+            peer = SimPeer(index, port)
+            self.peers.append(peer)
+            new_peers.append(peer)
+
+        target = self.registered_count + n
+        started = self.registered_count
+        next_index = 0
+        deadline = time.perf_counter() + timeout
+        while self.registered_count < target:
+            while next_index < n and started - self.registered_count < REGISTER_IN_FLIGHT:
+                self._start_register(new_peers[next_index])
+                next_index += 1
+                started += 1
+            self.poll(0.01)
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Registro incompleto tras {timeout}s")
+        return new_peers
+
+    def _start_register(self, peer: SimPeer):
+        peer.started_at = time.perf_counter()
+        peer.sock = socket.create_connection(self.server_addr)
+        peer.reader = FrameReader(peer.sock)
+        # Sin "compression": así las respuestas se pueden clasificar por prefijo
+        peer.sock.sendall(create_message(
+            MSG_REGISTER, sender_id=peer.username,
+            content={"port": peer.port, "username": peer.username}
+        ))
+        self.selector.register(peer.sock, selectors.EVENT_READ, ("discovery", peer))
+
+    def heartbeat_all(self):
+        self.last_heartbeat = time.perf_counter()
+        for peer in self.peers:
+            if peer.sock and peer.peer_id:
+                try:
+                    peer.sock.sendall(create_message(MSG_HEARTBEAT, sender_id=peer.peer_id))
+                except OSError:
+                    self._close_peer(peer)
+
+    def close(self):
+        for peer in self.peers:
+            self._close_peer(peer)
+        for conn in self.p2p_conns:
+            conn.close()
+        for ls in self.listeners:
+            ls.close()
+        self.selector.close()
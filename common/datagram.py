@@ -0,0 +1,125 @@
+"""Canal UDP para Mensajes Chicos y Periódicos
+
+Heartbeats, pings y digests de gossip son mensajes de unos cientos de bytes
+que se mandan cada pocos segundos. Por TCP cada probe de gossip abría una
+conexión (handshake, un hilo en el otro peer, cierre); por UDP es un solo
+datagrama de ida y otro de vuelta.
+
+- Cada mensaje es un frame de create_message() en un datagrama, de a lo
+  sumo MAX_DATAGRAM bytes (por debajo del MTU de Ethernet, sin fragmentar).
+  Lo que no entra va por TCP.
+- Las pérdidas se toleran por diseño: un heartbeat perdido lo cubre el
+  siguiente (el timeout del servidor es de varios intervalos) y un probe
+  sin respuesta se reintenta y, si no, se resuelve por TCP.
+- request() empareja respuestas por "nonce" (pregunta) y "re" (respuesta).
+"""
+
+import itertools
+import socket
+import threading
+
+from common.protocol import parse_message
+from common.log import get_logger
+
+log = get_logger("datagram")
+
+MAX_DATAGRAM = 1200 # Bytes: entra en el MTU mínimo de IPv6 (1280) con sus encabezados
+PROBE_TIMEOUT = 0.5 # Segundos de espera por respuesta antes de reintentar
+PROBE_RETRIES = 2   # Reintentos antes de dar la respuesta por perdida
+RECV_TIMEOUT = 1.0  # close() no despierta a recvfrom: el hilo revisa self.running
+
+
+class DatagramTooLargeError(ValueError):
+    """El frame no entra en un datagrama: enviarlo por TCP."""
+
+
+class DatagramChannel:
+    def __init__(self, host: str, port: int, handler, thread: bool = True):
+        """
+        handler(msg, addr, channel) recibe cada mensaje que no es respuesta a
+        un request() propio. port=0 elige un puerto libre (ver self.port).
+        thread=False: sin hilo de recepción; quien vigila el socket (ej. el
+        PeerHost) llama a receive_ready() cuando hay datos.
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(RECV_TIMEOUT)
+        self.port = self.sock.getsockname()[1]
+        self.handler = handler
+        self.running = True
+        self._nonces = itertools.count(1)
+        self._pending = {} # { nonce: [threading.Event, respuesta | None] }
+        self._pending_lock = threading.Lock()
+        if thread:
+            threading.Thread(target=self._receive_loop, daemon=True).start()
+
+    def send(self, addr: tuple[str, int], frame: bytes):
+        if len(frame) > MAX_DATAGRAM:
+            raise DatagramTooLargeError(f"{len(frame)} bytes > {MAX_DATAGRAM}")
+        try:
+            self.sock.sendto(frame, addr)
+        except OSError as e:
+            # Sin conexión no hay error que reportar: es como un datagrama perdido
+            log.debug("[UDP] No se pudo enviar a %s: %s", addr, e)
+
+    def request(self, addr: tuple[str, int], build_frame, timeout: float = PROBE_TIMEOUT,
+                retries: int = PROBE_RETRIES) -> dict | None:
+        """
+        Envía build_frame(nonce) y espera el mensaje con "re" == nonce.
+        Reintenta `retries` veces; devuelve None si no hubo respuesta.
+        """
+        nonce = next(self._nonces)
+        waiter = [threading.Event(), None]
+        with self._pending_lock:
+            self._pending[nonce] = waiter
+        try:
+            frame = build_frame(nonce)
+            for _ in range(retries + 1):
+                self.send(addr, frame)
+                if waiter[0].wait(timeout):
+                    return waiter[1]
+            return None
+        finally:
+            with self._pending_lock:
+                self._pending.pop(nonce, None)
+
+    def _receive_loop(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM + 1)
+            except socket.timeout:
+                continue
+            except OSError:
+                break # Socket cerrado
+            self._process(data, addr)
+
+    def receive_ready(self):
+        """Lee y procesa un datagrama (el socket ya está listo para leer)."""
+        try:
+            data, addr = self.sock.recvfrom(MAX_DATAGRAM + 1)
+        except OSError:
+            return # Incluye socket.timeout: nada que leer
+        self._process(data, addr)
+
+    def _process(self, data: bytes, addr: tuple):
+        if len(data) > MAX_DATAGRAM:
+            return
+        msg = parse_message(data)
+        if not msg:
+            return
+        reply_to = msg.get("re")
+        if reply_to is not None:
+            with self._pending_lock:
+                waiter = self._pending.get(reply_to)
+            if waiter:
+                waiter[1] = msg
+                waiter[0].set()
+            return
+        try:
+            self.handler(msg, addr, self)
+        except Exception as e:
+            log.warning("[UDP] Error procesando %s de %s: %s", msg.get("type"), addr, e)
+
+    def close(self):
+        self.running = False
+        self.sock.close()
@@ -0,0 +1,140 @@
+"""Enlaces Locales por Unix Domain Sockets
+
+Varios peers en la misma máquina (el caso típico de web_chat.py: una sesión
+por usuario, puertos 10000-11000) se hablaban por TCP sobre loopback: cada
+frame pasa por la pila TCP/IP completa (checksums, ventanas, ACKs, Nagle)
+aunque nunca salga del kernel. Un AF_UNIX SOCK_STREAM tiene la misma
+semántica de flujo, así que FrameReader, el outbox y los handlers no cambian.
+
+- Cada peer abre, además del puerto TCP, un socket en uds_path(puerto) y lo
+  anuncia en el REGISTER (y en su entrada de la lista) como "host_id" y "uds".
+- Para conectarse a otro peer con el mismo HOST_ID se usa su socket Unix;
+  si no se puede (otro contenedor, archivo viejo), connect_peer() cae a TCP.
+  La ruta siempre es uds_path(puerto) calculada localmente, nunca la anunciada.
+- HOST_ID combina machine-id y hostname: contenedores de una misma imagen
+  comparten machine-id pero no hostname ni /tmp.
+"""
+
+import errno
+import hashlib
+import os
+import socket
+import tempfile
+
+from common.log import get_logger
+
+log = get_logger("local_link")
+
+SUPPORTED = hasattr(socket, "AF_UNIX")
+LINK_FIELDS = ("host_id", "uds") # Campos que el servidor copia a la entrada del peer
+MACHINE_ID_FILES = ("/etc/machine-id", "/var/lib/dbus/machine-id")
+SOCKET_DIR = tempfile.gettempdir()
+
+
+def _host_id() -> str:
+    machine_id = ""
+    for path in MACHINE_ID_FILES:
+        try:
+            with open(path) as f:
+                machine_id = f.read().strip()
+        except OSError:
+            continue
+        if machine_id:
+            break
+    seed = f"{machine_id}/{socket.gethostname()}"
+    return hashlib.sha1(seed.encode()).hexdigest()[:16]
+
+
+HOST_ID = _host_id()
+
+
+def uds_path(port: int) -> str:
+    return os.path.join(SOCKET_DIR, f"p2p-chat-{port}.sock")
+
+
+def _in_use(path: str) -> bool:
+    """True si un proceso vivo escucha en path (si no, es un archivo viejo)."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def open_listener(port: int, backlog: int) -> socket.socket | None:
+    """
+    Socket Unix de escucha para el peer del puerto `port`, o None si no se
+    puede (sin AF_UNIX, o lo usa otro proceso vivo).
+    """
+    if not SUPPORTED:
+        return None
+    path = uds_path(port)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.bind(path)
+        except OSError as e:
+            # Un proceso que terminó sin stop() deja el archivo: se reemplaza
+            if e.errno != errno.EADDRINUSE or _in_use(path):
+                raise
+            os.unlink(path)
+            sock.bind(path)
+        sock.listen(backlog)
+    except OSError as e:
+        log.warning("[Local] No se pudo abrir %s: %s. Usando solo TCP.", path, e)
+        sock.close()
+        return None
+    return sock
+
+
+def close_listener(sock: socket.socket, port: int):
+    """
+    Cierra el socket de escucha del puerto `port` y borra su archivo. Se
+    puede llamar de nuevo con el socket ya cerrado (segundo stop()): no hace
+    nada, y en particular no borra el archivo de otro peer que reusó la ruta.
+    """
+    if sock.fileno() == -1:
+        return
+    sock.close()
+    try:
+        os.unlink(uds_path(port))
+    except OSError:
+        pass
+
+
+def link_info(sock: socket.socket | None) -> dict:
+    """Campos a anunciar en el REGISTER para un socket de open_listener()."""
+    return {"host_id": HOST_ID, "uds": sock.getsockname()} if sock else {}
+
+
+def peer_address(info: dict, local_info: dict) -> tuple:
+    """
+    (ip, port) del peer, o (ip, port, uds) si está en la misma máquina que
+    quien pregunta (local_info: su propio link_info()).
+
+    La ruta se arma acá con uds_path(port), no se toma la anunciada: un peer
+    que copie nuestro host_id podría apuntarnos a cualquier socket Unix de la
+    máquina. Si la anunciada no es la esperada (otro SOCKET_DIR), se usa TCP.
+    """
+    if local_info and info.get('host_id') == local_info['host_id']:
+        path = uds_path(info['port'])
+        if info.get('uds') == path:
+            return (info['ip'], info['port'], path)
+    return (info['ip'], info['port'])
+
+
+def connect_peer(addr: tuple, timeout: float | None = None) -> socket.socket:
+    """Conecta a una dirección de peer_address(): por el socket Unix si hay, si no TCP."""
+    if len(addr) == 3:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(addr[2])
+            return sock
+        except OSError as e:
+            sock.close()
+            log.debug("[Local] %s no disponible (%s), usando TCP", addr[2], e)
+    return socket.create_connection(addr[:2], timeout=timeout)
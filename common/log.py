@@ -0,0 +1,195 @@
+"""Logging del Servidor y los Peers
+
+Antes cada evento era un print: escritura sincrónica en stdout desde el
+hilo que atendía la conexión, a veces con un lock tomado. Ahora todos los
+módulos piden su logger con get_logger() y comparten una sola tubería:
+
+- El hilo que loguea solo filtra por nivel, aplica el límite de repetición
+  y encola el LogRecord sin formatear (los argumentos se formatean después).
+- Un QueueListener en un hilo de fondo formatea y escribe en stdout.
+- Un mismo mensaje (logger + plantilla) se emite a lo sumo RATE_LIMIT
+  veces por RATE_WINDOW segundos; al abrirse la ventana siguiente se avisa
+  cuántos se suprimieron.
+
+Para que el filtro por nivel y el límite funcionen, los mensajes usan
+argumentos diferidos (log.debug("[Tag] ... %s", valor)), no f-strings.
+
+Configuración por variables de entorno:
+    P2P_LOG_LEVEL   DEBUG | INFO (por defecto) | WARNING | ERROR
+    P2P_LOG_FORMAT  text (por defecto) | json (una línea JSON por evento)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+ROOT_LOGGER = "p2p"
+DEFAULT_LEVEL = "INFO"
+RATE_LIMIT = 20 # Emisiones del mismo mensaje por ventana
+RATE_WINDOW = 10.0 # Segundos
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+_handler = None # _DeferredQueueHandler del logger raíz
+_output = None  # Handler que escribe, usado por el listener
+
+
+class RateLimitFilter(logging.Filter):
+    """Deja pasar hasta `limit` registros por (logger, plantilla) cada `window` segundos."""
+
+    def __init__(self, limit: int = RATE_LIMIT, window: float = RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.buckets = {} # { (logger, plantilla): [inicio de ventana, emitidos, suprimidos] }
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = [now, 1, 0]
+                return True
+            if now - bucket[0] >= self.window:
+                suppressed = bucket[2]
+                bucket[0], bucket[1], bucket[2] = now, 1, 0
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if bucket[1] < self.limit:
+                bucket[1] += 1
+                return True
+            bucket[2] += 1
+            return False
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que loguea: el estándar llama a
+    self.format() en prepare(). Los argumentos viajan tal cual al listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Escribe en el sys.stdout vigente al emitir (respeta redirect_stdout)."""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (+{suppressed} similares suprimidos)"
+        return text
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _configure():
+    global _configured, _listener, _handler, _output
+    with _configure_lock:
+        if _configured:
+            return
+        output = _output = _StdoutHandler()
+        if os.environ.get("P2P_LOG_FORMAT", "text").lower() == "json":
+            output.setFormatter(_JsonFormatter())
+        else:
+            output.setFormatter(_TextFormatter("%(asctime)s %(levelname)-7s %(message)s"))
+
+        log_queue = queue.SimpleQueue()
+        handler = _handler = _DeferredQueueHandler(log_queue)
+        handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.addHandler(handler)
+        root.propagate = False
+        _apply_level(os.environ.get("P2P_LOG_LEVEL", DEFAULT_LEVEL))
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(_stop_listener) # Vacía la cola antes de salir
+        _configured = True
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _after_fork_in_child():
+    """
+    Un proceso hijo creado con fork (ej. los workers del servidor) hereda la
+    cola pero no el hilo del listener: sin esto sus logs nunca se escriben.
+    """
+    global _configure_lock, _listener
+    _configure_lock = threading.Lock()
+    if not _configured:
+        return
+    for log_filter in _handler.filters:
+        log_filter.lock = threading.Lock() # Pudo quedar tomado por otro hilo del padre
+    log_queue = queue.SimpleQueue()
+    _handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, _output)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger "p2p.<name>" conectado a la tubería compartida."""
+    _configure()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def set_level(level):
+    """Cambia el nivel de todos los loggers del proyecto (ej. "WARNING" en benchmarks)."""
+    _configure() # Si no, la configuración inicial pisaría este nivel con P2P_LOG_LEVEL
+    _apply_level(level)
+
+
+def _apply_level(level):
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+    logging.getLogger(ROOT_LOGGER).setLevel(level)
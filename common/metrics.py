@@ -0,0 +1,269 @@
+"""Registro de Métricas
+
+Contadores, gauges e histogramas de bajo costo para el servidor y los
+peers. Cada DiscoveryServer/PeerNode tiene su propio registro (en un mismo
+proceso puede haber varios peers, ej. en el simulador).
+
+- Counter: total acumulado y tasa por segundo (ventana de RATE_WINDOW).
+- Gauge: valor puntual, fijado a mano o leído de una función al consultar.
+- Histogram: buckets geométricos fijos (x2 desde 1 µs); observar es un
+  bisect y una suma, sin guardar muestras.
+
+Se exponen con el mensaje MSG_STATS_REQUEST/RESPONSE del protocolo y,
+opcionalmente, por HTTP local en texto (/metrics) o JSON (/metrics.json).
+"""
+
+import json
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common.protocol import create_message, parse_message, MSG_STATS_REQUEST, MSG_STATS_RESPONSE
+from common.stream import FrameReader
+from common.log import get_logger
+
+log = get_logger("metrics")
+
+RATE_WINDOW = 10.0 # Segundos sobre los que se calcula la tasa de un contador
+HISTOGRAM_BOUNDS = [1e-6 * 2 ** i for i in range(28)] # 1 µs ... ~134 s
+PERCENTILES = (50, 90, 99)
+
+
+class Counter:
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_value = 0
+        self._rate = 0.0
+        self._full_window = False
+
+    def inc(self, n: int = 1):
+        with self._lock:
+            self.value += n
+
+    def rate(self) -> float:
+        """
+        Eventos por segundo en la última ventana cerrada (o en la actual,
+        si todavía no se cerró ninguna). La ventana se cierra al consultar.
+        """
+        now = time.monotonic()
+        with self._lock:
+            elapsed = now - self._window_start
+            if elapsed >= RATE_WINDOW:
+                self._rate = (self.value - self._window_value) / elapsed
+                self._window_start, self._window_value = now, self.value
+                self._full_window = True
+            elif not self._full_window and elapsed > 0:
+                self._rate = self.value / elapsed
+            return self._rate
+
+    def snapshot(self) -> dict:
+        return {"value": self.value, "rate": round(self.rate(), 3)}
+
+
+class Gauge:
+    def __init__(self, name: str, help: str = "", fn=None):
+        self.name = name
+        self.help = help
+        self.fn = fn # Si está, el valor se lee al consultar (ej. tamaño de una cola)
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+    def dec(self, n: float = 1):
+        self.value -= n
+
+    def snapshot(self) -> float:
+        return self.fn() if self.fn else self.value
+
+
+class Histogram:
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1) # El último: > HISTOGRAM_BOUNDS[-1]
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(HISTOGRAM_BOUNDS, value)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    @contextmanager
+    def time(self):
+        """Observa la duración del bloque en segundos."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def percentile(self, p: float) -> float | None:
+        """Cota superior del bucket que contiene el percentil p (acotada por el máximo)."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = self.count * p / 100
+            seen = 0
+            for index, n in enumerate(self.buckets):
+                seen += n
+                if seen >= target and n:
+                    bound = HISTOGRAM_BOUNDS[index] if index < len(HISTOGRAM_BOUNDS) else self.max
+                    return min(bound, self.max)
+            return self.max
+
+    def snapshot(self) -> dict:
+        result = {"count": self.count, "sum": round(self.sum, 6), "max": round(self.max, 6)}
+        for p in PERCENTILES:
+            value = self.percentile(p)
+            result[f"p{p}"] = round(value, 6) if value is not None else None
+        return result
+
+
+class TimedLock:
+    """Lock que registra en un histograma cuánto se esperó para adquirirlo."""
+
+    def __init__(self, lock, wait_histogram: Histogram):
+        self.lock = lock
+        self.wait_histogram = wait_histogram
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        self.wait_histogram.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {} # { nombre: Counter | Gauge | Histogram }
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def _get(self, cls, name: str, help: str, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise TypeError(f"La métrica {name} ya existe como {type(metric).__name__}")
+            return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "", fn=None) -> Gauge:
+        return self._get(Gauge, name, help, fn=fn)
+
+    def histogram(self, name: str, help: str = "") -> Histogram:
+        return self._get(Histogram, name, help)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        result = {"uptime_s": round(time.time() - self.started, 1), "counters": {}, "gauges": {}, "histograms": {}}
+        for metric in metrics:
+            if isinstance(metric, Counter):
+                result["counters"][metric.name] = metric.snapshot()
+            elif isinstance(metric, Gauge):
+                result["gauges"][metric.name] = metric.snapshot()
+            else:
+                result["histograms"][metric.name] = metric.snapshot()
+        return result
+
+    def render_text(self) -> str:
+        """Formato de texto compatible con Prometheus."""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {metric.name} counter")
+                lines.append(f"{metric.name} {metric.value}")
+            elif isinstance(metric, Gauge):
+                lines.append(f"# TYPE {metric.name} gauge")
+                lines.append(f"{metric.name} {metric.snapshot()}")
+            else:
+                lines.append(f"# TYPE {metric.name} histogram")
+                cumulative = 0
+                for bound, n in zip(HISTOGRAM_BOUNDS, metric.buckets):
+                    cumulative += n
+                    lines.append(f'{metric.name}_bucket{{le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric.name}_bucket{{le="+Inf"}} {metric.count}')
+                lines.append(f"{metric.name}_sum {metric.sum}")
+                lines.append(f"{metric.name}_count {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+# --- Exposición ---
+
+def serve_http(registry: MetricsRegistry, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Endpoint HTTP local (en un hilo): /metrics en texto, /metrics.json en JSON."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, ctype = registry.render_text().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, ctype = json.dumps(registry.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Sin una línea por request en la consola
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    log.info("[Metrics] Endpoint HTTP en http://%s:%s/metrics", host, port)
+    return httpd
+
+
+def stats_response(registry: MetricsRegistry, sender_id: str, to: str | None = None) -> bytes:
+    """MSG_STATS_RESPONSE con el snapshot del registro."""
+    return create_message(MSG_STATS_RESPONSE, sender_id=sender_id, to=to, content=registry.snapshot())
+
+
+def request_stats(ip: str, port: int, timeout: float = 5.0) -> dict | None:
+    """Pide las métricas a un servidor o peer (MSG_STATS_REQUEST) y devuelve el snapshot."""
+    with socket.create_connection((ip, port), timeout=timeout) as s:
+        s.sendall(create_message(MSG_STATS_REQUEST, sender_id=None))
+        frame = FrameReader(s).read_frame()
+    msg = parse_message(frame) if frame is not None else None
+    if msg and msg['type'] == MSG_STATS_RESPONSE:
+        return msg['content']
+    return None
@@ -5,29 +5,112 @@ Este módulo define los tipos de mensaje y utilidades para crear/parsear
 mensajes JSON terminados en newline usados por el sistema P2P.
 """
 
+import base64
 import json
+import zlib
+
+from common.log import get_logger
+
+log = get_logger("protocol")
 
 # --- Tipos de Mensajes ---
 MSG_REGISTER = "REGISTER"        # Peer -> Servidor: Registrarse
 MSG_REGISTER_ACK = "REGISTER_ACK"  # Servidor -> Peer: OK, aquí está tu ID y la lista
 MSG_UNREGISTER = "UNREGISTER"      # Peer -> Servidor: Me voy
-MSG_GET_PEERS = "GET_PEERS"        # (Opcional) Peer -> Servidor: Dame la lista
+MSG_GET_PEERS = "GET_PEERS"        # Peer -> Servidor: Una página de la lista ("username", "ip", "prefix", "after", "limit") o un peer ("peer_id")
+MSG_GET_PEERS_RESPONSE = "GET_PEERS_RESPONSE" # Servidor -> Peer: {"peers": {...}, "next": cursor | None, "total": int}
 MSG_PEER_LIST_UPDATE = "PEER_LIST_UPDATE" # Servidor -> Peer: Alguien se unió/fue
 
 MSG_CHAT = "CHAT"                # Peer -> Peer: Mensaje de chat
 MSG_HEARTBEAT = "HEARTBEAT"      # Peer -> Servidor: Sigo vivo
-MSG_ACK = "ACK"                  # (Opcional) Peer -> Peer: Recibí tu mensaje
+MSG_BATCH = "BATCH"              # Peer -> Peer: Varios mensajes coalescidos ("content": [msg, ...])
+MSG_ACK = "ACK"                  # Peer -> Peer: ACK acumulativo/selectivo de mensajes de chat
+
+# --- Campos Opcionales para Entrega Confiable ---
+# "rel": {"epoch": str, "seq": int, "base": int}
+#        -> Número de secuencia del enlace emisor->receptor (base: seq más
+#           bajo aún pendiente en el emisor)
+# "ack": {"epoch": str, "cum": int, "sack": [int]}
+#        -> Todo seq <= cum recibido, más los seq sueltos de "sack".
+#           Viaja "a caballito" en un CHAT o solo dentro de un MSG_ACK.
+# "trace": {"id": str, "created": float, "queued": float, ...}
+#        -> Solo en mensajes muestreados: ID de traza e instantes de cada
+#           etapa (ver common/tracing.py).
 
 # --- Mensajes para Tolerancia a Fallos (Gossip) ---
 # Cuando un peer detecta que el servidor está caído:
 MSG_SYNC_PEERS_REQUEST = "SYNC_PEERS_REQUEST" # Peer A -> Peer B: ¿A quién conoces?
 MSG_SYNC_PEERS_RESPONSE = "SYNC_PEERS_RESPONSE" # Peer B -> Peer A: A esta gente
 
+# --- Membresía con Vista Parcial (peer/partial_view.py) ---
+# Solo entre peers con partial_view=True; content["from"] = info del emisor.
+MSG_JOIN = "JOIN"                     # Peer nuevo -> Contacto: Quiero entrar al overlay
+MSG_FORWARD_JOIN = "FORWARD_JOIN"     # Peer -> Vecino: Random walk del nuevo ("peer", "ttl")
+MSG_NEIGHBOR = "NEIGHBOR"             # Peer -> Peer: ¿Me aceptas como vecino activo? ("high": bool)
+MSG_NEIGHBOR_REPLY = "NEIGHBOR_REPLY" # Peer -> Peer: "accepted": bool
+MSG_DISCONNECT = "DISCONNECT"         # Peer -> Vecino: Te saco de mi vista activa
+MSG_SHUFFLE = "SHUFFLE"               # Peer -> Vecino: Muestra de mis vistas ("origin", "peers", "ttl")
+MSG_SHUFFLE_REPLY = "SHUFFLE_REPLY"   # Peer -> Origen: Muestra de mi vista pasiva ("peers")
+MSG_FLOOD = "FLOOD"                   # Peer -> Vecinos: Broadcast por el overlay ("content": msg, "id": str)
+
+# --- Mensajes por UDP (common/datagram.py) ---
+# Un datagrama por mensaje, a lo sumo MAX_DATAGRAM bytes. MSG_HEARTBEAT
+# también puede viajar por UDP si el REGISTER_ACK anunció "udp_port".
+MSG_PING = "PING"                # Peer A -> Peer B: ¿Vivo? + digest de mi lista ("nonce": int)
+MSG_PONG = "PONG"                # Peer B -> Peer A: Vivo + digest de mi lista ("re": nonce)
+# Digest: {"n": cantidad de peers, "h": hash de los IDs}. Si coincide con
+# el propio, las listas son iguales y no hace falta el SYNC por TCP.
+
+# --- Mensajes para Transferencia de Archivos ---
+MSG_FILE_OFFER = "FILE_OFFER"    # Peer -> Peer: Comparto este archivo (metadatos + hashes)
+MSG_FILE_HAVE = "FILE_HAVE"      # Peer -> Peer: Yo también tengo este archivo (otra fuente)
+MSG_FILE_GET = "FILE_GET"        # Peer -> Peer: Mándame [offset, offset+length) del archivo
+MSG_FILE_DATA = "FILE_DATA"      # Peer -> Peer: Header; le siguen "length" bytes crudos
+
+# --- Métricas ---
+MSG_STATS_REQUEST = "STATS_REQUEST"   # Cliente -> Servidor/Peer: Dame tus métricas
+MSG_STATS_RESPONSE = "STATS_RESPONSE" # Servidor/Peer -> Cliente: Snapshot del registro de métricas
+
+# --- Compresión Negociada ---
+# Los frames comprimidos siguen siendo una línea: prefijo de 1 byte (que nunca
+# inicia un JSON) + base64 del deflate. Así el framing por '\n' no cambia.
+CODEC_ZLIB = "zlib"            # Deflate simple
+CODEC_ZLIB_DICT = "zlib-dict"  # Deflate con diccionario predefinido de membresía
+SUPPORTED_CODECS = [CODEC_ZLIB_DICT, CODEC_ZLIB] # En orden de preferencia
+COMPRESSION_THRESHOLD = 1024   # Frames más chicos no se comprimen
+DICT_COMPRESSION_THRESHOLD = 64 # Con diccionario, un alta de un solo peer ya baja a la mitad
+COMPRESSION_LEVEL = 1        # Nivel rápido: ~4x menos CPU que 6 por ~5% menos ahorro
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024 # Protección contra "zip bombs"
+
+_CODEC_PREFIX = {CODEC_ZLIB: b"Z", CODEC_ZLIB_DICT: b"D"}
+_PREFIX_CODEC = {prefix[0]: codec for codec, prefix in _CODEC_PREFIX.items()}
+
+# Fragmentos que se repiten en los frames de membresía tal como los emite el
+# servidor: PEER_LIST_UPDATE de una sola alta o baja, REGISTER_ACK (completo o
+# con pocos contactos) y SYNC_PEERS_RESPONSE, con entradas que incluyen los
+# campos de enlace local. zlib da más peso al final del diccionario.
+MEMBERSHIP_ZDICT = (
+    b'"udp_port": 9999}}"compression": "zlib-dict"'
+    b'{"type": "SYNC_PEERS_RESPONSE", "sender_id": "'
+    b'{"type": "REGISTER_ACK", "sender_id": "server", "to": "'
+    b'", "content": {"peer_id": "", "peer_list": {"'
+    b'", "content": {"peer_list": {"'
+    b'{"type": "PEER_LIST_UPDATE", "sender_id": "server", "to": "ALL", "content": {"removed_peer": "'
+    b'{"type": "PEER_LIST_UPDATE", "sender_id": "server", "to": "ALL", "content": {"new_peer": {"'
+    b'": {"ip": "192.168.1.'
+    b'": {"ip": "127.0.0.1", "port": 10'
+    b', "username": "'
+    b'", "host_id": "'
+    b'", "uds": "/tmp/p2p-chat-10'
+    b'.sock"}, "'
+)
+
 # --- Funciones de Utilidad ---
 
-def create_message(msg_type: str, sender_id: str = "system", content: any = None, to: str = "ALL") -> bytes:
+def build_message(msg_type: str, sender_id: str = "system", content: any = None, to: str = "ALL", **extra) -> dict:
     """
-    Crea un mensaje JSON estandarizado y lo codifica a bytes.
+    Arma el dict de un mensaje estandarizado (sin codificar).
+    Los campos opcionales (ej. "rel", "ack") se añaden solo si no son None.
     """
     message = {
         "type": msg_type,
@@ -35,15 +118,72 @@ def create_message(msg_type: str, sender_id: str = "system", content: any = None
         "to": to,
         "content": content,
     }
+    for key, value in extra.items():
+        if value is not None:
+            message[key] = value
+    return message
+
+def encode_message(message: dict) -> bytes:
+    """Codifica un dict de mensaje a bytes."""
     # Añadimos un terminador de nueva línea para delimitar mensajes en el stream
     return (json.dumps(message) + '\n').encode('utf-8')
 
-def parse_message(data: bytes) -> dict | None:
+def create_message(msg_type: str, sender_id: str = "system", content: any = None, to: str = "ALL", **extra) -> bytes:
     """
-    Intenta parsear un mensaje JSON desde bytes.
+    Crea un mensaje JSON estandarizado y lo codifica a bytes.
+    """
+    return encode_message(build_message(msg_type, sender_id, content, to, **extra))
+
+def parse_message(data: bytes | memoryview) -> dict | None:
+    """
+    Intenta parsear un mensaje JSON desde bytes (o un memoryview del FrameReader).
     """
     try:
-        return json.loads(data.decode('utf-8'))
-    except (json.JSONDecodeError, UnicodeDecodeError):
-        print(f"[Protocol] Error al decodificar: {data}")
+        if len(data) and data[0] in _PREFIX_CODEC:
+            data = _decompress_frame(data)
+        # str(buffer, encoding) decodifica sin copiar a un bytes intermedio
+        return json.loads(str(data, 'utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError, ValueError, zlib.error):
+        # Solo el tamaño y el comienzo: un payload corrupto puede ser enorme
+        log.warning("[Protocol] Error al decodificar frame de %d bytes: %r", len(data), bytes(data[:64]))
         return None
+
+
+def negotiate_codec(offered: list | None) -> str | None:
+    """Elige el codec preferido que ambos lados soportan (None = sin compresión)."""
+    if not offered:
+        return None
+    for codec in SUPPORTED_CODECS:
+        if codec in offered:
+            return codec
+    return None
+
+def compress_frame(frame: bytes, codec: str | None) -> bytes:
+    """
+    Comprime un frame de membresía de create_message() si hay codec
+    negociado y supera el umbral del codec: con zlib-dict, el diccionario
+    comprime también las altas y bajas sueltas, que son los frames más
+    frecuentes. Si no conviene, devuelve el frame original.
+    """
+    threshold = DICT_COMPRESSION_THRESHOLD if codec == CODEC_ZLIB_DICT else COMPRESSION_THRESHOLD
+    if not codec or len(frame) < threshold:
+        return frame
+    if codec == CODEC_ZLIB_DICT:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=MEMBERSHIP_ZDICT)
+    else:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL)
+    # frame[:-1]: el '\n' final no se comprime
+    packed = compressor.compress(frame[:-1]) + compressor.flush()
+    encoded = _CODEC_PREFIX[codec] + base64.b64encode(packed) + b'\n'
+    return encoded if len(encoded) < len(frame) else frame
+
+def _decompress_frame(data: bytes) -> bytes:
+    codec = _PREFIX_CODEC[data[0]]
+    if codec == CODEC_ZLIB_DICT:
+        decompressor = zlib.decompressobj(zdict=MEMBERSHIP_ZDICT)
+    else:
+        decompressor = zlib.decompressobj()
+    raw = decompressor.decompress(base64.b64decode(data[1:]), MAX_DECOMPRESSED_SIZE)
+    if decompressor.unconsumed_tail:
+        raise ValueError("Frame comprimido excede MAX_DECOMPRESSED_SIZE")
+    return raw
@@ -0,0 +1,123 @@
+"""Lector de Frames sobre Sockets
+
+Reemplaza el patrón `buffer += sock.recv(1024); buffer.split(b'\\n', 1)`, que
+crea un bytes nuevo por cada recv, por cada concatenación y por cada split.
+
+FrameReader lee con recv_into sobre un bytearray preasignado, busca el '\\n'
+sin copiar y entrega memoryviews al decoder. El buffer solo se compacta
+(o crece) cuando ya no queda espacio libre al final.
+
+El servidor y los peers tienen un lector por conexión (10k peers = 10k
+lectores), casi todas con tráfico chico (heartbeats, mensajes sueltos): el
+buffer empieza en INITIAL_BUFFER_SIZE y crece hasta BURST_BUFFER_SIZE solo en
+las conexiones que lo llenan. Si un frame enorme (ej. la lista completa) lo
+agrandó más, vuelve al tamaño inicial al vaciarse.
+"""
+
+import socket
+
+INITIAL_BUFFER_SIZE = 4 * 1024 # Por conexión: alcanza para heartbeats y mensajes de chat
+BURST_BUFFER_SIZE = 64 * 1024  # Tope de crecimiento por ráfagas (menos recv por frame)
+MAX_FRAME_SIZE = 64 * 1024 * 1024 # Un frame más grande se considera un error de protocolo
+
+
+class FrameTooLargeError(Exception):
+    pass
+
+
+class FrameReader:
+    def __init__(self, sock: socket.socket, initial_size: int = INITIAL_BUFFER_SIZE,
+                 max_frame_size: int = MAX_FRAME_SIZE):
+        self.sock = sock
+        self.max_frame_size = max_frame_size
+        self.initial_size = initial_size
+        self.buf = bytearray(initial_size)
+        self.view = memoryview(self.buf)
+        self.start = 0 # Inicio de los datos sin consumir
+        self.end = 0   # Fin de los datos válidos
+        self.scan = 0  # Desde dónde seguir buscando '\n'
+
+    def next_frame(self) -> memoryview | None:
+        """
+        Devuelve el próximo frame completo que ya está en el buffer (sin el
+        '\\n'), o None si hace falta leer más. El memoryview es válido solo
+        hasta la siguiente llamada a fill().
+        """
+        while True:
+            pos = self.buf.find(b'\n', self.scan, self.end)
+            if pos < 0:
+                self.scan = self.end
+                return None
+            frame = self.view[self.start:pos]
+            self.start = self.scan = pos + 1
+            if self.start == self.end:
+                self._reset()
+            if len(frame):
+                return frame
+
+    def fill(self) -> int:
+        """
+        Lee del socket al espacio libre del buffer. Devuelve los bytes
+        leídos (0 = conexión cerrada). Propaga socket.timeout.
+        """
+        if self.end == len(self.buf):
+            self._make_room()
+        n = self.sock.recv_into(self.view[self.end:])
+        self.end += n
+        return n
+
+    def read_frame(self) -> memoryview | None:
+        """Bloquea hasta tener un frame completo. None si se cerró la conexión."""
+        while True:
+            frame = self.next_frame()
+            if frame is not None:
+                return frame
+            if not self.fill():
+                return None
+
+    def __iter__(self):
+        """Itera todos los frames hasta que el otro lado cierre la conexión."""
+        while True:
+            frame = self.read_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def buffered(self) -> memoryview:
+        """Bytes ya leídos pero no consumidos (ej. datos crudos tras un header)."""
+        return self.view[self.start:self.end]
+
+    def consume(self, n: int):
+        """Marca como consumidos n bytes de buffered()."""
+        self.start += n
+        self.scan = max(self.scan, self.start)
+        if self.start == self.end:
+            self._reset()
+
+    def _reset(self):
+        """Todo consumido: volver al inicio sin copiar nada."""
+        self.start = self.end = self.scan = 0
+        if len(self.buf) > BURST_BUFFER_SIZE:
+            # Lo agrandó un frame excepcional: no retenerlo en una conexión ociosa.
+            # Un memoryview ya entregado mantiene vivo el buffer viejo.
+            self.buf = bytearray(self.initial_size)
+            self.view = memoryview(self.buf)
+
+    def _make_room(self):
+        pending = self.end - self.start
+        if self.start > 0 and len(self.buf) >= BURST_BUFFER_SIZE:
+            # Compactación perezosa: solo cuando el final del buffer se llenó.
+            # Se copia a un temporal porque origen y destino pueden solaparse.
+            self.buf[:pending] = self.buf[self.start:self.end]
+            self.scan -= self.start
+            self.start, self.end = 0, pending
+            return
+        # Un frame ocupa todo el buffer, o una ráfaga llenó uno chico: duplicarlo
+        if len(self.buf) >= self.max_frame_size:
+            raise FrameTooLargeError(f"Frame supera {self.max_frame_size} bytes")
+        new_buf = bytearray(min(len(self.buf) * 2, self.max_frame_size))
+        new_buf[:pending] = self.view[self.start:self.end]
+        self.scan -= self.start
+        self.start, self.end = 0, pending
+        self.buf = new_buf
+        self.view = memoryview(new_buf)
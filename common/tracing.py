@@ -0,0 +1,190 @@
+"""Trazas de Mensajes de Chat
+
+Un mensaje muestreado lleva un campo "trace" con su ID y los instantes
+(time.time) de cada etapa por la que pasó. Las etapas que ocurren después
+de codificar el mensaje no pueden viajar en él, así que cada lado escribe
+su parte como una línea JSON en el archivo de trazas y el resumen las une
+por ID:
+
+    created -> queued -> flushed            (en el mensaje, emisor)
+    encoded -> connected -> sent            (línea del emisor, tras el sendall)
+    received -> parsed -> delivered         (línea del receptor)
+    consumed                                (línea de la UI al leer la cola)
+
+Configuración por variables de entorno:
+    P2P_TRACE_SAMPLE  fracción de mensajes a trazar (0 = apagado, por defecto)
+    P2P_TRACE_FILE    archivo JSONL de salida (traces.jsonl)
+
+Resumen por etapa:
+    python -m common.tracing traces.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from common.protocol import MSG_BATCH
+
+STAGES = ["created", "queued", "flushed", "encoded", "connected", "sent",
+          "received", "parsed", "delivered", "consumed"]
+DEFAULT_TRACE_FILE = "traces.jsonl"
+
+_writers = {} # { path: (lock, file) }: varios peers en un proceso comparten el archivo
+_writers_lock = threading.Lock()
+
+
+def _writer(path: str):
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = (threading.Lock(), open(path, "a", encoding="utf-8"))
+        return _writers[path]
+
+
+class Tracer:
+    def __init__(self, node_id_fn, sample_rate: float | None = None, path: str | None = None):
+        """node_id_fn() -> ID del nodo que escribe (puede cambiar tras el registro)."""
+        if sample_rate is None:
+            sample_rate = float(os.environ.get("P2P_TRACE_SAMPLE", "0"))
+        self.sample_rate = sample_rate
+        self.path = path or os.environ.get("P2P_TRACE_FILE", DEFAULT_TRACE_FILE)
+        self.node_id_fn = node_id_fn
+
+    def start(self) -> dict | None:
+        """Campo "trace" para un mensaje nuevo, o None si no sale sorteado."""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        return {"id": uuid.uuid4().hex[:16], "created": time.time()}
+
+    @staticmethod
+    def fork(message: dict) -> dict:
+        """
+        El mensaje con un "trace" propio para un intento de envío. El original
+        queda guardado para retransmitir: si se marcara en él, cada reintento
+        pisaría las etapas del intento anterior.
+        """
+        trace = message.get("trace")
+        return message if trace is None else dict(message, trace=dict(trace))
+
+    @staticmethod
+    def stamp(message: dict, stage: str, ts: float | None = None):
+        """Marca una etapa en un mensaje (sin costo si no está trazado)."""
+        trace = message.get("trace")
+        if trace is not None:
+            trace[stage] = ts or time.time()
+
+    def on_receive(self, message: dict, received_at: float):
+        """Marca received/parsed en un mensaje recién parseado (y en los de un lote)."""
+        parsed_at = time.time()
+        if message.get("type") == MSG_BATCH:
+            for inner in message.get("content") or []:
+                self.on_receive(inner, received_at)
+            return
+        trace = message.get("trace")
+        if trace is not None:
+            trace["received"] = received_at
+            trace["parsed"] = parsed_at
+
+    def finish(self, message: dict, stage: str):
+        """Marca la última etapa del lado receptor y escribe la traza."""
+        trace = message.get("trace")
+        if trace is not None:
+            trace[stage] = time.time()
+            self.record(trace)
+
+    def record_sent(self, messages: list[dict], encoded: float, connected: float | None, sent: float):
+        """Línea del emisor para los mensajes trazados de un lote ya escrito al socket."""
+        for message in messages:
+            trace = message.get("trace")
+            if trace is not None:
+                record = {"id": trace["id"], "encoded": encoded, "sent": sent}
+                if connected:
+                    record["connected"] = connected
+                self.record(record)
+
+    def record_consumed(self, trace_id: str | None):
+        """Línea de la UI: el mensaje salió de incoming_messages."""
+        if trace_id:
+            self.record({"id": trace_id, "consumed": time.time()})
+
+    def record(self, stages: dict):
+        lock, f = _writer(self.path)
+        line = json.dumps(dict(stages, node=self.node_id_fn()))
+        with lock:
+            f.write(line + "\n")
+            f.flush()
+
+
+# --- Resumen ---
+
+def load_traces(path: str) -> dict:
+    """Une las líneas de cada traza: { id: {etapa: ts, ...} }."""
+    traces = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            trace = traces.setdefault(record.pop("id"), {})
+            record.pop("node", None)
+            trace.update(record)
+    return traces
+
+
+def _percentile(ordered: list[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(traces: dict) -> list[dict]:
+    """
+    Latencia de cada etapa respecto de la anterior presente en la traza,
+    más los totales de punta a punta.
+    """
+    deltas = {}
+    for trace in traces.values():
+        present = [stage for stage in STAGES if stage in trace]
+        for prev, stage in zip(present, present[1:]):
+            deltas.setdefault(f"{prev} -> {stage}", []).append(trace[stage] - trace[prev])
+        for end in ("delivered", "consumed"):
+            if "created" in trace and end in trace:
+                deltas.setdefault(f"TOTAL created -> {end}", []).append(trace[end] - trace["created"])
+
+    order = {f"{a} -> {b}": i for i, (a, b) in enumerate(
+        (a, b) for i, a in enumerate(STAGES) for b in STAGES[i + 1:])}
+    rows = []
+    for name, values in sorted(deltas.items(), key=lambda item: order.get(item[0], len(order))):
+        values.sort()
+        rows.append({
+            "stage": name,
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(_percentile(values, 50) * 1000, 3),
+            "p90_ms": round(_percentile(values, 90) * 1000, 3),
+            "p99_ms": round(_percentile(values, 99) * 1000, 3),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumen de latencia por etapa de las trazas de chat")
+    parser.add_argument("path", nargs="?", default=DEFAULT_TRACE_FILE)
+    parser.add_argument("--json", action="store_true", help="Imprimir el resumen en JSON")
+    args = parser.parse_args()
+
+    traces = load_traces(args.path)
+    rows = summarize(traces)
+    if args.json:
+        print(json.dumps({"traces": len(traces), "stages": rows}, indent=2))
+        return
+    print(f"{len(traces)} trazas (los tiempos entre emisor y receptor asumen relojes sincronizados)")
+    print(f"{'etapa':<34} {'n':>6} {'media ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for r in rows:
+        print(f"{r['stage']:<34} {r['count']:>6} {r['mean_ms']:>9} {r['p50_ms']:>9} {r['p90_ms']:>9} {r['p99_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,98 @@
 """#### Servidor de descubrimiento"""
 
+import random
 import socket
 import threading
 import json
 import time
-from common.protocol import create_message, parse_message, MSG_REGISTER, MSG_REGISTER_ACK, MSG_HEARTBEAT, MSG_PEER_LIST_UPDATE, MSG_UNREGISTER
+from common.protocol import create_message, parse_message, MSG_REGISTER, MSG_REGISTER_ACK, MSG_HEARTBEAT, MSG_PEER_LIST_UPDATE, MSG_UNREGISTER, MSG_STATS_REQUEST
+from common.protocol import MSG_GET_PEERS, MSG_GET_PEERS_RESPONSE
+from common.protocol import compress_frame, negotiate_codec
+from common.datagram import DatagramChannel
+from common.local_link import LINK_FIELDS
+from common.stream import FrameReader, FrameTooLargeError
+from common.metrics import MetricsRegistry, TimedLock, stats_response
+from common.log import get_logger
+from discovery_server.peer_index import PeerIndex, PAGE_SIZE, MAX_PAGE
+
+log = get_logger("server")
 
 HOST = '0.0.0.0'
 PORT = 9999
 HEARTBEAT_TIMEOUT = 30  # Segundos para considerar a un peer desconectado
+MONITOR_INTERVAL = 10   # Revisar timeouts cada 10 segundos
+LISTEN_BACKLOG = 128    # Con 5, las ráfagas de registros caían en reintentos de SYN (1s, 3s, ...)
 
 class DiscoveryServer:
-    def __init__(self, host, port):
+    def __init__(self, host, port, udp: bool = True, bootstrap_contacts: int = 0):
         self.host = host
         self.port = port
+        # Con bootstrap_contacts > 0 el REGISTER_ACK lleva solo esa cantidad de
+        # peers al azar (para peers con vista parcial) y no hay PEER_LIST_UPDATE
+        self.bootstrap_contacts = bootstrap_contacts
+        # Heartbeats por UDP (mismo número de puerto; los workers usan uno libre)
+        self.udp_enabled = udp
+        self.udp_port = port
+        self.udp = None # DatagramChannel, creado en start()
         # Lista de peers: { peer_id: (ip, port, username, last_heartbeat) }
         self.peers = {}
-        self.peers_lock = threading.Lock()
+        # Enlace local anunciado por el peer (socket Unix): { peer_id: {"host_id": str, "uds": str} }
+        self.peer_links = {}
+        # Índices por username, IP y orden de peer_id para GET_PEERS (ver peer_index.py)
+        self.index = PeerIndex()
+
+        # Métricas: expuestas con MSG_STATS_REQUEST (y por HTTP si se pide)
+        self.metrics = MetricsRegistry()
+        self.connections_total = self.metrics.counter("server_connections_total", "Conexiones aceptadas")
+        self.active_connections = self.metrics.gauge("server_connections_active", "Conexiones abiertas")
+        self.registrations_total = self.metrics.counter("server_registrations_total", "Peers registrados")
+        self.queries_total = self.metrics.counter("server_peer_queries_total", "Consultas GET_PEERS respondidas")
+        self.heartbeats_total = self.metrics.counter("server_heartbeats_total", "Heartbeats recibidos")
+        self.broadcast_seconds = self.metrics.histogram("server_broadcast_seconds", "Tiempo de enviar un PEER_LIST_UPDATE a todos")
+        self.broadcast_frames_total = self.metrics.counter("server_broadcast_frames_total", "Frames de PEER_LIST_UPDATE enviados")
+        self.metrics.gauge("server_peers", "Peers registrados ahora", fn=lambda: len(self.peers))
+
+        # Lock que mide la espera para adquirirlo (contención entre hilos)
+        self.peers_lock = TimedLock(threading.Lock(), self.metrics.histogram(
+            "server_peers_lock_wait_seconds", "Espera para adquirir peers_lock"))
         
         # --- AÑADIR ESTO ---
         # Almacena los sockets de conexión de cada peer para poder enviarles updates
         # { peer_id: socket.socket }
         self.client_sockets = {}
+        # Codec de compresión negociado con cada peer: { peer_id: str | None }
+        self.client_codecs = {}
+        # Peers que pidieron solo contactos en el REGISTER: consultan con
+        # GET_PEERS en lugar de recibir PEER_LIST_UPDATE
+        self.lazy_clients = set()
         self.client_sockets_lock = threading.Lock()
         # --- FIN DE LO AÑADIDO ---
         
         self.server_socket = None
-        print(f"[Server] Iniciando en {self.host}:{self.port}")
+        # Reloj de los heartbeats (el simulador lo reemplaza por tiempo virtual)
+        self.clock = time.time
+        log.info("[Server] Iniciando en %s:%s", self.host, self.port)
+
+    def open_listen_socket(self) -> socket.socket:
+        """Socket de escucha sin bind (los workers agregan SO_REUSEPORT)."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        return sock
 
     def start(self):
         """Inicia el servidor y el monitor de heartbeats."""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket = self.open_listen_socket()
         try:
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
-            print(f"[Server] Escuchando conexiones en {self.port}...")
+            self.server_socket.listen(LISTEN_BACKLOG)
+            log.info("[Server] Escuchando conexiones en %s...", self.port)
+
+            if self.udp_enabled:
+                try:
+                    self.udp = DatagramChannel(self.host, self.udp_port, self.handle_datagram)
+                    log.info("[Server] Heartbeats UDP en el puerto %s", self.udp.port)
+                except OSError as e:
+                    log.warning("[Server] Sin UDP (%s). Heartbeats solo por TCP.", e)
 
             # Iniciar thread para monitorear heartbeats y peers caídos
             monitor_thread = threading.Thread(target=self.monitor_peers, daemon=True)
@@ -48,58 +105,58 @@ class DiscoveryServer:
                 handler_thread.start()
 
         except OSError as e:
-            print(f"[Server] Error: {e}")
+            log.error("[Server] Error: %s", e)
         finally:
             if self.server_socket:
                 self.server_socket.close()
 
     def handle_client(self, conn: socket.socket, addr: tuple):
         """Maneja la conexión de un único peer."""
-        print(f"[Server] Nueva conexión de {addr}")
+        log.debug("[Server] Nueva conexión de %s", addr)
+        self.connections_total.inc()
+        self.active_connections.inc()
         peer_id = None
+        registered_id = None # El único ID que esta conexión puede dar de baja
         try:
-            # Usamos un buffer para manejar mensajes que llegan juntos
-            buffer = b""
-            while True:
-                data = conn.recv(1024)
-                if not data:
-                    break # Cliente cerró conexión
-
-                buffer += data
+            # El lector maneja mensajes que llegan juntos o partidos
+            for message_data in FrameReader(conn):
+                msg = parse_message(message_data)
+                if not msg:
+                    continue
 
-                # Procesar todos los mensajes completos en el buffer
-                while b'\n' in buffer:
-                    message_data, buffer = buffer.split(b'\n', 1)
-                    if not message_data:
-                        continue
+                peer_id = registered_id or msg.get("sender_id") # El ID que el peer *cree* que tiene
 
-                    msg = parse_message(message_data)
-                    if not msg:
-                        continue
+                if msg['type'] == MSG_REGISTER:
+                    # Peer se está registrando
+                    peer_id = registered_id = self.register_peer(conn, addr, msg['content'])
 
-                    peer_id = msg.get("sender_id") # El ID que el peer *cree* que tiene
+                elif msg['type'] == MSG_HEARTBEAT:
+                    self.update_heartbeat(msg.get("sender_id"))
 
-                    if msg['type'] == MSG_REGISTER:
-                        # Peer se está registrando
-                        peer_id = self.register_peer(conn, addr, msg['content'])
+                elif msg['type'] == MSG_UNREGISTER:
+                    log.info("[Server] Peer %s se desregistró.", peer_id)
+                    break # Termina el bucle y cierra la conexión
 
-                    elif msg['type'] == MSG_HEARTBEAT:
-                        self.update_heartbeat(peer_id)
+                elif msg['type'] == MSG_STATS_REQUEST:
+                    conn.sendall(stats_response(self.metrics, "server", to=peer_id))
 
-                    elif msg['type'] == MSG_UNREGISTER:
-                        print(f"[Server] Peer {peer_id} se desregistró.")
-                        break # Termina el bucle y cierra la conexión
+                elif msg['type'] == MSG_GET_PEERS:
+                    conn.sendall(create_message(MSG_GET_PEERS_RESPONSE, sender_id="server", to=peer_id,
+                                                content=self.query_peers(msg['content'])))
 
-                    else:
-                        print(f"[Server] Mensaje desconocido de {peer_id}: {msg['type']}")
+                else:
+                    log.warning("[Server] Mensaje desconocido de %s: %s", peer_id, msg['type'])
 
         except (ConnectionResetError, BrokenPipeError):
-            print(f"[Server] Conexión perdida con {addr} (Peer ID: {peer_id})")
+            log.info("[Server] Conexión perdida con %s (Peer ID: %s)", addr, peer_id)
+        except FrameTooLargeError as e:
+            log.warning("[Server] %s envió un mensaje inválido: %s", addr, e)
         except Exception as e:
-            print(f"[Server] Error manejando a {addr}: {e}")
+            log.exception("[Server] Error manejando a %s: %s", addr, e)
         finally:
-            if peer_id:
-                self.unregister_peer(peer_id)
+            self.active_connections.dec()
+            if registered_id:
+                self.unregister_peer(registered_id)
             conn.close()
 
     def register_peer(self, conn: socket.socket, addr: tuple, content: dict) -> str:
@@ -107,64 +164,120 @@ class DiscoveryServer:
         peer_ip = addr[0]
         peer_listen_port = content.get('port')
         peer_username = content.get('username')
+        codec = negotiate_codec(content.get('compression'))
 
         # Generar un ID único (en un caso real, usar UUID)
         peer_id = f"{peer_username}@{peer_ip}:{peer_listen_port}"
 
-        peer_info = {
-            "ip": peer_ip,
-            "port": peer_listen_port,
-            "username": peer_username,
-        }
+        links = {field: content[field] for field in LINK_FIELDS if isinstance(content.get(field), str)}
+        # "contacts": k → el peer no quiere la lista completa (ej. vista parcial)
+        wanted = content.get('contacts')
+        lazy = isinstance(wanted, int) and wanted > 0
+        contacts_k = self.bootstrap_contacts or (min(wanted, MAX_PAGE) if lazy else 0)
 
-        print(f"[Server] Registrando peer: {peer_id}")
+        log.info("[Server] Registrando peer: %s", peer_id)
+        self.registrations_total.inc()
 
         with self.peers_lock:
             # Guardar información completa, incluyendo timestamp
-            self.peers[peer_id] = (peer_ip, peer_listen_port, peer_username, time.time())
+            self.store_peer(peer_id, peer_ip, peer_listen_port, peer_username, self.clock(), links)
+            peer_info = self.peer_entry(peer_id)
 
             # Crear una lista "limpia" de peers para enviar
-            peers_list_for_client = {
-                pid: {"ip": p[0], "port": p[1], "username": p[2]}
-                for pid, p in self.peers.items()
-            }
+            if contacts_k:
+                contacts = random.sample(tuple(self.peers), min(contacts_k + 1, len(self.peers)))
+                contacts = [pid for pid in contacts if pid != peer_id][:contacts_k] + [peer_id]
+            else:
+                contacts = self.peers
+            peers_list_for_client = {pid: self.peer_entry(pid) for pid in contacts}
             # --- AÑADIR ESTO_nic ---
             # Guardar el socket del cliente para enviarle actualizaciones
             with self.client_sockets_lock:
                 self.client_sockets[peer_id] = conn
+                self.client_codecs[peer_id] = codec
+                if lazy:
+                    self.lazy_clients.add(peer_id)
+                else:
+                    self.lazy_clients.discard(peer_id)
             # --- FIN DE LO AÑADIDO_nic ---
 
         # Enviar ACK al nuevo peer con su ID y la lista de peers
+        ack_content = {"peer_id": peer_id, "peer_list": peers_list_for_client, "compression": codec}
+        if self.udp and content.get('udp'):
+            ack_content["udp_port"] = self.udp.port # Desde ahora los heartbeats pueden llegar por UDP
         ack_msg = create_message(
             MSG_REGISTER_ACK,
             sender_id="server",
             to=peer_id,
-            content={"peer_id": peer_id, "peer_list": peers_list_for_client}
+            content=ack_content
         )
-        conn.sendall(ack_msg)
+        conn.sendall(compress_frame(ack_msg, codec))
 
         # Notificar a *todos los demás* peers sobre el nuevo integrante
         self.broadcast_peer_update(new_peer_id=peer_id, new_peer_info=peer_info)
 
         return peer_id
 
+    def store_peer(self, peer_id: str, ip: str, port: int, username: str, last_heartbeat: float, links: dict):
+        """Alta (o actualización) en la lista y sus índices (con peers_lock tomado)."""
+        self.peers[peer_id] = (ip, port, username, last_heartbeat)
+        if links:
+            self.peer_links[peer_id] = links
+        else:
+            self.peer_links.pop(peer_id, None)
+        self.index.add(peer_id, ip, username)
+
+    def drop_peer(self, peer_id: str) -> tuple | None:
+        """Baja de la lista y de sus índices (con peers_lock tomado)."""
+        entry = self.peers.pop(peer_id, None)
+        if entry:
+            self.peer_links.pop(peer_id, None)
+            self.index.remove(peer_id, entry[0], entry[2])
+        return entry
+
+    def query_peers(self, query: dict | None) -> dict:
+        """
+        Respuesta a un GET_PEERS. Con "peer_id", búsqueda puntual; si no, una
+        página (filtros "username", "ip", "prefix"; "after" y "limit"):
+        {"peers": {peer_id: entrada}, "next": cursor | None, "total": int}
+        """
+        self.queries_total.inc()
+        query = query if isinstance(query, dict) else {}
+        text = lambda key: query[key] if isinstance(query.get(key), str) else None
+        limit = query.get('limit')
+        limit = min(max(limit, 1), MAX_PAGE) if isinstance(limit, int) else PAGE_SIZE
+        peer_id = text('peer_id')
+        with self.peers_lock:
+            if peer_id is not None:
+                found = {peer_id: self.peer_entry(peer_id)} if peer_id in self.peers else {}
+                return {"peers": found, "next": None, "total": len(found)}
+            ids, cursor, total = self.index.query(text('username'), text('ip'), text('prefix'), text('after'), limit)
+            return {"peers": {pid: self.peer_entry(pid) for pid in ids}, "next": cursor, "total": total}
+
+    def peer_entry(self, peer_id: str) -> dict:
+        """Entrada de la lista tal como la reciben los peers (con peers_lock tomado)."""
+        ip, port, username, _ = self.peers[peer_id]
+        return {"ip": ip, "port": port, "username": username, **self.peer_links.get(peer_id, {})}
+
     def unregister_peer(self, peer_id: str):
         """Elimina un peer y notifica a los demás."""
         removed_peer_info = None
         with self.peers_lock:
-            if peer_id in self.peers:
-                removed_peer_info = self.peers.pop(peer_id)
-                print(f"[Server] Peer {peer_id} eliminado.")
+            removed_peer_info = self.drop_peer(peer_id)
+        if removed_peer_info:
+            log.info("[Server] Peer %s eliminado.", peer_id)
         # --- AÑADIR ESTO _Nic ---
         # Cerrar y eliminar el socket guardado para este peer
         with self.client_sockets_lock:
+            self.client_codecs.pop(peer_id, None)
+            self.lazy_clients.discard(peer_id)
             if peer_id in self.client_sockets:
                 client_conn = self.client_sockets.pop(peer_id)
                 try:
                     # Cierra la conexión desde el lado del servidor
                     client_conn.close() 
                 except Exception as e:
-                    print(f"[Server] Error al cerrar socket de {peer_id}: {e}")
+                    log.debug("[Server] Error al cerrar socket de %s: %s", peer_id, e)
         # --- FIN DE LO AÑADIDO_nic ---
         if removed_peer_info:
             # Notificar a los peers restantes
@@ -176,8 +289,10 @@ class DiscoveryServer:
         
         if not new_peer_id and not removed_peer_id:
             return # Nada que hacer
+        if self.bootstrap_contacts:
+            return # Solo contactos de arranque: cada peer mantiene su vista parcial
 
-        print(f"[Broadcast] Notificando a todos los peers...")
+        log.debug("[Broadcast] Notificando a todos los peers...")
 
         # Crear el contenido del mensaje
         content = {}
@@ -199,56 +314,89 @@ class DiscoveryServer:
         # la lista principal mientras enviamos mensajes
         sockets_to_notify = []
         with self.client_sockets_lock:
-            sockets_to_notify = list(self.client_sockets.items())
+            sockets_to_notify = [
+                (pid, conn, self.client_codecs.get(pid))
+                for pid, conn in self.client_sockets.items()
+                if pid not in self.lazy_clients
+            ]
+
+        # Comprimir una sola vez por codec, no una vez por peer
+        frames = {}
+        start = time.perf_counter()
+        sent = 0
 
         peers_failed = []
 
-        for peer_id, conn in sockets_to_notify:
+        for peer_id, conn, codec in sockets_to_notify:
             # No enviar la notificación al peer que *acaba* de unirse
             # (ya recibió la lista completa en el ACK)
             if peer_id == new_peer_id:
                 continue
 
+            if codec not in frames:
+                frames[codec] = compress_frame(update_msg, codec)
+
             try:
-                conn.sendall(update_msg)
+                conn.sendall(frames[codec])
+                sent += 1
             except (BrokenPipeError, ConnectionResetError, OSError) as e:
-                print(f"[Broadcast] Error enviando a {peer_id}. Marcando para eliminar.")
+                log.debug("[Broadcast] Error enviando a %s: %s", peer_id, e)
                 peers_failed.append(peer_id)
             except Exception as e:
-                print(f"[Broadcast] Error inesperado con {peer_id}: {e}")
+                log.warning("[Broadcast] Error inesperado con %s: %s", peer_id, e)
                 peers_failed.append(peer_id)
 
+        self.broadcast_seconds.observe(time.perf_counter() - start)
+        self.broadcast_frames_total.inc(sent)
+
         # Limpiar peers que fallaron (probablemente se desconectaron)
         if peers_failed:
-            print(f"[Broadcast] Limpiando {len(peers_failed)} peers fallidos.")
+            # Un solo aviso por broadcast, no uno por peer caído
+            log.warning("[Broadcast] %d de %d envíos fallaron. Limpiando peers: %s",
+                        len(peers_failed), len(sockets_to_notify), peers_failed)
             for peer_id in peers_failed:
                 # Esta función se encarga de todo
                 self.unregister_peer(peer_id)
     def update_heartbeat(self, peer_id: str):
         """Actualiza el timestamp del último heartbeat de un peer."""
+        self.heartbeats_total.inc()
         with self.peers_lock:
             if peer_id in self.peers:
                 p = self.peers[peer_id]
-                self.peers[peer_id] = (p[0], p[1], p[2], time.time())
-                # print(f"[Server] Heartbeat de {peer_id}")
-            else:
-                print(f"[Server] Heartbeat de peer desconocido {peer_id}. Ignorando.")
+                self.peers[peer_id] = (p[0], p[1], p[2], self.clock())
+                return
+        log.warning("[Server] Heartbeat de peer desconocido %s. Ignorando.", peer_id)
+
+    def handle_datagram(self, msg: dict, addr: tuple, channel: DatagramChannel):
+        """Heartbeats por UDP: solo cuentan si vienen de la IP con la que se registró el peer."""
+        if msg['type'] != MSG_HEARTBEAT:
+            log.debug("[Server] Datagrama inesperado de %s: %s", addr, msg['type'])
+            return
+        peer_id = msg.get('sender_id')
+        entry = self.peers.get(peer_id)
+        if entry is None or entry[0] != addr[0]:
+            log.debug("[Server] Heartbeat UDP de %s para %s ignorado.", addr, peer_id)
+            return
+        self.update_heartbeat(peer_id)
 
     def monitor_peers(self):
         """Thread que corre periódicamente para limpiar peers inactivos."""
-        print("[Monitor] Monitor de peers iniciado.")
+        log.info("[Monitor] Monitor de peers iniciado.")
         while True:
-            time.sleep(10) # Revisar cada 10 segundos
-
-            peers_to_remove = []
-            now = time.time()
+            time.sleep(MONITOR_INTERVAL)
+            self.check_peer_timeouts()
 
-            with self.peers_lock:
-                for peer_id, (ip, port, username, last_heartbeat) in self.peers.items():
-                    if now - last_heartbeat > HEARTBEAT_TIMEOUT:
-                        print(f"[Monitor] Peer {peer_id} ha superado el timeout. Eliminando.")
-                        peers_to_remove.append(peer_id)
+    def check_peer_timeouts(self):
+        """Elimina los peers sin heartbeat en los últimos HEARTBEAT_TIMEOUT segundos."""
+        peers_to_remove = []
+        now = self.clock()
 
-            # Eliminar fuera del lock de iteración
-            for peer_id in peers_to_remove:
-                self.unregister_peer(peer_id)
+        with self.peers_lock:
+            for peer_id, (ip, port, username, last_heartbeat) in self.peers.items():
+                if now - last_heartbeat > HEARTBEAT_TIMEOUT:
+                    peers_to_remove.append(peer_id)
+
+        # Eliminar fuera del lock de iteración
+        for peer_id in peers_to_remove:
+            log.info("[Monitor] Peer %s ha superado el timeout. Eliminando.", peer_id)
+            self.unregister_peer(peer_id)
@@ -0,0 +1,76 @@
+"""#### Índices de Peers del Servidor
+
+Para responder un GET_PEERS el servidor no recorre self.peers: mantiene,
+junto con la lista, índices secundarios que se actualizan en cada alta/baja.
+
+- by_username: { username: {peer_id, ...} } (un username puede repetirse)
+- by_ip: { ip: {peer_id, ...} }
+- ordered: peer_ids ordenados. Es el orden de la paginación (el cursor es
+  el último peer_id de la página anterior) y, como un peer_id empieza con
+  "username@", un prefijo de username es un rango contiguo (bisect).
+
+insort es O(n) por el corrimiento de la lista, pero es un memmove: con
+100k peers son decenas de microsegundos por registro.
+"""
+
+import bisect
+
+PAGE_SIZE = 100 # Peers por página si la consulta no pide otra cantidad
+MAX_PAGE = 500  # Tope por página: una respuesta no debe volver a ser la lista completa
+
+
+class PeerIndex:
+    """Índices de la lista del servidor; se usan con peers_lock tomado."""
+
+    def __init__(self):
+        self.by_username = {}
+        self.by_ip = {}
+        self.ordered = []
+
+    def add(self, peer_id: str, ip: str, username: str):
+        ids = self.by_username.setdefault(username, set())
+        if peer_id in ids:
+            return # Re-registro con el mismo ID (mismo username, ip y puerto)
+        ids.add(peer_id)
+        self.by_ip.setdefault(ip, set()).add(peer_id)
+        bisect.insort(self.ordered, peer_id)
+
+    def remove(self, peer_id: str, ip: str, username: str):
+        for index, key in ((self.by_username, username), (self.by_ip, ip)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(peer_id)
+                if not ids:
+                    del index[key]
+        i = bisect.bisect_left(self.ordered, peer_id)
+        if i < len(self.ordered) and self.ordered[i] == peer_id:
+            del self.ordered[i]
+
+    def query(self, username: str | None = None, ip: str | None = None, prefix: str | None = None,
+              after: str | None = None, limit: int = PAGE_SIZE) -> tuple[list[str], str | None, int]:
+        """
+        IDs de una página de la consulta: (ids, cursor siguiente | None, total
+        de coincidencias). Los filtros se combinan (AND).
+        """
+        if username is not None or ip is not None:
+            # Conjuntos chicos: se ordenan solo los candidatos
+            candidates = None
+            for index, key in ((self.by_username, username), (self.by_ip, ip)):
+                if key is not None:
+                    ids = index.get(key, set())
+                    candidates = ids if candidates is None else candidates & ids
+            matches = sorted(pid for pid in candidates if not prefix or pid.startswith(prefix))
+            lo, hi = 0, len(matches)
+        else:
+            matches = self.ordered
+            lo, hi = 0, len(matches)
+            if prefix:
+                # Todos los IDs que empiezan con prefix quedan entre prefix y prefix + U+10FFFF
+                lo = bisect.bisect_left(matches, prefix)
+                hi = bisect.bisect_left(matches, prefix + "\U0010ffff", lo)
+
+        total = hi - lo
+        start = bisect.bisect_right(matches, after, lo, hi) if after else lo
+        page = matches[start:min(start + limit, hi)]
+        more = start + len(page) < hi
+        return page, (page[-1] if more and page else None), total
@@ -0,0 +1,174 @@
+"""#### Servidor de Descubrimiento Multi-Proceso (SO_REUSEPORT)
+
+Un DiscoveryServer procesa todo el JSON en un solo proceso (un core, por el
+GIL). En modo workers se lanzan N procesos que escuchan en el MISMO puerto
+con SO_REUSEPORT; el kernel reparte las conexiones nuevas entre ellos, y
+cada worker es dueño de las conexiones que aceptó (heartbeats, timeouts y
+PEER_LIST_UPDATE hacia esos peers).
+
+Los cambios de membresía se propagan entre workers por colas locales
+(multiprocessing.Queue, una por worker):
+
+    ("join", worker, peer_id, {"ip", "port", "username", ...})
+    ("leave", worker, peer_id)
+
+Cada worker tiene así la lista completa (la propia más la de los demás) y
+puede responder un REGISTER y notificar a sus clientes. La lista es
+eventualmente consistente: un REGISTER_ACK puede no incluir un peer que se
+registró en otro worker hace instantes; ese peer llega después como
+PEER_LIST_UPDATE o por gossip.
+
+Requiere SO_REUSEPORT (Linux, BSD, macOS). Uso:
+    python run_server.py --workers 4
+"""
+
+import math
+import multiprocessing
+import multiprocessing.connection
+import signal
+import socket
+import sys
+import threading
+
+from discovery_server.discovery_server import DiscoveryServer
+from common.local_link import LINK_FIELDS
+from common.log import get_logger
+from common.metrics import serve_http
+
+log = get_logger("workers")
+
+EVENT_JOIN = "join"
+EVENT_LEAVE = "leave"
+
+
+class ShardedDiscoveryServer(DiscoveryServer):
+    """Un worker: DiscoveryServer que comparte el puerto y publica su membresía."""
+
+    def __init__(self, host: str, port: int, worker_id: int, inboxes: list, bootstrap_contacts: int = 0):
+        super().__init__(host, port, bootstrap_contacts=bootstrap_contacts)
+        # SO_REUSEPORT repartiría los heartbeats UDP entre workers al azar:
+        # cada worker usa un puerto UDP propio y lo anuncia en sus REGISTER_ACK
+        self.udp_port = 0
+        self.worker_id = worker_id
+        self.inbox = inboxes[worker_id]
+        self.peer_inboxes = [q for i, q in enumerate(inboxes) if i != worker_id]
+        # Peers cuya conexión es de este worker; el resto los vigila su dueño
+        self.owned = set()
+        # Dueño de cada peer remoto: un "leave" de un worker que ya no es el
+        # dueño (el peer se reconectó en otro) se ignora
+        self.peer_owner = {}
+        self.events_total = self.metrics.counter("server_worker_events_total", "Eventos de membresía recibidos de otros workers")
+
+    def open_listen_socket(self) -> socket.socket:
+        sock = super().open_listen_socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return sock
+
+    def start(self):
+        threading.Thread(target=self.consume_events, daemon=True).start()
+        log.info("[Worker %s] Aceptando conexiones en el puerto compartido %s", self.worker_id, self.port)
+        super().start()
+
+    def publish(self, event: tuple):
+        for q in self.peer_inboxes:
+            q.put(event)
+
+    # --- Eventos locales ---
+
+    def register_peer(self, conn: socket.socket, addr: tuple, content: dict) -> str:
+        peer_id = super().register_peer(conn, addr, content)
+        self.owned.add(peer_id)
+        self.peer_owner.pop(peer_id, None)
+        with self.peers_lock:
+            entry = self.peer_entry(peer_id)
+        self.publish((EVENT_JOIN, self.worker_id, peer_id, entry))
+        return peer_id
+
+    def unregister_peer(self, peer_id: str):
+        # Los peers remotos los da de baja su dueño (y llega como "leave")
+        if peer_id not in self.owned:
+            return
+        self.owned.discard(peer_id)
+        super().unregister_peer(peer_id)
+        self.publish((EVENT_LEAVE, self.worker_id, peer_id))
+
+    # --- Eventos de otros workers ---
+
+    def consume_events(self):
+        """Hilo que aplica los cambios de membresía publicados por los otros workers."""
+        while True:
+            event = self.inbox.get()
+            self.events_total.inc()
+            if event[0] == EVENT_JOIN:
+                self.apply_remote_join(*event[1:])
+            elif event[0] == EVENT_LEAVE:
+                self.apply_remote_leave(*event[1:])
+
+    def apply_remote_join(self, owner: int, peer_id: str, entry: dict):
+        if peer_id in self.owned:
+            # Se reconectó en otro worker: la conexión vieja ya no vale
+            self.owned.discard(peer_id)
+            with self.client_sockets_lock:
+                self.client_codecs.pop(peer_id, None)
+                self.lazy_clients.discard(peer_id)
+                stale = self.client_sockets.pop(peer_id, None)
+            if stale:
+                stale.close()
+        self.peer_owner[peer_id] = owner
+        with self.peers_lock:
+            # Sin timestamp propio: el timeout lo controla el worker dueño
+            links = {field: entry[field] for field in LINK_FIELDS if field in entry}
+            self.store_peer(peer_id, entry['ip'], entry['port'], entry['username'], math.inf, links)
+        self.broadcast_peer_update(new_peer_id=peer_id, new_peer_info=entry)
+
+    def apply_remote_leave(self, owner: int, peer_id: str):
+        if peer_id in self.owned or self.peer_owner.get(peer_id, owner) != owner:
+            return # Baja atrasada de un dueño anterior
+        self.peer_owner.pop(peer_id, None)
+        with self.peers_lock:
+            removed = self.drop_peer(peer_id)
+        if removed:
+            self.broadcast_peer_update(removed_peer_id=peer_id)
+
+
+def _worker_main(worker_id: int, host: str, port: int, inboxes: list, metrics_port: int | None,
+                 bootstrap_contacts: int):
+    server = ShardedDiscoveryServer(host, port, worker_id, inboxes, bootstrap_contacts)
+    if metrics_port:
+        serve_http(server.metrics, metrics_port + worker_id)
+    server.start()
+
+
+def run_workers(host: str, port: int, workers: int, metrics_port: int | None = None,
+                bootstrap_contacts: int = 0):
+    """
+    Lanza `workers` procesos sobre el mismo puerto y espera. Si uno termina,
+    se detienen todos (su lista no se puede reconstruir desde los demás).
+    Con metrics_port, el worker i expone sus métricas en metrics_port + i.
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("Esta plataforma no soporta SO_REUSEPORT; usar un solo proceso")
+
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    processes = [
+        multiprocessing.Process(target=_worker_main, args=(i, host, port, inboxes, metrics_port, bootstrap_contacts),
+                                name=f"discovery-worker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    if threading.current_thread() is threading.main_thread():
+        # Con SIGTERM también se detienen los workers (el finally no corre si no)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    log.info("[Workers] %s workers escuchando en %s:%s", workers, host, port)
+
+    try:
+        multiprocessing.connection.wait([p.sentinel for p in processes])
+        for process in processes:
+            if not process.is_alive():
+                log.error("[Workers] %s terminó (código %s). Deteniendo el resto.", process.name, process.exitcode)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
@@ -0,0 +1,56 @@
+"""#### Directorio de Peers Consultados al Servidor
+
+Un peer con vista parcial (o que solo pidió contactos en el REGISTER) no
+tiene la lista completa: a los peers que necesita (el remitente de un
+mensaje, un destino elegido en la UI) los consulta al servidor con
+GET_PEERS. El directorio guarda esas respuestas para no repetir la consulta
+en cada mensaje.
+
+- LRU acotado a DIRECTORY_MAX entradas.
+- Cada entrada vence a los DIRECTORY_TTL segundos: el peer pudo irse sin que
+  nos enteremos. La lista local, que sí sigue altas y bajas, tiene prioridad.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+DIRECTORY_TTL = 60.0  # Segundos que vale una entrada consultada
+DIRECTORY_MAX = 1024  # Entradas recordadas (LRU)
+
+
+class PeerDirectory:
+    def __init__(self, ttl: float = DIRECTORY_TTL, max_entries: int = DIRECTORY_MAX, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict() # { peer_id: (vence, info) }
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, peer_id: str) -> dict | None:
+        with self.lock:
+            entry = self.entries.get(peer_id)
+            if entry is None:
+                return None
+            if entry[0] < self.clock():
+                del self.entries[peer_id]
+                return None
+            self.entries.move_to_end(peer_id)
+            return entry[1]
+
+    def update(self, peers: dict):
+        """Guarda las entradas de una respuesta GET_PEERS: { peer_id: info }."""
+        expires = self.clock() + self.ttl
+        with self.lock:
+            for peer_id, info in peers.items():
+                self.entries[peer_id] = (expires, info)
+                self.entries.move_to_end(peer_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, peer_id: str):
+        with self.lock:
+            self.entries.pop(peer_id, None)
@@ -0,0 +1,306 @@
+"""#### Transferencia de Archivos entre Peers
+
+Los archivos se dividen en chunks de CHUNK_SIZE bytes, cada uno con su
+hash SHA-256. El ID del archivo es el hash de la concatenación de los
+hashes de sus chunks, así verificar todos los chunks verifica el archivo.
+
+- Envío: header MSG_FILE_DATA + bytes crudos con socket.sendfile (zero-copy).
+- Recepción: recv_into sobre un buffer fijo y escritura directa a disco.
+- Reanudación: los chunks ya válidos del archivo ".part" no se vuelven a
+  pedir, y un chunk cortado a la mitad se retoma desde su offset.
+- Paralelismo: los chunks se reparten entre todos los peers que tienen el archivo.
+"""
+
+import hashlib
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common.local_link import connect_peer
+from common.protocol import create_message, parse_message, MSG_FILE_GET, MSG_FILE_DATA
+from common.stream import FrameReader
+from common.log import get_logger
+
+log = get_logger("files")
+
+CHUNK_SIZE = 1024 * 1024   # 1 MiB por chunk (unidad de hash y de descarga paralela)
+RECV_BUFFER_SIZE = 64 * 1024
+MAX_PARALLEL_CHUNKS = 8    # Descargas de chunks simultáneas
+PARTIAL_SUFFIX = ".part"
+SOCKET_TIMEOUT = 10.0
+
+
+def hash_file(path: str, chunk_size: int = CHUNK_SIZE) -> tuple[str, list[str]]:
+    """Devuelve (file_id, [hash de cada chunk]) leyendo el archivo una vez."""
+    chunk_hashes = []
+    buf = bytearray(min(chunk_size, RECV_BUFFER_SIZE))
+    view = memoryview(buf)
+    with open(path, 'rb') as f:
+        while True:
+            h = hashlib.sha256()
+            remaining = chunk_size
+            while remaining:
+                n = f.readinto(view[:min(remaining, len(buf))])
+                if not n:
+                    break
+                h.update(view[:n])
+                remaining -= n
+            if remaining == chunk_size:
+                break # EOF exacto al inicio de un chunk
+            chunk_hashes.append(h.hexdigest())
+            if remaining:
+                break
+    return file_id_from_chunks(chunk_hashes), chunk_hashes
+
+
+def file_id_from_chunks(chunk_hashes: list[str]) -> str:
+    return hashlib.sha256(b"".join(bytes.fromhex(h) for h in chunk_hashes)).hexdigest()
+
+
+class FileTransferError(Exception):
+    pass
+
+
+def check_meta(meta: dict):
+    """
+    Tamaños de un FILE_OFFER ajeno coherentes con sus hashes: size decide
+    cuánto se preasigna en disco y chunk_size dónde se escribe cada chunk.
+    """
+    size, chunk_size, chunk_hashes = meta.get('size'), meta.get('chunk_size'), meta.get('chunk_hashes')
+    if (not isinstance(size, int) or not isinstance(chunk_size, int) or not isinstance(chunk_hashes, list)
+            or size < 0 or chunk_size <= 0 or len(chunk_hashes) != -(-size // chunk_size)):
+        raise FileTransferError(f"Metadatos inválidos para {meta.get('name')!r}: "
+                                f"{size} bytes en {len(chunk_hashes or ())} chunks de {chunk_size}")
+
+
+def safe_name(name) -> str:
+    """
+    Nombre de archivo de un FILE_OFFER ajeno, sin directorios. El nombre lo
+    elige el otro peer: "../../.bashrc" o una ruta absoluta escribirían fuera
+    de download_dir.
+    """
+    base = os.path.basename(name) if isinstance(name, str) else ""
+    if base in ("", ".", "..") or base != name:
+        raise FileTransferError(f"Nombre de archivo inválido: {name!r}")
+    return base
+
+
+class FileShare:
+    def __init__(self, download_dir: str = "downloads"):
+        self.download_dir = download_dir
+        # Archivos que este peer puede servir: { file_id: {"path": str, "meta": dict} }
+        self.shared = {}
+        # Metadatos de archivos ofrecidos por otros: { file_id: meta }
+        self.offers = {}
+        # Quién tiene cada archivo: { file_id: set(peer_id) }
+        self.holders = {}
+        self.lock = threading.Lock()
+
+    # --- Registro de Archivos ---
+
+    def share(self, path: str) -> dict:
+        """Publica un archivo local. Devuelve los metadatos para MSG_FILE_OFFER."""
+        file_id, chunk_hashes = hash_file(path)
+        meta = {
+            "file_id": file_id,
+            "name": os.path.basename(path),
+            "size": os.path.getsize(path),
+            "chunk_size": CHUNK_SIZE,
+            "chunk_hashes": chunk_hashes,
+        }
+        with self.lock:
+            self.shared[file_id] = {"path": path, "meta": meta}
+        return meta
+
+    def add_offer(self, peer_id: str, meta: dict) -> bool:
+        """Registra un FILE_OFFER. False (y se ignora) si el nombre no es seguro."""
+        try:
+            safe_name(meta.get('name'))
+        except FileTransferError as e:
+            log.warning("[Files] Oferta de %s descartada: %s", peer_id, e)
+            return False
+        with self.lock:
+            self.offers.setdefault(meta['file_id'], meta)
+            self.holders.setdefault(meta['file_id'], set()).add(peer_id)
+        return True
+
+    def add_holder(self, peer_id: str, file_id: str):
+        with self.lock:
+            self.holders.setdefault(file_id, set()).add(peer_id)
+
+    def remove_holder(self, peer_id: str):
+        with self.lock:
+            for holders in self.holders.values():
+                holders.discard(peer_id)
+
+    # --- Lado Servidor ---
+
+    def serve_chunk(self, conn: socket.socket, request: dict):
+        """Responde un MSG_FILE_GET: header + bytes crudos vía sendfile."""
+        file_id = request.get('file_id')
+        offset = request.get('offset', 0)
+        length = request.get('length', 0)
+
+        with self.lock:
+            entry = self.shared.get(file_id)
+
+        if not entry or offset < 0 or length < 0 or offset + length > entry['meta']['size']:
+            header = create_message(MSG_FILE_DATA, content={
+                "file_id": file_id, "offset": offset, "length": 0, "error": "not_available"
+            })
+            conn.sendall(header)
+            return
+
+        header = create_message(MSG_FILE_DATA, content={
+            "file_id": file_id, "offset": offset, "length": length
+        })
+        conn.sendall(header)
+        with open(entry['path'], 'rb') as f:
+            # Usa os.sendfile cuando está disponible: el kernel copia directo
+            conn.sendfile(f, offset, length)
+
+    # --- Lado Cliente ---
+
+    def download(self, file_id: str, resolve_addr, dest_path: str | None = None) -> str:
+        """
+        Descarga un archivo ofrecido, repartiendo chunks entre sus holders.
+        resolve_addr(peer_id) -> (ip, port) | (ip, port, uds) | None
+        """
+        with self.lock:
+            meta = self.offers.get(file_id)
+            holders = list(self.holders.get(file_id, ()))
+        if not meta:
+            raise FileTransferError(f"Archivo {file_id} desconocido")
+        if file_id_from_chunks(meta['chunk_hashes']) != file_id:
+            raise FileTransferError(f"Metadatos de {meta['name']} no coinciden con su ID")
+        check_meta(meta)
+
+        sources = [(pid, addr) for pid in holders if (addr := resolve_addr(pid))]
+        if not sources:
+            raise FileTransferError(f"Nadie disponible tiene {meta['name']}")
+
+        if dest_path is None:
+            os.makedirs(self.download_dir, exist_ok=True)
+            download_dir = os.path.realpath(self.download_dir)
+            dest_path = os.path.realpath(os.path.join(download_dir, safe_name(meta['name'])))
+            if os.path.dirname(dest_path) != download_dir:
+                # Ej. un symlink ya existente con ese nombre
+                raise FileTransferError(f"{meta['name']} queda fuera de {self.download_dir}")
+        part_path = dest_path + PARTIAL_SUFFIX
+
+        # Preasignar el .part (o reutilizarlo para reanudar)
+        mode = 'r+b' if os.path.exists(part_path) else 'w+b'
+        with open(part_path, mode) as f:
+            f.truncate(meta['size'])
+
+        missing = self._missing_chunks(part_path, meta)
+        log.info("[Files] Descargando %s: %d/%d chunks de %d peers", meta['name'], len(missing), len(meta['chunk_hashes']), len(sources))
+
+        workers = max(1, min(MAX_PARALLEL_CHUNKS, len(missing)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self._fetch_chunk, part_path, meta, index, sources, i)
+                for i, index in enumerate(missing)
+            ]
+            failed = [f.exception() for f in futures if f.exception()]
+        if failed:
+            raise FileTransferError(f"{len(failed)} chunks fallaron: {failed[0]}")
+
+        # El .part completo debe ser exactamente el archivo ofrecido
+        if os.path.getsize(part_path) != meta['size'] or self._missing_chunks(part_path, meta):
+            raise FileTransferError(f"{meta['name']} no pasó la verificación final")
+        os.replace(part_path, dest_path)
+        with self.lock:
+            self.shared[file_id] = {"path": dest_path, "meta": meta}
+        log.info("[Files] %s descargado y verificado en %s", meta['name'], dest_path)
+        return dest_path
+
+    def _missing_chunks(self, part_path: str, meta: dict) -> list[int]:
+        """Chunks cuyo contenido en el .part no coincide con su hash."""
+        missing = []
+        chunk_size = meta['chunk_size']
+        with open(part_path, 'rb') as f:
+            for index, expected in enumerate(meta['chunk_hashes']):
+                f.seek(index * chunk_size)
+                data = f.read(chunk_size)
+                if hashlib.sha256(data).hexdigest() != expected:
+                    missing.append(index)
+        return missing
+
+    def _fetch_chunk(self, part_path: str, meta: dict, index: int, sources: list, start: int):
+        """Descarga un chunk probando los holders en orden rotado (start)."""
+        chunk_size = meta['chunk_size']
+        offset = index * chunk_size
+        length = min(chunk_size, meta['size'] - offset)
+        hasher = hashlib.sha256()
+        done = 0
+        last_error = None
+
+        with open(part_path, 'r+b') as f:
+            for attempt in range(len(sources)):
+                peer_id, addr = sources[(start + attempt) % len(sources)]
+                try:
+                    # Si el holder anterior cortó a la mitad, se retoma desde offset + done
+                    done += self._receive_range(f, addr, meta['file_id'], offset + done, length - done, hasher)
+                except (OSError, FileTransferError) as e:
+                    last_error = e
+                    continue
+                if done < length:
+                    last_error = FileTransferError(f"Chunk {index} cortado en {done}/{length} bytes")
+                    continue
+
+                if hasher.hexdigest() == meta['chunk_hashes'][index]:
+                    return
+                # Datos corruptos: descartar y pedir el chunk entero a otro
+                hasher = hashlib.sha256()
+                done = 0
+                last_error = FileTransferError(f"Hash inválido en chunk {index} desde {peer_id}")
+
+        raise last_error or FileTransferError(f"Chunk {index} sin fuentes")
+
+    def _receive_range(self, f, addr: tuple, file_id: str, offset: int, length: int, hasher) -> int:
+        """
+        Pide [offset, offset+length) y lo escribe en f. Devuelve los bytes
+        escritos, que pueden ser menos si la conexión se corta a la mitad.
+        """
+        written = 0
+        with connect_peer(addr, timeout=SOCKET_TIMEOUT) as s:
+            s.sendall(create_message(MSG_FILE_GET, content={
+                "file_id": file_id, "offset": offset, "length": length
+            }))
+
+            # Leer el header (línea JSON); lo que sobra ya son datos del archivo
+            reader = FrameReader(s, initial_size=RECV_BUFFER_SIZE)
+            header_data = reader.read_frame()
+            if header_data is None:
+                raise FileTransferError("Conexión cerrada antes del header")
+            header = parse_message(header_data)
+            if not header or header['type'] != MSG_FILE_DATA or header['content'].get('error'):
+                raise FileTransferError(f"Respuesta inválida: {header}")
+            if header['content'].get('length') != length:
+                # Un rango más largo pisaría chunks ya verificados del .part
+                raise FileTransferError(f"Se pidieron {length} bytes y el holder anuncia {header['content'].get('length')}")
+
+            f.seek(offset)
+            pending = reader.buffered()[:length]
+            if pending:
+                f.write(pending)
+                hasher.update(pending)
+                written += len(pending)
+
+            buf = bytearray(RECV_BUFFER_SIZE)
+            view = memoryview(buf)
+            try:
+                while written < length:
+                    n = s.recv_into(view, min(len(buf), length - written))
+                    if not n:
+                        break
+                    f.write(view[:n])
+                    hasher.update(view[:n])
+                    written += n
+            except OSError:
+                pass # Corte a mitad: lo escrito sigue siendo válido para reanudar
+            finally:
+                f.flush()
+        return written
@@ -0,0 +1,430 @@
+"""#### Host Multi-Peer (Bucle de Eventos Compartido)
+
+Un PeerNode con start() usa sus propios hilos: escucha P2P, uno por cada
+conexión entrante, descubrimiento/heartbeat, gossip, timer de entrega
+confiable, recepción UDP y uno por destino en el outbox. Con un peer por
+sesión de web_chat.py eso son decenas de hilos por usuario.
+
+PeerHost corre muchos PeerNode lógicos en un proceso:
+
+- Un solo hilo con un selector vigila los sockets de todos los peers
+  (escucha, conexiones entrantes, servidor de descubrimiento y UDP).
+- Los timers (heartbeat, gossip, outbox, entrega confiable) son una cola
+  de prioridad en ese hilo, no un hilo con sleep por peer.
+- Procesar frames y responder, los heartbeats y la entrega confiable
+  corren en un pool de HOST_WORKERS hilos compartido. Mientras una conexión
+  se procesa en el pool sale del selector, así sus frames se procesan en orden.
+- Lo que espera a la red con timeouts de segundos (registrarse, un ciclo de
+  gossip, escribir un lote) corre en otro pool, de HOST_IO_WORKERS hilos, y
+  servir chunks de archivo en un tercero, de HOST_TRANSFER_WORKERS: peers
+  que se esperan entre sí o descargas lentas no demoran heartbeats, handlers
+  ni mensajes salientes (y nadie da por muerto a otro).
+
+Cada peer conserva su puerto, su lista y su conexión con el servidor: para
+el resto de la red no hay diferencia. Uso:
+
+    host = PeerHost()
+    peer = PeerNode("ana", 10001)
+    peer.start(host=host)
+"""
+
+import heapq
+import itertools
+import random
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.datagram import DatagramChannel
+from common.log import get_logger
+from common.metrics import MetricsRegistry
+from common.stream import FrameReader
+from peer.reliable import ACK_DELAY
+from peer.peer_node import RECONNECT_INTERVAL, SYNC_TIMEOUT
+
+log = get_logger("host")
+
+HOST_WORKERS = 16      # Hilos del pool de handlers compartido por todos los peers
+HOST_IO_WORKERS = 32   # Hilos del pool de E/S bloqueante (conexiones salientes)
+HOST_TRANSFER_WORKERS = 8 # Chunks de archivo servidos a la vez (el resto espera turno)
+LISTEN_BACKLOG = 32
+MAX_SELECT_WAIT = 1.0  # Segundos máximos en select() sin revisar timers
+
+
+class _Tenant:
+    """Un PeerNode alojado y los sockets que el host vigila por él."""
+
+    def __init__(self, peer):
+        self.peer = peer
+        self.active = True
+        self.listener = None
+        self.connections = set() # Conexiones P2P entrantes abiertas
+        self.handed_off = set()  # Conexiones que pasaron al pool de transferencias (ver hand_off)
+
+
+class PeerHost:
+    def __init__(self, workers: int = HOST_WORKERS, io_workers: int = HOST_IO_WORKERS,
+                 transfer_workers: int = HOST_TRANSFER_WORKERS):
+        self.selector = selectors.DefaultSelector()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="peer-host")
+        self.io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="peer-host-io")
+        self.transfer_pool = ThreadPoolExecutor(max_workers=transfer_workers, thread_name_prefix="peer-host-files")
+        self.tenants = {} # { PeerNode: _Tenant }
+        self.tenants_lock = threading.Lock()
+
+        # Timers: [(cuándo, orden, callback, args)]; los agrega cualquier hilo
+        self.timers = []
+        self.timer_order = itertools.count()
+        self.timers_lock = threading.Lock()
+        # Callbacks pedidos desde otros hilos para correr en el bucle
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, self._drain_wakeup)
+
+        self.metrics = MetricsRegistry()
+        self.metrics.gauge("host_peers", "Peers alojados", fn=lambda: len(self.tenants))
+        self.metrics.gauge("host_watched_sockets", "Sockets en el selector", fn=lambda: len(self.selector.get_map()))
+        self.metrics.gauge("host_timers", "Timers programados", fn=lambda: len(self.timers))
+        self.task_errors = self.metrics.counter("host_task_errors_total", "Tareas del pool que terminaron con error")
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="peer-host-loop", daemon=True)
+        self.thread.start()
+        self.call_later(ACK_DELAY / 2, self.submit, self._reliability_round)
+
+    # --- Bucle, timers y pool ---
+
+    def call_soon(self, callback, *args):
+        """Corre callback en el hilo del bucle (desde cualquier hilo)."""
+        with self.pending_lock:
+            self.pending.append((callback, args))
+        self._wakeup()
+
+    def call_later(self, delay: float, callback, *args):
+        """Corre callback en el hilo del bucle dentro de `delay` segundos (desde cualquier hilo)."""
+        when = time.monotonic() + delay
+        with self.timers_lock:
+            heapq.heappush(self.timers, (when, next(self.timer_order), callback, args))
+            earliest = self.timers[0][0] == when
+        if earliest and threading.current_thread() is not self.thread:
+            self._wakeup() # El select() en curso puede estar esperando más que esto
+
+    def submit(self, fn, *args):
+        """Corre fn en el pool compartido; los errores se loguean, no se propagan."""
+        if self.running:
+            self.pool.submit(self._guarded, fn, *args)
+
+    def submit_io(self, fn, *args):
+        """Como submit(), en el pool de E/S: para fn que esperan a la red (connect, recv, sendfile)."""
+        if self.running:
+            self.io_pool.submit(self._guarded, fn, *args)
+
+    def hand_off(self, peer, conn: socket.socket, fn, *args):
+        """
+        Lo llama un handler desde _read_p2p: el resto de la conexión (de un
+        solo uso, ej. un FILE_GET) queda a cargo de fn en el pool de
+        transferencias, que la cierra al terminar. El host deja de leerla.
+        """
+        tenant = self.tenants.get(peer)
+        if tenant:
+            tenant.handed_off.add(conn)
+            tenant.connections.discard(conn)
+        if self.running:
+            self.transfer_pool.submit(self._guarded, self._serve_handed_off, conn, fn, *args)
+        else:
+            conn.close()
+
+    def _serve_handed_off(self, conn: socket.socket, fn, *args):
+        try:
+            fn(*args)
+        except (ConnectionResetError, BrokenPipeError):
+            pass # El otro lado cortó (como en handle_p2p_connection)
+        except OSError as e:
+            log.warning("[P2P] Error sirviendo una conexión: %s", e)
+        finally:
+            conn.close()
+
+    def _guarded(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self.task_errors.inc()
+            log.exception("[Host] Error en %s: %s", getattr(fn, "__name__", fn), e)
+
+    def _wakeup(self):
+        try:
+            self._wakeup_send.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass # Ya hay un byte pendiente (o el host se cerró)
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        while self.running:
+            timeout = self._run_due_timers()
+            for key, _ in self.selector.select(timeout):
+                self._run_callback(key.data)
+            with self.pending_lock:
+                pending, self.pending = self.pending, []
+            for callback, args in pending:
+                self._run_callback(callback, *args)
+
+    def _run_due_timers(self) -> float:
+        """Corre los timers vencidos; devuelve cuánto puede esperar select()."""
+        while True:
+            with self.timers_lock:
+                if not self.timers:
+                    return MAX_SELECT_WAIT
+                wait = self.timers[0][0] - time.monotonic()
+                if wait > 0:
+                    return min(wait, MAX_SELECT_WAIT)
+                _, _, callback, args = heapq.heappop(self.timers)
+            self._run_callback(callback, *args)
+
+    def _run_callback(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            log.exception("[Host] Error en el bucle: %s", e)
+
+    # --- Sockets ---
+
+    def _register(self, tenant: _Tenant, sock: socket.socket, callback):
+        # En el hilo del bucle. El peer pudo detenerse o el socket cerrarse mientras tanto
+        if tenant.active and sock.fileno() != -1:
+            try:
+                self.selector.register(sock, selectors.EVENT_READ, callback)
+            except (KeyError, ValueError):
+                pass # Ya vigilado
+
+    def _unregister(self, sock: socket.socket | None):
+        if sock is None:
+            return
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _close(self, sock: socket.socket):
+        self._unregister(sock)
+        sock.close()
+
+    def watch(self, tenant: _Tenant, sock: socket.socket, on_readable):
+        """
+        Vigila un socket con datos a procesar en el pool: on_readable() corre
+        con el socket fuera del selector (un lector a la vez) y, si devuelve
+        True, el socket vuelve a vigilarse.
+        """
+        def ready():
+            self._unregister(sock)
+            self.submit(serve)
+
+        def serve():
+            keep = False
+            try:
+                keep = on_readable()
+            finally:
+                if keep:
+                    self.call_soon(self._register, tenant, sock, ready)
+
+        self.call_soon(self._register, tenant, sock, ready)
+
+    # --- Peers ---
+
+    def add_peer(self, peer):
+        """Arranca un PeerNode en el host (lo llama PeerNode.start(host=...))."""
+        tenant = _Tenant(peer)
+        peer.outbox.host = self
+
+        if peer.use_udp:
+            try:
+                peer.datagrams = DatagramChannel('0.0.0.0', peer.listening_port, peer.handle_datagram, thread=False)
+            except OSError as e:
+                log.warning("[UDP] No se pudo abrir el puerto UDP %s: %s. Usando solo TCP.", peer.listening_port, e)
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind(('0.0.0.0', peer.listening_port))
+            listener.listen(LISTEN_BACKLOG)
+        except OSError:
+            listener.close()
+            if peer.datagrams:
+                peer.datagrams.close()
+            raise
+        listener.setblocking(False)
+        tenant.listener = peer.server_socket = listener
+        peer.open_local_listener(LISTEN_BACKLOG)
+        if peer.local_socket:
+            peer.local_socket.setblocking(False)
+
+        with self.tenants_lock:
+            self.tenants[peer] = tenant
+        self.call_soon(self._register, tenant, listener, lambda: self._accept(tenant, listener))
+        if peer.local_socket:
+            local_socket = peer.local_socket
+            self.call_soon(self._register, tenant, local_socket, lambda: self._accept(tenant, local_socket))
+        if peer.datagrams:
+            channel = peer.datagrams
+            self.call_soon(self._register, tenant, channel.sock, channel.receive_ready)
+
+        self.submit_io(self._connect_discovery, tenant)
+        # Fase de gossip al azar: los ciclos de todos los peers no caen juntos
+        self.call_later(random.uniform(0, peer.gossip_interval), self._gossip, tenant)
+        log.info("[Host] Peer %s alojado en el puerto %s (%s peers)", peer.peer_id, peer.listening_port, len(self.tenants))
+
+    def remove_peer(self, peer):
+        """Deja de vigilar los sockets del peer (lo llama PeerNode.stop())."""
+        with self.tenants_lock:
+            tenant = self.tenants.pop(peer, None)
+        if not tenant:
+            return
+        tenant.active = False # Timers y tareas pendientes del peer terminan solos
+        detached = threading.Event()
+
+        def detach():
+            for sock in (tenant.listener, peer.local_socket, peer.discovery_socket,
+                         peer.datagrams.sock if peer.datagrams else None, *tenant.connections):
+                self._unregister(sock)
+            detached.set()
+
+        self.call_soon(detach)
+        if threading.current_thread() is not self.thread:
+            detached.wait(MAX_SELECT_WAIT * 2)
+        for conn in list(tenant.connections):
+            conn.close()
+        log.info("[Host] Peer %s retirado (%s peers)", peer.peer_id, len(self.tenants))
+
+    def stop(self):
+        """Detiene todos los peers alojados y el host."""
+        with self.tenants_lock:
+            peers = list(self.tenants)
+        for peer in peers:
+            peer.stop()
+        self.running = False
+        self._wakeup()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        self.transfer_pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Conexiones P2P entrantes (start_p2p_listener / handle_p2p_connection) ---
+
+    def _accept(self, tenant: _Tenant, listener: socket.socket):
+        try:
+            conn, addr = listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        addr = addr or "local" # Los sockets Unix no tienen dirección de origen
+        conn.settimeout(SYNC_TIMEOUT) # Solo para escrituras: se lee cuando el selector avisa
+        tenant.connections.add(conn)
+        reader = FrameReader(conn)
+        self.watch(tenant, conn, lambda: self._read_p2p(tenant, conn, addr, reader))
+
+    def _read_p2p(self, tenant: _Tenant, conn: socket.socket, addr: tuple, reader: FrameReader) -> bool:
+        peer = tenant.peer
+        try:
+            if reader.fill():
+                while tenant.active and (frame := reader.next_frame()) is not None:
+                    peer.handle_p2p_frame(conn, addr, frame)
+                    if conn in tenant.handed_off:
+                        tenant.handed_off.discard(conn)
+                        return False # Ahora la usa (y la cierra) el pool de transferencias
+                if tenant.active:
+                    return True
+        except socket.timeout:
+            return tenant.active
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        except Exception as e:
+            if tenant.active: # Si no, el peer se detuvo y cerró la conexión
+                log.warning("[P2P] Error en conexión P2P con %s: %s", addr, e)
+        tenant.connections.discard(conn)
+        conn.close()
+        return False
+
+    # --- Servidor de descubrimiento (connect_to_discovery / start_discovery_heartbeat) ---
+
+    def _connect_discovery(self, tenant: _Tenant):
+        peer = tenant.peer
+        if not tenant.active:
+            return
+        if not peer.register_with_discovery(timeout=SYNC_TIMEOUT):
+            self.call_later(RECONNECT_INTERVAL, self.submit_io, self._connect_discovery, tenant)
+            return
+        sock = peer.discovery_socket
+        # Updates que llegaron junto al ACK
+        peer.process_discovery_frames()
+        self.watch(tenant, sock, lambda: self._read_discovery(tenant, sock))
+        self.call_later(peer.heartbeat_interval, self.submit, self._heartbeat, tenant, sock)
+
+    def _read_discovery(self, tenant: _Tenant, sock: socket.socket) -> bool:
+        peer = tenant.peer
+        if not tenant.active or peer.discovery_socket is not sock:
+            return False
+        try:
+            if not peer.discovery_reader.fill():
+                raise ConnectionError("Servidor cerró la conexión")
+            peer.process_discovery_frames()
+            return True
+        except socket.timeout:
+            return True
+        except OSError as e:
+            self._discovery_lost(tenant, sock, e)
+            return False
+
+    def _heartbeat(self, tenant: _Tenant, sock: socket.socket):
+        peer = tenant.peer
+        if not tenant.active or peer.discovery_socket is not sock:
+            return # Peer detenido o conexión reemplazada
+        try:
+            peer.send_heartbeat()
+        except OSError as e:
+            self._discovery_lost(tenant, sock, e)
+            return
+        self.call_later(peer.heartbeat_interval, self.submit, self._heartbeat, tenant, sock)
+
+    def _discovery_lost(self, tenant: _Tenant, sock: socket.socket, error: Exception):
+        peer = tenant.peer
+        if not tenant.active or peer.discovery_socket is not sock:
+            return # Peer detenido (stop() cierra el socket) o conexión ya reemplazada
+        log.warning("[Heartbeat] Error en conexión con servidor: %s. Servidor caído.", error)
+        peer.discovery_server_status = "DOWN"
+        peer.discovery_socket = None
+        # Sacarlo del selector antes de cerrarlo: su número de fd se puede reutilizar
+        self.call_soon(self._close, sock)
+        self.call_later(RECONNECT_INTERVAL, self.submit_io, self._connect_discovery, tenant)
+
+    # --- Timers compartidos ---
+
+    def _gossip(self, tenant: _Tenant):
+        if tenant.active:
+            self.submit_io(self._gossip_round, tenant) # SYNC y PING esperan respuestas de otros peers
+
+    def _gossip_round(self, tenant: _Tenant):
+        try:
+            tenant.peer.gossip_round()
+        finally:
+            # El próximo ciclo se cuenta desde el fin de este, como en start_gossip_protocol
+            if tenant.active:
+                self.call_later(tenant.peer.gossip_interval, self._gossip, tenant)
+
+    def _reliability_round(self):
+        """Un solo timer para la entrega confiable de todos los peers."""
+        try:
+            with self.tenants_lock:
+                peers = list(self.tenants)
+            for peer in peers:
+                peer.reliability_round()
+        finally:
+            if self.running:
+                self.call_later(ACK_DELAY / 2, self.submit, self._reliability_round)
@@ -0,0 +1,145 @@
+"""#### Lista de Peers con Snapshots Inmutables (Copy-on-Write)
+
+La lista de peers se lee mucho más de lo que se escribe: cada envío, cada
+ciclo de gossip, cada SYNC_PEERS_REQUEST y cada refresco de la UI la
+consultan, y solo cambia cuando alguien entra o sale. En lugar de un dict
+protegido por un lock que también toman los lectores, cada escritura arma
+un PeerListSnapshot nuevo y lo publica reemplazando una referencia (atómico
+en CPython). Los lectores toman la referencia una vez y trabajan sobre una
+versión que nadie va a modificar, sin lock.
+
+Las escrituras se serializan entre sí con un lock propio y cuestan O(n)
+(copia del dict); una fusión de gossip que no trae nada nuevo no publica
+versión. Las estructuras derivadas (lista de los demás para el sorteo,
+índice ordenado para buscar por username, digest para los pings de gossip)
+se calculan una vez por versión, la primera vez que alguien las pide.
+"""
+
+import bisect
+import hashlib
+import random
+import threading
+from functools import cached_property
+from types import MappingProxyType
+
+
+class PeerListSnapshot:
+    """Versión inmutable de la lista: { peer_id: {"ip", "port", "username"} }."""
+
+    def __init__(self, peers: dict, version: int, self_id: str | None):
+        self._peers = peers # Nadie más tiene referencia: no se modifica después de publicar
+        self.peers = MappingProxyType(peers)
+        self.version = version
+        self.self_id = self_id
+
+    def __len__(self) -> int:
+        return len(self._peers)
+
+    def __contains__(self, peer_id: str) -> bool:
+        return peer_id in self._peers
+
+    def get(self, peer_id: str) -> dict | None:
+        return self._peers.get(peer_id)
+
+    @cached_property
+    def others(self) -> tuple[tuple[str, dict], ...]:
+        """(peer_id, info) de todos menos uno mismo."""
+        return tuple((pid, p) for pid, p in self._peers.items() if pid != self.self_id)
+
+    @cached_property
+    def sorted_ids(self) -> tuple[str, ...]:
+        """
+        IDs de los demás, ordenados. Un ID empieza con "username@": los de un
+        prefijo de username son un rango contiguo.
+        """
+        return tuple(sorted(pid for pid, _ in self.others))
+
+    def search(self, prefix: str | None = None, after: str | None = None,
+               limit: int | None = None) -> tuple[tuple[str, ...], str | None, int]:
+        """
+        Una página de los demás por prefijo de username, con la forma de
+        GET_PEERS: (ids, cursor siguiente | None, total de coincidencias).
+        """
+        ids = self.sorted_ids
+        lo, hi = 0, len(ids)
+        if prefix:
+            lo = bisect.bisect_left(ids, prefix)
+            hi = bisect.bisect_left(ids, prefix + "\U0010ffff", lo)
+        start = bisect.bisect_right(ids, after, lo, hi) if after else lo
+        page = ids[start:hi if limit is None else min(start + limit, hi)]
+        more = start + len(page) < hi
+        return page, (page[-1] if more and page else None), hi - lo
+
+    @cached_property
+    def digest(self) -> dict:
+        """{"n", "h"}: resumen de los IDs para comparar listas en un ping UDP."""
+        h = hashlib.blake2b(digest_size=8)
+        for pid in sorted(self._peers):
+            h.update(pid.encode())
+            h.update(b"\n")
+        return {"n": len(self._peers), "h": h.hexdigest()}
+
+    def random_other(self, rng=random) -> tuple[str, dict] | None:
+        """(peer_id, info) al azar entre los demás, en O(1) sobre la lista precalculada."""
+        others = self.others
+        if not others:
+            return None
+        return others[rng.randrange(len(others))]
+
+    def as_dict(self) -> dict:
+        """El dict de la versión, para serializarlo sin copia (no modificar)."""
+        return self._peers
+
+
+class PeerList:
+    """Publica PeerListSnapshot nuevos en cada escritura; leer es tomar .snapshot."""
+
+    def __init__(self, self_id: str | None = None):
+        self.lock = threading.Lock() # Solo entre escritores
+        self.snapshot = PeerListSnapshot({}, 0, self_id)
+
+    def _publish(self, peers: dict, self_id: str | None = None) -> PeerListSnapshot:
+        # Llamar con self.lock tomado
+        current = self.snapshot
+        self.snapshot = PeerListSnapshot(peers, current.version + 1,
+                                         current.self_id if self_id is None else self_id)
+        return self.snapshot
+
+    def set_self(self, self_id: str):
+        """Cambia la identidad propia (ej. el ID oficial que asigna el servidor)."""
+        with self.lock:
+            current = self.snapshot
+            if current.self_id != self_id:
+                self._publish(current._peers, self_id)
+
+    def merge(self, new_list: dict) -> tuple[int, int]:
+        """
+        Fusiona entradas (las recibidas reemplazan a las propias). Devuelve
+        (peers antes, peers después). Sin cambios, no se publica versión.
+        """
+        with self.lock:
+            current = self.snapshot._peers
+            changed = {pid: info for pid, info in new_list.items() if current.get(pid) != info}
+            if not changed:
+                return len(current), len(current)
+            peers = dict(current)
+            peers.update(changed)
+            self._publish(peers)
+            return len(current), len(peers)
+
+    def replace(self, peers: dict):
+        """Reemplaza la lista entera (ej. activa + pasiva de la vista parcial). Sin cambios, no publica."""
+        with self.lock:
+            if peers != self.snapshot._peers:
+                self._publish(dict(peers))
+
+    def remove(self, peer_id: str) -> dict | None:
+        """Quita un peer; devuelve su info, o None si no estaba."""
+        with self.lock:
+            current = self.snapshot._peers
+            if peer_id not in current:
+                return None
+            peers = dict(current)
+            info = peers.pop(peer_id)
+            self._publish(peers)
+            return info
@@ -0,0 +1,226 @@
+"""#### Cola de Salida por Destino (Coalescing)
+
+Los mensajes hacia un mismo peer se juntan durante COALESCE_DELAY (o hasta
+COALESCE_MAX mensajes) y salen en una sola escritura como un MSG_BATCH,
+sobre una conexión TCP persistente por destino. A cambio de unos pocos
+milisegundos de latencia, se evitan una conexión y un sendall por mensaje.
+
+Por defecto cada destino tiene su hilo. Con un PeerHost (peer/host.py) no
+hay hilos propios: el lote se programa con un timer del host y se escribe
+en su pool de E/S, con un solo timer de inactividad por destino.
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+
+from common.local_link import connect_peer
+from common.protocol import build_message, encode_message, MSG_BATCH
+
+COALESCE_DELAY = 0.003  # Presupuesto de latencia por lote (3 ms)
+COALESCE_MAX = 64       # Mensajes que fuerzan el envío sin esperar más
+IDLE_TIMEOUT = 30.0     # Cerrar la conexión y el hilo del destino tras este tiempo sin tráfico
+SOCKET_TIMEOUT = 5.0
+
+
+class _Destination:
+    """Cola y conexión persistente hacia un único peer."""
+
+    def __init__(self, peer_id: str):
+        self.peer_id = peer_id
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.sock = None
+        self.thread = None
+        self.scheduled = False # Modo host: vaciado programado o en curso
+        self.idle_timer = False # Modo host: _close_if_idle programado
+        self.last_flush = 0.0
+
+
+class PeerOutbox:
+    def __init__(self, sender_id_fn, resolve_addr, on_failure, piggyback=None, metrics=None, tracer=None,
+                 host=None):
+        """
+        sender_id_fn() -> peer_id propio (puede cambiar tras el registro)
+        resolve_addr(peer_id) -> (ip, port) | (ip, port, uds) | None (ver common/local_link.py)
+        on_failure(peer_id): el destino no acepta conexiones
+        piggyback(peer_id) -> dict | None: campos extra para el lote (ej. "ack")
+        metrics: MetricsRegistry opcional donde contar mensajes, lotes y bytes
+        tracer: Tracer opcional para marcar las etapas de los mensajes trazados
+        host: PeerHost opcional (asignable antes del primer envío): timers y
+        pool compartidos en lugar de un hilo por destino
+        """
+        self.sender_id_fn = sender_id_fn
+        self.resolve_addr = resolve_addr
+        self.on_failure = on_failure
+        self.piggyback = piggyback
+        self.tracer = tracer
+        self.host = host
+        self.messages_sent = self.batches_sent = self.bytes_sent = None
+        if metrics:
+            self.messages_sent = metrics.counter("peer_messages_sent_total", "Mensajes P2P enviados")
+            self.batches_sent = metrics.counter("peer_batches_sent_total", "Escrituras al socket (lotes o sueltos)")
+            self.bytes_sent = metrics.counter("peer_bytes_sent_total", "Bytes P2P enviados")
+        self.destinations = {}
+        self.lock = threading.Lock()
+        self.running = True
+
+    def send(self, peer_id: str, message: dict):
+        """Encola un mensaje (dict sin codificar) hacia peer_id."""
+        with self.lock:
+            dest = self.destinations.get(peer_id)
+            if not dest:
+                dest = _Destination(peer_id)
+                self.destinations[peer_id] = dest
+        with dest.cond:
+            dest.pending.append(message)
+            if self.host:
+                if not dest.scheduled:
+                    dest.scheduled = True
+                    self.host.call_later(COALESCE_DELAY, self.host.submit_io, self._drain, dest)
+                return
+            if not dest.thread:
+                dest.thread = threading.Thread(target=self._run, args=(dest,), daemon=True)
+                dest.thread.start()
+            elif len(dest.pending) == 1 or len(dest.pending) >= COALESCE_MAX:
+                # Primer mensaje: el hilo puede estar esperando inactivo. Lote lleno: no esperar más
+                dest.cond.notify()
+
+    def drop(self, peer_id: str):
+        """Olvida un destino (peer eliminado): descarta la cola y cierra la conexión."""
+        with self.lock:
+            dest = self.destinations.pop(peer_id, None)
+        if dest:
+            with dest.cond:
+                dest.pending.clear()
+                dest.cond.notify()
+                if self.host and not dest.scheduled:
+                    self._close(dest) # Sin vaciado en curso que use el socket
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            dests = list(self.destinations.values())
+            self.destinations.clear()
+        for dest in dests:
+            with dest.cond:
+                dest.cond.notify()
+                if self.host and not dest.scheduled:
+                    self._close(dest)
+
+    def _run(self, dest: _Destination):
+        """Hilo del destino: junta lotes y los escribe."""
+        while self.running:
+            with dest.cond:
+                if not dest.pending:
+                    dest.cond.wait(IDLE_TIMEOUT)
+                if not dest.pending:
+                    # Inactivo (o descartado): liberar conexión y terminar
+                    self._close(dest)
+                    dest.thread = None
+                    break
+                # Dar tiempo a que lleguen más mensajes, salvo que ya haya un lote lleno
+                deadline = time.monotonic() + COALESCE_DELAY
+                while len(dest.pending) < COALESCE_MAX:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.running:
+                        break
+                    dest.cond.wait(remaining)
+                batch = [dest.pending.popleft() for _ in range(min(COALESCE_MAX, len(dest.pending)))]
+
+            if batch:
+                self._flush(dest, batch)
+
+        with self.lock, dest.cond:
+            if not self.running:
+                self._close(dest)
+            elif self.destinations.get(dest.peer_id) is dest and not dest.thread:
+                del self.destinations[dest.peer_id]
+
+    def _drain(self, dest: _Destination):
+        """Modo host: escribe lo pendiente del destino en lotes, en un hilo del pool."""
+        while self.running:
+            with dest.cond:
+                batch = [dest.pending.popleft() for _ in range(min(COALESCE_MAX, len(dest.pending)))]
+                if not batch:
+                    dest.scheduled = False
+                    break
+            self._flush(dest, batch)
+        dest.last_flush = time.monotonic()
+
+        with self.lock, dest.cond:
+            if not self.running or self.destinations.get(dest.peer_id) is not dest:
+                self._close(dest) # Destino descartado mientras se vaciaba
+                return
+            # Un timer por destino, no uno por lote: si ya hay uno, se re-arma al vencer
+            if dest.idle_timer:
+                return
+            dest.idle_timer = True
+        self.host.call_later(IDLE_TIMEOUT, self._close_if_idle, dest)
+
+    def _close_if_idle(self, dest: _Destination):
+        """Modo host: libera la conexión de un destino sin tráfico en IDLE_TIMEOUT."""
+        with self.lock, dest.cond:
+            idle = time.monotonic() - dest.last_flush
+            if dest.scheduled or dest.pending or idle < IDLE_TIMEOUT:
+                if self.running and self.destinations.get(dest.peer_id) is dest:
+                    # Hubo tráfico: volver a mirar cuando se cumpla IDLE_TIMEOUT desde el último lote
+                    delay = IDLE_TIMEOUT if dest.scheduled or dest.pending else IDLE_TIMEOUT - idle
+                    self.host.call_later(delay, self._close_if_idle, dest)
+                else:
+                    dest.idle_timer = False
+                return
+            dest.idle_timer = False
+            self._close(dest)
+            if self.destinations.get(dest.peer_id) is dest:
+                del self.destinations[dest.peer_id]
+
+    def _flush(self, dest: _Destination, batch: list[dict]):
+        if self.tracer:
+            flushed = time.time()
+            for message in batch:
+                self.tracer.stamp(message, "flushed", flushed)
+        extra = self.piggyback(dest.peer_id) if self.piggyback else None
+        if len(batch) == 1:
+            message = dict(batch[0]) # Copia: el original puede estar guardado para retransmitir
+            if extra:
+                message.update(extra)
+        else:
+            message = build_message(MSG_BATCH, sender_id=self.sender_id_fn(), to=dest.peer_id,
+                                    content=batch, **(extra or {}))
+        data = encode_message(message)
+        encoded = time.time()
+        connected = None
+
+        # Un reintento con conexión nueva: la persistente pudo cerrarse del otro lado
+        for _ in range(2):
+            try:
+                if not dest.sock:
+                    addr = self.resolve_addr(dest.peer_id)
+                    if not addr:
+                        return
+                    dest.sock = connect_peer(addr, timeout=SOCKET_TIMEOUT)
+                    connected = time.time()
+                dest.sock.sendall(data)
+                if self.tracer:
+                    self.tracer.record_sent(batch, encoded, connected, time.time())
+                if self.messages_sent:
+                    self.messages_sent.inc(len(batch))
+                    self.batches_sent.inc()
+                    self.bytes_sent.inc(len(data))
+                return
+            except (ConnectionRefusedError, TimeoutError, socket.timeout):
+                self._close(dest)
+                break
+            except OSError:
+                self._close(dest)
+        self.on_failure(dest.peer_id)
+
+    def _close(self, dest: _Destination):
+        if dest.sock:
+            try:
+                dest.sock.close()
+            except OSError:
+                pass
+            dest.sock = None
@@ -0,0 +1,305 @@
+"""#### Membresía con Vista Parcial (HyParView)
+
+Con membresía completa cada peer guarda y sincroniza la lista de todos, y
+el servidor avisa cada alta y baja a todos: memoria y tráfico O(N) por
+peer. En modo vista parcial cada peer conoce solo a unos pocos:
+
+- Vista activa (ACTIVE_SIZE, ~log(N)): vecinos con los que se habla. Es
+  simétrica (si A tiene a B, B tiene a A) y forma el overlay por el que se
+  difunden los broadcasts (MSG_FLOOD).
+- Vista pasiva (PASSIVE_SIZE): reemplazos para cuando un vecino activo
+  falla. Se renueva con SHUFFLE periódicos (random walks).
+
+El servidor solo entrega contactos de arranque (ver bootstrap_contacts en
+DiscoveryServer). Con ACTIVE_SIZE + PASSIVE_SIZE fijos el estado por peer
+no crece con la red; los tamaños por defecto alcanzan para decenas de
+miles de peers (HyParView, Leitão et al. 2007).
+
+Mensajes (content["from"] = info del emisor, como en la lista de peers):
+    JOIN            nuevo -> contacto: entrar al overlay
+    FORWARD_JOIN    random walk del nuevo ("peer", "ttl")
+    NEIGHBOR        pedir lugar en la vista activa ("high": con la vista
+                    activa vacía no se puede rechazar)
+    NEIGHBOR_REPLY  "accepted": bool
+    DISCONNECT      el emisor nos sacó de su vista activa (pasa a pasiva)
+    SHUFFLE         random walk con una muestra de las vistas ("origin",
+                    "peers", "ttl")
+    SHUFFLE_REPLY   muestra de la pasiva del destino final ("peers")
+
+Esta clase solo mantiene el estado y arma los mensajes; el envío lo hace
+quien la usa con send(peer_id, info, mensaje), y avisa con peer_failed()
+cuando un peer no acepta conexiones (igual que ReliableLinks).
+"""
+
+import random
+import threading
+from collections import OrderedDict
+
+from common.protocol import (
+    build_message,
+    MSG_JOIN, MSG_FORWARD_JOIN, MSG_NEIGHBOR, MSG_NEIGHBOR_REPLY, MSG_DISCONNECT,
+    MSG_SHUFFLE, MSG_SHUFFLE_REPLY
+)
+from peer.membership import PeerList
+
+ACTIVE_SIZE = 5       # log10(10.000) + 1
+PASSIVE_SIZE = 30     # ~6 veces la activa
+ACTIVE_RWL = 6        # Saltos del FORWARD_JOIN (y del SHUFFLE)
+PASSIVE_RWL = 3       # En este salto del FORWARD_JOIN el nuevo entra a la pasiva
+SHUFFLE_ACTIVE = 3    # Peers de la vista activa en cada SHUFFLE
+SHUFFLE_PASSIVE = 4   # Peers de la vista pasiva en cada SHUFFLE
+FLOOD_SEEN_MAX = 4096 # IDs de MSG_FLOOD recordados para descartar duplicados
+JOIN_CONTACTS = 5     # Contactos que pide al servidor un peer nuevo ("contacts" del REGISTER)
+
+VIEW_MESSAGES = (
+    MSG_JOIN, MSG_FORWARD_JOIN, MSG_NEIGHBOR, MSG_NEIGHBOR_REPLY, MSG_DISCONNECT,
+    MSG_SHUFFLE, MSG_SHUFFLE_REPLY,
+)
+
+
+class PartialView:
+    def __init__(self, membership: PeerList, send, active_size: int = ACTIVE_SIZE,
+                 passive_size: int = PASSIVE_SIZE, rng=random):
+        """
+        membership: PeerList donde se publica activa + pasiva (+ uno mismo),
+        así el resto del PeerNode (envíos, UI) ve solo los peers conocidos.
+        send(peer_id, info, message): envía un mensaje (dict) a un peer que
+        puede no estar en ninguna vista (ej. la respuesta a un SHUFFLE).
+        """
+        self.membership = membership
+        self.send = send
+        self.active_size = active_size
+        self.passive_size = passive_size
+        self.rng = rng
+        self.lock = threading.Lock()
+
+        self.self_id = None
+        self.self_info = None
+        self.active = {}  # { peer_id: info }
+        self.passive = {} # { peer_id: info }
+        self.pending_neighbor = None # (peer_id, tick) del NEIGHBOR sin respuesta
+        self.last_shuffle = ()       # IDs enviados en el último SHUFFLE: se reemplazan primero
+        self.ticks = 0
+        self.seen = OrderedDict()    # IDs de MSG_FLOOD ya procesados
+
+    def set_self(self, peer_id: str, info: dict):
+        with self.lock:
+            self.self_id = peer_id
+            self.self_info = info
+            self.active.pop(peer_id, None)
+            self.passive.pop(peer_id, None)
+            self._publish()
+
+    # --- Entrada y salida ---
+
+    def join(self, contacts: dict):
+        """
+        Contactos del servidor a la vista pasiva y, si todavía no hay
+        vecinos, JOIN a uno de ellos (reconectar al servidor no repite el JOIN).
+        """
+        out = []
+        with self.lock:
+            for pid, info in contacts.items():
+                self._add_passive(pid, info)
+            if not self.active and self.passive:
+                pid = self.rng.choice(list(self.passive))
+                info = self.passive.pop(pid)
+                self.active[pid] = info
+                out.append((pid, info, self._message(MSG_JOIN, pid)))
+            self._publish()
+        self._flush(out)
+
+    def peer_failed(self, peer_id: str) -> bool:
+        """
+        El peer no acepta conexiones: sale de las vistas y, si era vecino
+        activo, se pide lugar a uno de la pasiva. True si estaba en alguna.
+        """
+        out = []
+        with self.lock:
+            removed = self.active.pop(peer_id, None) or self.passive.pop(peer_id, None)
+            if self.pending_neighbor and self.pending_neighbor[0] == peer_id:
+                self.pending_neighbor = None
+            self._promote(out)
+            self._publish()
+        self._flush(out)
+        return removed is not None
+
+    def tick(self):
+        """
+        Llamar cada ciclo de gossip: completa la vista activa desde la
+        pasiva y manda un SHUFFLE a un vecino al azar. El SHUFFLE también
+        sirve de detector de fallas: un vecino caído no acepta la conexión.
+        """
+        out = []
+        with self.lock:
+            self.ticks += 1
+            if self.pending_neighbor and self.ticks - self.pending_neighbor[1] > 1:
+                self.pending_neighbor = None # Respuesta perdida: probar con otro
+            self._promote(out)
+            if self.active:
+                target = self.rng.choice(list(self.active))
+                sample = {self.self_id: self.self_info}
+                sample.update(self._sample(self.active, SHUFFLE_ACTIVE, exclude=target))
+                sample.update(self._sample(self.passive, SHUFFLE_PASSIVE))
+                self.last_shuffle = tuple(sample)
+                out.append((target, self.active[target], self._message(
+                    MSG_SHUFFLE, target, origin={self.self_id: self.self_info}, peers=sample, ttl=ACTIVE_RWL)))
+        self._flush(out)
+
+    # --- Mensajes recibidos ---
+
+    def handle(self, msg: dict):
+        """Procesa un mensaje de VIEW_MESSAGES."""
+        sender = msg['sender_id']
+        content = msg.get('content') or {}
+        info = content.get('from')
+        if not info or sender == self.self_id:
+            return
+        out = []
+        with self.lock:
+            msg_type = msg['type']
+            if msg_type == MSG_JOIN:
+                self._on_join(out, sender, info)
+            elif msg_type == MSG_FORWARD_JOIN:
+                (new_id, new_info), = content['peer'].items()
+                self._on_forward_join(out, sender, new_id, new_info, content['ttl'])
+            elif msg_type == MSG_NEIGHBOR:
+                self._on_neighbor(out, sender, info, content.get('high', False))
+            elif msg_type == MSG_NEIGHBOR_REPLY:
+                self._on_neighbor_reply(out, sender, info, content.get('accepted', False))
+            elif msg_type == MSG_DISCONNECT:
+                if sender in self.active:
+                    self._add_passive(sender, self.active.pop(sender))
+            elif msg_type == MSG_SHUFFLE:
+                self._on_shuffle(out, sender, content)
+            elif msg_type == MSG_SHUFFLE_REPLY:
+                self._integrate(content.get('peers') or {}, self.last_shuffle)
+            self._publish()
+        self._flush(out)
+
+    def _on_join(self, out: list, new_id: str, new_info: dict):
+        self._add_active(out, new_id, new_info)
+        for pid, info in self.active.items():
+            if pid != new_id:
+                out.append((pid, info, self._message(
+                    MSG_FORWARD_JOIN, pid, peer={new_id: new_info}, ttl=ACTIVE_RWL)))
+
+    def _on_forward_join(self, out: list, sender: str, new_id: str, new_info: dict, ttl: int):
+        if new_id == self.self_id:
+            return
+        candidates = [pid for pid in self.active if pid not in (sender, new_id)]
+        if ttl <= 0 or not candidates:
+            # Fin del random walk: el nuevo entra a la vista activa de ambos
+            if new_id not in self.active:
+                self._add_active(out, new_id, new_info)
+                out.append((new_id, new_info, self._message(MSG_NEIGHBOR, new_id, high=True)))
+            return
+        if ttl == PASSIVE_RWL:
+            self._add_passive(new_id, new_info)
+        target = self.rng.choice(candidates)
+        out.append((target, self.active[target], self._message(
+            MSG_FORWARD_JOIN, target, peer={new_id: new_info}, ttl=ttl - 1)))
+
+    def _on_neighbor(self, out: list, sender: str, info: dict, high: bool):
+        accepted = high or sender in self.active or len(self.active) < self.active_size
+        if accepted:
+            self._add_active(out, sender, info)
+        out.append((sender, info, self._message(MSG_NEIGHBOR_REPLY, sender, accepted=accepted)))
+
+    def _on_neighbor_reply(self, out: list, sender: str, info: dict, accepted: bool):
+        if self.pending_neighbor and self.pending_neighbor[0] == sender:
+            self.pending_neighbor = None
+        if accepted:
+            self._add_active(out, sender, info)
+        else:
+            self._promote(out, exclude=sender)
+
+    def _on_shuffle(self, out: list, sender: str, content: dict):
+        (origin_id, origin_info), = content['origin'].items()
+        ttl = content['ttl'] - 1
+        candidates = [pid for pid in self.active if pid not in (sender, origin_id)]
+        if ttl > 0 and candidates:
+            target = self.rng.choice(candidates)
+            out.append((target, self.active[target], self._message(
+                MSG_SHUFFLE, target, origin=content['origin'], peers=content['peers'], ttl=ttl)))
+            return
+        if origin_id == self.self_id:
+            return
+        # Fin del random walk: responder al origen con una muestra de la pasiva
+        peers = content.get('peers') or {}
+        reply = self._sample(self.passive, len(peers))
+        out.append((origin_id, origin_info, self._message(MSG_SHUFFLE_REPLY, origin_id, peers=reply)))
+        self._integrate(peers, tuple(reply))
+
+    # --- Vistas ---
+
+    def _add_active(self, out: list, peer_id: str, info: dict):
+        if peer_id == self.self_id or peer_id in self.active:
+            return
+        self.passive.pop(peer_id, None)
+        if len(self.active) >= self.active_size:
+            dropped = self.rng.choice(list(self.active))
+            dropped_info = self.active.pop(dropped)
+            out.append((dropped, dropped_info, self._message(MSG_DISCONNECT, dropped)))
+            self._add_passive(dropped, dropped_info)
+        self.active[peer_id] = info
+
+    def _add_passive(self, peer_id: str, info: dict, victims: tuple = ()):
+        if peer_id == self.self_id or peer_id in self.active or peer_id in self.passive:
+            return
+        if len(self.passive) >= self.passive_size:
+            candidates = [pid for pid in victims if pid in self.passive] or list(self.passive)
+            del self.passive[self.rng.choice(candidates)]
+        self.passive[peer_id] = info
+
+    def _integrate(self, peers: dict, victims: tuple):
+        """Muestra recibida a la pasiva; si no hay lugar, salen primero los `victims` (ya enviados)."""
+        for pid, info in peers.items():
+            self._add_passive(pid, info, victims)
+
+    def _promote(self, out: list, exclude: str | None = None):
+        """Pide lugar a un peer de la pasiva si falta un vecino (uno a la vez)."""
+        if self.pending_neighbor or len(self.active) >= self.active_size:
+            return
+        candidates = [pid for pid in self.passive if pid != exclude]
+        if not candidates:
+            return
+        pid = self.rng.choice(candidates)
+        self.pending_neighbor = (pid, self.ticks)
+        out.append((pid, self.passive[pid], self._message(MSG_NEIGHBOR, pid, high=not self.active)))
+
+    def _sample(self, view: dict, k: int, exclude: str | None = None) -> dict:
+        ids = [pid for pid in view if pid != exclude]
+        return {pid: view[pid] for pid in self.rng.sample(ids, min(k, len(ids)))}
+
+    def _message(self, msg_type: str, to: str, **content) -> dict:
+        return build_message(msg_type, sender_id=self.self_id, to=to, content={"from": self.self_info, **content})
+
+    def _publish(self):
+        # Llamar con self.lock tomado
+        peers = {**self.passive, **self.active}
+        if self.self_id:
+            peers[self.self_id] = self.self_info
+        self.membership.replace(peers)
+
+    def _flush(self, out: list):
+        # Fuera del lock: send puede bloquear o, en el simulador, entregar en el acto
+        for peer_id, info, message in out:
+            self.send(peer_id, info, message)
+
+    # --- Difusión (MSG_FLOOD) ---
+
+    def first_seen(self, flood_id: str) -> bool:
+        """True la primera vez que se ve un ID de MSG_FLOOD."""
+        with self.lock:
+            if flood_id in self.seen:
+                return False
+            self.seen[flood_id] = True
+            if len(self.seen) > FLOOD_SEEN_MAX:
+                self.seen.popitem(last=False)
+            return True
+
+    def flood_targets(self, exclude: str | None = None) -> list[str]:
+        """Vecinos activos a los que reenviar un MSG_FLOOD (menos de quien vino)."""
+        with self.lock:
+            return [pid for pid in self.active if pid != exclude]
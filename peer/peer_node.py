@@ -5,39 +5,159 @@ import socket
 import threading
 import json
 import time
-import random
+import uuid
 from common.protocol import (
-    create_message, parse_message,
-    MSG_REGISTER, MSG_REGISTER_ACK, MSG_HEARTBEAT, MSG_UNREGISTER, MSG_CHAT,
-    MSG_SYNC_PEERS_REQUEST, MSG_SYNC_PEERS_RESPONSE, MSG_PEER_LIST_UPDATE
+    create_message, parse_message, build_message, encode_message,
+    MSG_REGISTER, MSG_REGISTER_ACK, MSG_HEARTBEAT, MSG_UNREGISTER, MSG_CHAT, MSG_ACK,
+    MSG_SYNC_PEERS_REQUEST, MSG_SYNC_PEERS_RESPONSE, MSG_PEER_LIST_UPDATE, MSG_BATCH,
+    MSG_FILE_OFFER, MSG_FILE_HAVE, MSG_FILE_GET, MSG_STATS_REQUEST, MSG_PING, MSG_PONG, MSG_FLOOD,
+    MSG_GET_PEERS, MSG_GET_PEERS_RESPONSE,
+    SUPPORTED_CODECS, compress_frame, negotiate_codec
 )
+from peer.reliable import ReliableLinks, ACK_DELAY
+from peer.file_transfer import FileShare
+from peer.outbox import PeerOutbox
+from peer.membership import PeerList
+from peer.partial_view import PartialView, VIEW_MESSAGES, JOIN_CONTACTS
+from peer.directory import PeerDirectory
+from common import local_link
+from common.stream import FrameReader
+from common.datagram import DatagramChannel
+from common.metrics import MetricsRegistry, serve_http, stats_response
+from common.tracing import Tracer
+from common.log import get_logger
+
+log = get_logger("peer")
 
 HEARTBEAT_INTERVAL = 10 # Enviar heartbeat cada 10 seg
 GOSSIP_INTERVAL = 5 # Sincronizar con peers cada 5 seg (si el servidor cae)
+RECONNECT_INTERVAL = 15 # Reintentar el registro cada 15 seg
+SYNC_TIMEOUT = 5.0 # Timeout de conexión/respuesta de un ciclo de gossip
+QUERY_TIMEOUT = 2.0 # Timeout de una consulta GET_PEERS al servidor
+PEERS_PAGE = 50 # Peers por página en list_peers()
+FLOODABLE = (MSG_CHAT, MSG_FILE_OFFER, MSG_FILE_HAVE) # Mensajes que pueden viajar dentro de un MSG_FLOOD
 
 class PeerNode:
-    def __init__(self, username: str, listening_port: int, discovery_server_ip: str = '127.0.0.1', discovery_server_port: int = 9999):
+    def __init__(self, username: str, listening_port: int, discovery_server_ip: str = '127.0.0.1', discovery_server_port: int = 9999,
+                 use_udp: bool = True, partial_view: bool = False, local_links: bool = True):
         self.username = username
         self.listening_port = listening_port # Puerto donde este peer escucha
+        # Lista de peers conocidos: { peer_id: {"ip": str, "port": int, "username": str} },
+        # publicada como snapshots inmutables (ver peer/membership.py)
+        self.membership = PeerList()
+        # Vista parcial (HyParView): la lista pasa a ser solo la vista activa
+        # y la pasiva, y los broadcasts se difunden por el overlay
+        self.partial = PartialView(self.membership, self.send_view_message) if partial_view else None
+        # Peers consultados al servidor (GET_PEERS) que no están en la lista
+        self.directory = PeerDirectory()
+        # Socket Unix para peers de la misma máquina (ver common/local_link.py)
+        self.local_links = local_links
+        self.local_socket = None # Creado en start()
+        self.local_info = {} # {"host_id", "uds"} anunciados al servidor y al overlay
         self.peer_id = f"{username}@{socket.gethostbyname(socket.gethostname())}:{listening_port}"
 
         # Dirección del servidor de descubrimiento (configurable)
         self.discovery_server_ip = discovery_server_ip
         self.discovery_server_port = discovery_server_port
 
-        # Lista de peers conocidos: { peer_id: {"ip": str, "port": int, "username": str} }
-        self.peer_list = {}
-        self.peer_list_lock = threading.Lock()
-
         self.discovery_server_status = "DOWN" # Empezamos asumiendo que está caído
         self.discovery_socket = None
+        self.discovery_reader = None # FrameReader sobre discovery_socket
         self.server_socket = None # Socket para escuchar a otros peers
+        self.host = None # PeerHost que lo corre (None = hilos propios)
+
+        # Canal UDP en el mismo número de puerto: heartbeats y pings de gossip
+        self.use_udp = use_udp
+        self.datagrams = None # DatagramChannel, creado en start()
+        self.server_udp_addr = None # Lo anuncia el servidor en el REGISTER_ACK
 
         self.running = True
         self.incoming_messages = queue.Queue()
-    def start(self):
-        """Inicia todos los servicios del peer."""
-        print(f"[Peer {self.peer_id}] Iniciando...")
+
+        # Intervalos por instancia (los benchmarks los acortan)
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
+        self.gossip_interval = GOSSIP_INTERVAL
+
+        # Métricas: expuestas con MSG_STATS_REQUEST, en la UI y opcionalmente por HTTP
+        self.metrics = MetricsRegistry()
+        self.messages_received = self.metrics.counter("peer_messages_received_total", "Mensajes P2P recibidos")
+        self.send_failures = self.metrics.counter("peer_send_failures_total", "Destinos que no aceptaron la conexión")
+        self.retransmits = self.metrics.counter("peer_retransmits_total", "Mensajes de chat retransmitidos")
+        self.gossip_rounds = self.metrics.histogram("peer_gossip_round_seconds", "Duración de un ciclo de gossip")
+        self.udp_probes = self.metrics.counter("peer_udp_probes_total", "Pings UDP de gossip enviados")
+        self.udp_probe_timeouts = self.metrics.counter("peer_udp_probe_timeouts_total", "Pings UDP sin respuesta tras los reintentos")
+        self.gossip_syncs_skipped = self.metrics.counter("peer_gossip_syncs_skipped_total", "Ciclos de gossip resueltos por el digest, sin SYNC por TCP")
+        self.metrics.gauge("peer_incoming_queue_depth", "Mensajes sin leer por la UI", fn=self.incoming_messages.qsize)
+        self.metrics.gauge("peer_known_peers", "Peers en la lista", fn=lambda: len(self.membership.snapshot))
+        self.metrics.gauge("peer_directory_entries", "Peers consultados al servidor en caché", fn=lambda: len(self.directory))
+        if self.partial:
+            self.metrics.gauge("peer_active_view", "Vecinos en la vista activa", fn=lambda: len(self.partial.active))
+            self.metrics.gauge("peer_passive_view", "Peers en la vista pasiva", fn=lambda: len(self.partial.passive))
+
+        # Trazas muestreadas de mensajes de chat (P2P_TRACE_SAMPLE)
+        self.tracer = Tracer(lambda: self.peer_id)
+
+        # Números de secuencia, ACKs y retransmisiones de los mensajes de chat
+        self.reliable = ReliableLinks()
+
+        # Cola de salida por destino: junta mensajes y reutiliza la conexión
+        self.outbox = PeerOutbox(
+            sender_id_fn=lambda: self.peer_id,
+            resolve_addr=self.resolve_peer_address,
+            on_failure=self.handle_send_failure,
+            piggyback=self.piggyback_ack,
+            metrics=self.metrics,
+            tracer=self.tracer,
+        )
+
+        # Archivos compartidos y ofrecidos por otros peers
+        self.files = FileShare()
+
+    @property
+    def peer_id(self) -> str:
+        return self._peer_id
+
+    @peer_id.setter
+    def peer_id(self, value: str):
+        # El snapshot excluye al propio peer de la lista de "otros"
+        self._peer_id = value
+        self.membership.set_self(value)
+        if self.partial:
+            self.partial.set_self(value, self.self_info())
+
+    def self_info(self) -> dict:
+        """La entrada propia tal como la ven los demás en su lista."""
+        # Mismo formato que asigna el servidor: "username@ip:puerto"
+        ip = self.peer_id.rpartition('@')[2].rpartition(':')[0]
+        return {"ip": ip, "port": self.listening_port, "username": self.username, **self.local_info}
+
+    @property
+    def peer_list(self):
+        """Vista de solo lectura de la versión actual de la lista de peers."""
+        return self.membership.snapshot.peers
+
+    def start(self, host=None):
+        """
+        Inicia todos los servicios del peer. Con host (PeerHost), el peer
+        corre en el bucle y el pool compartidos del host, sin hilos propios.
+        """
+        log.info("[Peer %s] Iniciando...", self.peer_id)
+        if host:
+            self.host = host
+            host.add_peer(self)
+            return
+
+        # 0. Canal UDP (opcional: sin él, todo va por TCP como antes)
+        if self.use_udp:
+            try:
+                self.datagrams = DatagramChannel('0.0.0.0', self.listening_port, self.handle_datagram)
+            except OSError as e:
+                log.warning("[UDP] No se pudo abrir el puerto UDP %s: %s. Usando solo TCP.", self.listening_port, e)
+
+        # 0b. Socket Unix para los peers de esta máquina
+        self.open_local_listener()
+        if self.local_socket:
+            threading.Thread(target=self.accept_connections, args=(self.local_socket,), daemon=True).start()
 
         # 1. Iniciar el servidor P2P (para escuchar a otros peers)
         listener_thread = threading.Thread(target=self.start_p2p_listener, daemon=True)
@@ -51,13 +171,17 @@ class PeerNode:
         # Esto implementa tu idea de "descargar conexiones"
         gossip_thread = threading.Thread(target=self.start_gossip_protocol, daemon=True)
         gossip_thread.start()
+
+        # 4. Vaciar ACKs agrupados y retransmitir mensajes sin confirmar
+        reliability_thread = threading.Thread(target=self.start_reliability_timer, daemon=True)
+        reliability_thread.start()
         """
         # 4. (Demo) Iniciar un bucle para enviar mensajes
         # En una app real, esto sería reemplazado por la UI (cli_interface.py)
         demo_sender_thread = threading.Thread(target=self.demo_message_sender, daemon=True)
         demo_sender_thread.start()
 
-        print(f"[Peer {self.peer_id}] Listo. Escuchando en el puerto {self.listening_port}")
+        log.info("[Peer %s] Listo. Escuchando en el puerto %s", self.peer_id, self.listening_port)
         # Mantener el thread principal vivo
         try:
             while self.running:
@@ -65,28 +189,44 @@ class PeerNode:
         except KeyboardInterrupt:
             self.stop()
         """
-        print(f"[Peer {self.peer_id}] Hilos iniciados. Escuchando en el puerto {self.listening_port}")
+        log.info("[Peer %s] Hilos iniciados. Escuchando en el puerto %s", self.peer_id, self.listening_port)
     
+    def serve_metrics(self, port: int):
+        """Expone las métricas por HTTP local (/metrics y /metrics.json)."""
+        return serve_http(self.metrics, port)
+
     def stop(self):
         """Detiene el peer y notifica al servidor."""
-        print(f"\n[Peer {self.peer_id}] Deteniendo...")
+        log.info("[Peer %s] Deteniendo...", self.peer_id)
         self.running = False
+        if self.host:
+            self.host.remove_peer(self) # Deja de vigilar sus sockets antes de cerrarlos
 
-        # Notificar al servidor de descubrimiento
-        if self.discovery_socket and self.discovery_server_status == "UP":
+        # Notificar al servidor de descubrimiento (copia local: el hilo de
+        # heartbeat pone discovery_socket en None cuando el servidor cierra)
+        discovery_socket = self.discovery_socket
+        if discovery_socket and self.discovery_server_status == "UP":
             try:
                 msg = create_message(MSG_UNREGISTER, sender_id=self.peer_id)
-                self.discovery_socket.sendall(msg)
-            except (BrokenPipeError, ConnectionResetError):
+                discovery_socket.sendall(msg)
+            except OSError:
                 pass # El servidor ya podría estar caído
             finally:
-                self.discovery_socket.close()
+                discovery_socket.close()
+
+        # Cerrar las conexiones salientes persistentes
+        self.outbox.stop()
+
+        if self.datagrams:
+            self.datagrams.close()
 
         # Cerrar el socket de escucha P2P
         if self.server_socket:
             self.server_socket.close()
+        if self.local_socket:
+            local_link.close_listener(self.local_socket, self.listening_port)
 
-        print(f"[Peer {self.peer_id}] Desconectado.")
+        log.info("[Peer %s] Desconectado.", self.peer_id)
 
     # --- 1. Lógica del Servidor P2P ---
 
@@ -97,177 +237,254 @@ class PeerNode:
         try:
             self.server_socket.bind(('0.0.0.0', self.listening_port))
             self.server_socket.listen(5)
-
-            while self.running:
-                try:
-                    conn, addr = self.server_socket.accept()
-                    # Manejar cada conexión de peer en un thread separado
-                    p2p_handler_thread = threading.Thread(target=self.handle_p2p_connection, args=(conn, addr), daemon=True)
-                    p2p_handler_thread.start()
-                except OSError:
-                    if self.running:
-                        print(f"[P2P Server] Error al aceptar conexión (Socket cerrado?)")
-                    break # Salir del bucle si el socket se cerró
+            self.accept_connections(self.server_socket)
 
         except OSError as e:
-            print(f"[P2P Server] Error al bindiar puerto {self.listening_port}: {e}")
+            log.error("[P2P Server] Error al bindiar puerto %s: %s", self.listening_port, e)
             self.running = False
         finally:
             if self.server_socket:
                 self.server_socket.close()
 
+    def accept_connections(self, server_socket: socket.socket):
+        """Acepta conexiones de peers (TCP o Unix) hasta que se cierre el socket."""
+        while self.running:
+            try:
+                conn, addr = server_socket.accept()
+                # Manejar cada conexión de peer en un thread separado
+                p2p_handler_thread = threading.Thread(target=self.handle_p2p_connection, args=(conn, addr or "local"), daemon=True)
+                p2p_handler_thread.start()
+            except OSError:
+                if self.running:
+                    log.warning("[P2P Server] Error al aceptar conexión (Socket cerrado?)")
+                break # Salir del bucle si el socket se cerró
+
+    def open_local_listener(self, backlog: int = 5):
+        """Abre el socket Unix (si local_links) y lo anuncia en la entrada propia."""
+        if not self.local_links:
+            return
+        self.local_socket = local_link.open_listener(self.listening_port, backlog)
+        self.local_info = local_link.link_info(self.local_socket)
+        if self.partial and self.local_socket:
+            self.partial.set_self(self.peer_id, self.self_info())
+
     def handle_p2p_connection(self, conn: socket.socket, addr: tuple):
-        """Maneja un mensaje entrante de otro peer."""
+        """
+        Maneja una conexión entrante de otro peer. Las conexiones del outbox
+        son persistentes, así que pueden traer muchos mensajes y lotes.
+        """
         try:
-            buffer = b""
-            while self.running:
-                data = conn.recv(1024)
-                if not data:
+            for message_data in FrameReader(conn):
+                if not self.running:
                     break
-
-                buffer += data
-                while b'\n' in buffer:
-                    message_data, buffer = buffer.split(b'\n', 1)
-                    if not message_data:
-                        continue
-
-                    msg = parse_message(message_data)
-                    if not msg:
-                        continue
-
-                    if msg['type'] == MSG_CHAT:
-                        #print(f"\n[Mensaje de {msg['sender_id']}]: {msg['content']}\n> ", end="")
-                        msg_info = {
-                        "sender": msg['sender_id'],
-                        "content": msg['content']
-                        }
-                        self.incoming_messages.put(msg_info)
-                    elif msg['type'] == MSG_SYNC_PEERS_REQUEST:
-                        # Un peer nos pide nuestra lista (Gossip)
-                        self.handle_sync_request(conn, msg)
-
-                    elif msg['type'] == MSG_SYNC_PEERS_RESPONSE:
-                        # Un peer nos responde con su lista (Gossip)
-                        self.handle_sync_response(msg)
-
-                    else:
-                        print(f"[P2P] Mensaje P2P desconocido de {addr}: {msg['type']}")
+                self.handle_p2p_frame(conn, addr, message_data)
 
         except (ConnectionResetError, BrokenPipeError):
             # print(f"[P2P] Conexión P2P perdida con {addr}")
             pass
         except Exception as e:
-            print(f"[P2P] Error en conexión P2P con {addr}: {e}")
+            log.warning("[P2P] Error en conexión P2P con %s: %s", addr, e)
         finally:
             conn.close()
 
+    def handle_p2p_frame(self, conn: socket.socket, addr: tuple, message_data: bytes | memoryview):
+        """Parsea y procesa un frame recibido de otro peer."""
+        received_at = time.time()
+        msg = parse_message(message_data)
+        if not msg:
+            return
+        self.tracer.on_receive(msg, received_at)
+        self.dispatch_p2p_message(conn, addr, msg)
+
+    def dispatch_p2p_message(self, conn: socket.socket, addr: tuple, msg: dict):
+        """Procesa un mensaje P2P ya parseado."""
+        if msg['type'] not in (MSG_BATCH, MSG_FLOOD):
+            self.messages_received.inc()
+
+        if 'ack' in msg:
+            # ACK "a caballito" (o dentro de un MSG_ACK)
+            self.handle_ack(msg['sender_id'], msg['ack'])
+
+        if msg['type'] == MSG_CHAT:
+            if 'rel' in msg and not self.handle_reliable_receive(msg):
+                return # Duplicado: ya se entregó antes
+            #print(f"\n[Mensaje de {msg['sender_id']}]: {msg['content']}\n> ", end="")
+            msg_info = {
+            "sender": msg['sender_id'],
+            "content": msg['content'],
+            "trace": msg.get('trace', {}).get('id') # Para marcar "consumed" al leerlo
+            }
+            self.tracer.finish(msg, "delivered")
+            self.incoming_messages.put(msg_info)
+
+        elif msg['type'] == MSG_BATCH:
+            # Lote coalescido por el emisor: procesar cada mensaje
+            for inner in msg['content']:
+                self.dispatch_p2p_message(conn, addr, inner)
+
+        elif msg['type'] == MSG_ACK:
+            pass # Ya procesado arriba
+
+        elif msg['type'] == MSG_FLOOD:
+            self.handle_flood(conn, addr, msg)
+
+        elif msg['type'] in VIEW_MESSAGES:
+            if self.partial:
+                self.partial.handle(msg)
+
+        elif msg['type'] == MSG_FILE_GET:
+            # Un peer nos pide un rango de un archivo
+            if self.host:
+                self.host.hand_off(self, conn, self.files.serve_chunk, conn, msg['content'])
+            else:
+                self.files.serve_chunk(conn, msg['content'])
+
+        elif msg['type'] == MSG_FILE_OFFER:
+            if self.files.add_offer(msg['sender_id'], msg['content']):
+                self.incoming_messages.put({
+                    "sender": msg['sender_id'],
+                    "content": f"📎 {msg['content']['name']} ({msg['content']['size']} bytes)",
+                    "file": msg['content'],
+                })
+
+        elif msg['type'] == MSG_FILE_HAVE:
+            self.files.add_holder(msg['sender_id'], msg['content']['file_id'])
+
+        elif msg['type'] == MSG_SYNC_PEERS_REQUEST:
+            # Un peer nos pide nuestra lista (Gossip)
+            self.handle_sync_request(conn, msg)
+
+        elif msg['type'] == MSG_SYNC_PEERS_RESPONSE:
+            # Un peer nos responde con su lista (Gossip)
+            self.handle_sync_response(msg)
+
+        elif msg['type'] == MSG_STATS_REQUEST:
+            conn.sendall(stats_response(self.metrics, self.peer_id, to=msg['sender_id']))
+
+        else:
+            log.warning("[P2P] Mensaje P2P desconocido de %s: %s", addr, msg['type'])
+
     # --- 2. Lógica del Cliente de Descubrimiento ---
 
     def connect_to_discovery(self):
         """Intenta conectarse y registrarse en el servidor de descubrimiento."""
         while self.running:
-            try:
-                self.discovery_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.discovery_socket.connect((self.discovery_server_ip, self.discovery_server_port))
-                print(f"[Discovery] Conectado a {self.discovery_server_ip}:{self.discovery_server_port}")
-
-                # 1. Enviar registro
-                reg_msg = create_message(
-                    MSG_REGISTER,
-                    sender_id=self.peer_id, # Enviamos el ID que *creemos* tener
-                    content={"port": self.listening_port, "username": self.username}
-                )
-                self.discovery_socket.sendall(reg_msg)
-
-                # 2. Esperar ACK y lista de peers
-                response_data = self.discovery_socket.recv(4096) # Esperar una lista grande
-                if not response_data:
-                    raise ConnectionError("Servidor no envió ACK")
-
-                # Asumimos que el ACK viene en un solo paquete por simplicidad
-                ack_msg = parse_message(response_data.split(b'\n')[0])
+            if self.register_with_discovery():
+                # 3. Iniciar bucle de Heartbeat
+                self.start_discovery_heartbeat()
 
-                if ack_msg and ack_msg['type'] == MSG_REGISTER_ACK:
-                    self.peer_id = ack_msg['content']['peer_id'] # Actualizar con el ID oficial
-                    server_peer_list = ack_msg['content']['peer_list']
-                    print(f"[Discovery] Registrado! ID Oficial: {self.peer_id}")
-                    self.merge_peer_lists(server_peer_list)
-                    self.discovery_server_status = "UP"
-
-                    # 3. Iniciar bucle de Heartbeat
-                    self.start_discovery_heartbeat()
-
-                else:
-                    print(f"[Discovery] Error de registro. Respuesta: {ack_msg}")
-                    self.discovery_socket.close()
+            # Reintentar conexión cada 15 segundos
+            time.sleep(RECONNECT_INTERVAL)
 
-            except (ConnectionRefusedError, ConnectionResetError, ConnectionAbortedError, TimeoutError, ConnectionError) as e:
-                print(f"[Discovery] Servidor caído o inalcanzable. ({e})")
-                self.discovery_server_status = "DOWN"
-                if self.discovery_socket:
-                    self.discovery_socket.close()
-                self.discovery_socket = None
+    def register_with_discovery(self, timeout: float | None = None) -> bool:
+        """
+        Un intento de conexión y registro (REGISTER y espera del ACK). True si
+        quedó registrado; el socket queda en self.discovery_socket.
+        """
+        try:
+            self.discovery_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.discovery_socket.settimeout(timeout)
+            self.discovery_socket.connect((self.discovery_server_ip, self.discovery_server_port))
+            log.info("[Discovery] Conectado a %s:%s", self.discovery_server_ip, self.discovery_server_port)
+
+            # 1. Enviar registro
+            self.discovery_socket.sendall(self.build_register_request())
+
+            # 2. Esperar ACK y lista de peers (puede ocupar muchos paquetes).
+            # El servidor publica el socket antes de enviar el ACK: un registro
+            # concurrente puede adelantar un PEER_LIST_UPDATE, que es posterior
+            # a la lista del ACK y se aplica después de ella
+            self.discovery_reader = FrameReader(self.discovery_socket)
+            early_updates = []
+            while True:
+                response_data = self.discovery_reader.read_frame()
+                if response_data is None:
+                    raise ConnectionError("Servidor no envió ACK")
+                ack_msg = parse_message(response_data)
+                if not (ack_msg and ack_msg['type'] == MSG_PEER_LIST_UPDATE):
+                    break
+                early_updates.append(ack_msg)
+
+            if ack_msg and ack_msg['type'] == MSG_REGISTER_ACK:
+                self.handle_register_ack(ack_msg)
+                for update_msg in early_updates:
+                    self.handle_peer_list_update(update_msg)
+                return True
+
+            log.warning("[Discovery] Error de registro. Respuesta: %s", ack_msg)
+            self.discovery_socket.close()
+
+        except (ConnectionRefusedError, ConnectionResetError, ConnectionAbortedError, TimeoutError, ConnectionError) as e:
+            log.warning("[Discovery] Servidor caído o inalcanzable. (%s)", e)
+            self.close_discovery()
+        return False
+
+    def close_discovery(self):
+        """Marca el servidor como caído y cierra la conexión (el reintento lo programa quien llama)."""
+        self.discovery_server_status = "DOWN"
+        discovery_socket = self.discovery_socket
+        self.discovery_socket = None
+        if discovery_socket:
+            discovery_socket.close()
+
+    def build_register_request(self) -> bytes:
+        """REGISTER listo para enviar al servidor de descubrimiento."""
+        content = {
+            "port": self.listening_port,
+            "username": self.username,
+            "compression": SUPPORTED_CODECS, # El servidor elige uno
+            "udp": self.datagrams is not None, # Heartbeats por UDP si el servidor lo soporta
+            **self.local_info, # Misma máquina: los peers locales usan el socket Unix
+        }
+        if self.partial:
+            # Basta con unos contactos para entrar al overlay; al resto se lo consulta con GET_PEERS
+            content["contacts"] = JOIN_CONTACTS
+        return create_message(
+            MSG_REGISTER,
+            sender_id=self.peer_id, # Enviamos el ID que *creemos* tener
+            content=content
+        )
 
-            # Reintentar conexión cada 15 segundos
-            time.sleep(15)
+    def handle_register_ack(self, ack_msg: dict):
+        """Aplica el REGISTER_ACK: ID oficial y lista inicial de peers."""
+        self.peer_id = ack_msg['content']['peer_id'] # Actualizar con el ID oficial
+        log.info("[Discovery] Registrado! ID Oficial: %s", self.peer_id)
+        if self.partial:
+            # La lista (completa o solo contactos de arranque) sirve para entrar al overlay
+            self.partial.join(ack_msg['content']['peer_list'])
+        else:
+            self.merge_peer_lists(ack_msg['content']['peer_list'])
+        udp_port = ack_msg['content'].get('udp_port')
+        self.server_udp_addr = (self.discovery_server_ip, udp_port) if udp_port and self.datagrams else None
+        self.discovery_server_status = "UP"
 
     def start_discovery_heartbeat(self):
         """
         Mantiene la conexión con el servidor, enviando heartbeats
         y escuchando actualizaciones de la lista de peers.
         """
-        buffer = b""
-        
         while self.running and self.discovery_server_status == "UP":
             try:
                 if not self.discovery_socket:
                     raise ConnectionError("Socket de descubrimiento no existe")
 
+                # 0. Procesar updates que ya estén en el buffer (ej. llegados junto al ACK)
+                self.process_discovery_frames()
+
                 # 1. ENVIAR HEARTBEAT
-                msg = create_message(MSG_HEARTBEAT, sender_id=self.peer_id)
-                self.discovery_socket.sendall(msg)
+                self.send_heartbeat()
                 
                 # 2. ESCUCHAR UPDATES (con timeout)
                 # Ponemos el socket en modo "escucha" con un timeout 
                 # igual al intervalo del heartbeat.
-                self.discovery_socket.settimeout(HEARTBEAT_INTERVAL)
+                self.discovery_socket.settimeout(self.heartbeat_interval)
                 
                 try:
                     # El socket se bloqueará aquí hasta que reciba datos
                     # O hasta que pasen 10 seg (HEARTBEAT_INTERVAL)
-                    data = self.discovery_socket.recv(4096)
-                    
-                    if not data:
+                    if not self.discovery_reader.fill():
                         # Servidor cerró la conexión
                         raise ConnectionError("Servidor cerró la conexión")
-                    
-                    buffer += data
-                    
-                    # Procesar todos los mensajes en el buffer
-                    while b'\n' in buffer:
-                        message_data, buffer = buffer.split(b'\n', 1)
-                        if not message_data:
-                            continue
-
-                        update_msg = parse_message(message_data)
-                        
-                        if update_msg and update_msg['type'] == MSG_PEER_LIST_UPDATE:
-                            print("[Discovery] ¡Actualización de peers recibida del servidor!")
-                            content = update_msg.get('content', {})
-                            
-                            # Añadir nuevo peer
-                            if 'new_peer' in content:
-                                # content['new_peer'] es un dict: { peer_id: info }
-                                self.merge_peer_lists(content['new_peer'])
-                            
-                            # Eliminar peer caído
-                            if 'removed_peer' in content:
-                                # content['removed_peer'] es un str: 'peer_id'
-                                self.remove_dead_peer(content['removed_peer'])
-                        
-                        else:
-                            # Puede ser un ACK duplicado o algo inesperado
-                            print(f"[Discovery] Recibido mensaje no esperado del servidor: {update_msg.get('type')}")
 
                 except socket.timeout:
                     # --- ESTO ES NORMAL ---
@@ -277,22 +494,53 @@ class PeerNode:
                     continue 
 
             except (BrokenPipeError, ConnectionResetError, ConnectionError, OSError) as e:
-                print(f"[Heartbeat] Error en conexión con servidor: {e}. Servidor caído.")
-                self.discovery_server_status = "DOWN"
-                if self.discovery_socket:
-                    self.discovery_socket.close()
-                self.discovery_socket = None
+                log.warning("[Heartbeat] Error en conexión con servidor: %s. Servidor caído.", e)
+                self.close_discovery()
                 # Romper este bucle. El bucle exterior en 
                 # connect_to_discovery() se encargará de reconectar.
                 break
             except Exception as e:
-                print(f"[Heartbeat] Error inesperado: {e}")
-                self.discovery_server_status = "DOWN"
-                if self.discovery_socket:
-                    self.discovery_socket.close()
-                self.discovery_socket = None
+                log.error("[Heartbeat] Error inesperado: %s", e)
+                self.close_discovery()
                 break
 
+    def send_heartbeat(self):
+        """
+        HEARTBEAT al servidor: por UDP si el servidor lo anunció (perder uno
+        no importa, el timeout cubre varios intervalos), si no por TCP.
+        """
+        msg = create_message(MSG_HEARTBEAT, sender_id=self.peer_id)
+        if self.server_udp_addr:
+            self.datagrams.send(self.server_udp_addr, msg)
+        else:
+            self.discovery_socket.sendall(msg)
+
+    def process_discovery_frames(self):
+        """Procesa todos los mensajes completos del servidor ya recibidos."""
+        while (message_data := self.discovery_reader.next_frame()) is not None:
+            update_msg = parse_message(message_data)
+
+            if update_msg and update_msg['type'] == MSG_PEER_LIST_UPDATE:
+                self.handle_peer_list_update(update_msg)
+            else:
+                # Puede ser un ACK duplicado o algo inesperado
+                log.warning("[Discovery] Recibido mensaje no esperado del servidor: %s", update_msg and update_msg.get('type'))
+
+    def handle_peer_list_update(self, update_msg: dict):
+        """Aplica un MSG_PEER_LIST_UPDATE del servidor."""
+        log.debug("[Discovery] ¡Actualización de peers recibida del servidor!")
+        content = update_msg.get('content', {})
+
+        # Añadir nuevo peer (con vista parcial, el nuevo entra al overlay con su JOIN)
+        if 'new_peer' in content and not self.partial:
+            # content['new_peer'] es un dict: { peer_id: info }
+            self.merge_peer_lists(content['new_peer'])
+
+        # Eliminar peer caído
+        if 'removed_peer' in content:
+            # content['removed_peer'] es un str: 'peer_id'. El servidor confirma que se fue
+            self.remove_dead_peer(content['removed_peer'], departed=True)
+
     # --- 3. Lógica de Tolerancia a Fallos (Gossip) ---
 
     def start_gossip_protocol(self):
@@ -301,79 +549,97 @@ class PeerNode:
         Si el servidor de descubrimiento está caído, le preguntamos
         a otros peers por sus listas de conexiones.
         """
-        print("[Gossip] Protocolo de Gossip iniciado. Esperando estado del servidor...")
+        log.info("[Gossip] Protocolo de Gossip iniciado. Esperando estado del servidor...")
         while self.running:
             # Esperar ANTES de ejecutar, para no hacerlo apenas arranca
-            time.sleep(GOSSIP_INTERVAL) 
+            time.sleep(self.gossip_interval) 
             
             if not self.running:
                 break
             
             # Ya no comprobamos si el servidor está caído.
             # Siempre sincronizamos, para propagar cambios.
-            print("[Gossip] Ejecutando ciclo de sincronización P2P programado.")
+            self.gossip_round()
 
-            result = self.get_random_peer() 
-            if result: 
-                target_peer_id, target_peer_info = result 
-                try:
-                    print(f"[Gossip] Sincronizando con {target_peer_info['username']}...") 
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    s.settimeout(5.0)
-                    s.connect((target_peer_info['ip'], target_peer_info['port'])) 
-                    
-                    # Pedirle su lista
-                    msg = create_message(MSG_SYNC_PEERS_REQUEST, sender_id=self.peer_id)
-                    s.sendall(msg)
-                    
-                    # (El resto de la lógica para recibir la respuesta 
-                    # ya está en handle_p2p_connection, así que 
-                    # esta conexión s.close() es correcta. 
-                    # O puedes implementar la lógica de recepción aquí
-                    # como en run_gossip_cycle)
-                    
-                    # Para ser consistentes, llamemos a la misma lógica
-                    # del botón "Actualizar":
-                    s.close() # Cerramos la conexión de arriba
-                    self.run_gossip_cycle() # Reusamos la lógica completa
-                    
-
-                except (ConnectionRefusedError, TimeoutError):
-                    print(f"[Gossip] Peer {target_peer_info['username']} no responde. Eliminando.") 
-                    self.remove_dead_peer(target_peer_id) 
-                except Exception as e:
-                    print(f"[Gossip] Error al sincronizar con {target_peer_info.get('username')}: {e}")
+    def gossip_round(self):
+        """Un ciclo de gossip programado (hilo de gossip o timer del PeerHost)."""
+        log.debug("[Gossip] Ejecutando ciclo de sincronización P2P programado.")
+
+        if self.partial:
+            # Vista parcial: SHUFFLE en lugar de intercambiar listas completas
+            with self.gossip_rounds.time():
+                self.partial.tick()
+            return
+
+        result = self.get_random_peer()
+        if not result:
+            return
+        target_peer_id, target_peer_info = result
+        with self.gossip_rounds.time():
+            # Primero un ping UDP con el digest: si las listas ya son
+            # iguales, no hace falta la conexión TCP ni la lista completa
+            if self.probe_in_sync(target_peer_info):
+                self.gossip_syncs_skipped.inc()
+                return
+            self.sync_with_peer(target_peer_id, target_peer_info)
+
+    def probe_in_sync(self, target_peer_info: dict) -> bool:
+        """
+        Ping UDP con el digest de la lista propia. True si el peer respondió
+        con el mismo digest. Sin respuesta (UDP perdido, peer sin UDP o
+        caído) devuelve False y el ciclo sigue por TCP, que decide si el
+        peer está caído: un datagrama perdido nunca elimina a nadie.
+        """
+        if not self.datagrams:
+            return False
+        self.udp_probes.inc()
+        digest = self.membership.snapshot.digest
+        reply = self.datagrams.request(
+            (target_peer_info['ip'], target_peer_info['port']),
+            lambda nonce: create_message(MSG_PING, sender_id=self.peer_id, content={"digest": digest}, nonce=nonce)
+        )
+        if reply is None:
+            self.udp_probe_timeouts.inc()
+            return False
+        return (reply.get('content') or {}).get('digest') == digest
+
+    def handle_datagram(self, msg: dict, addr: tuple, channel: DatagramChannel):
+        """Mensajes UDP que no son respuesta a un ping propio."""
+        if msg['type'] == MSG_PING:
+            channel.send(addr, create_message(
+                MSG_PONG, sender_id=self.peer_id, to=msg.get('sender_id'),
+                content={"digest": self.membership.snapshot.digest}, re=msg.get('nonce')
+            ))
+        else:
+            log.debug("[UDP] Mensaje inesperado de %s: %s", addr, msg['type'])
 
     # Código Corregido (Devuelve un tuple)
     def get_random_peer(self) -> tuple[str, dict] | None:
         """Obtiene un (peer_id, peer_info) aleatorio, excluyéndose a sí mismo."""
-        with self.peer_list_lock:
-            # Filtrar nuestra propia ID
-            other_peers = [
-                (pid, p) for pid, p in self.peer_list.items()
-                if pid != self.peer_id and p.get('port') != self.listening_port
-            ]
-            if not other_peers:
-                return None
-            
-            # Devuelve (peer_id, peer_info)
-            return random.choice(other_peers)
+        # La lista de los demás ya viene filtrada en el snapshot: O(1) y sin lock
+        return self.membership.snapshot.random_other()
+
+    def build_sync_request(self) -> bytes:
+        """SYNC_PEERS_REQUEST listo para enviar (anuncia los codecs soportados)."""
+        return create_message(
+            MSG_SYNC_PEERS_REQUEST, sender_id=self.peer_id,
+            content={"compression": SUPPORTED_CODECS}
+        )
 
     def handle_sync_request(self, conn: socket.socket, msg: dict):
         """Un peer nos pide nuestra lista; se la enviamos."""
         # print(f"[Gossip] Recibida solicitud SYNC de {msg['sender_id']}")
-        with self.peer_list_lock:
-            # Creamos una copia para evitar problemas de concurrencia
-            list_to_send = self.peer_list.copy()
-
+        # El snapshot no cambia después de publicado: se serializa sin copiarlo
         response_msg = create_message(
             MSG_SYNC_PEERS_RESPONSE,
             sender_id=self.peer_id,
             to=msg['sender_id'],
-            content={"peer_list": list_to_send}
+            content={"peer_list": self.membership.snapshot.as_dict()}
         )
+        # Comprimir solo si quien pide anunció soporte
+        codec = negotiate_codec((msg.get('content') or {}).get('compression'))
         try:
-            conn.sendall(response_msg)
+            conn.sendall(compress_frame(response_msg, codec))
         except (BrokenPipeError, ConnectionResetError):
             pass
 
@@ -381,79 +647,262 @@ class PeerNode:
         """Recibimos una lista de peers de otro peer; la fusionamos."""
         sender_id = msg['sender_id']
         new_list = msg['content']['peer_list']
-        print(f"[Gossip] Recibida lista de peers de {sender_id}. Fusionando...")
+        log.debug("[Gossip] Recibida lista de peers de %s. Fusionando...", sender_id)
         self.merge_peer_lists(new_list)
 
     def merge_peer_lists(self, new_list: dict):
         """Fusiona una lista de peers recibida con la nuestra."""
-        with self.peer_list_lock:
-            # Simplemente actualizamos. Una fusión más inteligente
-            # podría usar timestamps para ver qué entrada es más nueva.
-            count_before = len(self.peer_list)
-            self.peer_list.update(new_list)
-            count_after = len(self.peer_list)
-
-            if count_after > count_before:
-                print(f"[Peer List] Lista actualizada. Total peers: {count_after}")
-                # print(self.peer_list)
-
-    def remove_dead_peer(self, peer_id: str):
-        """Elimina un peer de la lista si falla la conexión."""
-        with self.peer_list_lock:
-            if peer_id in self.peer_list:
-                print(f"[P2P] Eliminando peer caído: {peer_id}")
-                del self.peer_list[peer_id]
+        # Simplemente actualizamos. Una fusión más inteligente
+        # podría usar timestamps para ver qué entrada es más nueva.
+        count_before, count_after = self.membership.merge(new_list)
+        if count_after > count_before:
+            log.debug("[Peer List] Lista actualizada. Total peers: %s", count_after)
+
+    def remove_dead_peer(self, peer_id: str, departed: bool = False):
+        """
+        Elimina un peer de la lista si falla la conexión. Los mensajes sin ACK
+        hacia él siguen guardados: un corte pasajero no los pierde, el timer
+        los reintenta (si vuelve por gossip o el servidor) hasta MAX_RETRIES.
+        Con departed (baja confirmada por el servidor) se descarta ese estado.
+        """
+        if self.partial:
+            removed = self.partial.peer_failed(peer_id)
+        else:
+            removed = self.membership.remove(peer_id) is not None
+        if removed:
+            log.info("[P2P] Eliminando peer caído: %s", peer_id)
+        self.directory.discard(peer_id)
+        if departed:
+            self.reliable.forget(peer_id)
+        self.files.remove_holder(peer_id)
+        self.outbox.drop(peer_id)
 
     # --- 4. Lógica de Envío de Mensajes ---
 
     def send_chat_message(self, target_peer_id: str, message_content: str):
         """Envía un mensaje de chat directo a un peer específico."""
-        peer_info = None
-        with self.peer_list_lock:
-            peer_info = self.peer_list.get(target_peer_id)
+        if self.lookup_peer(target_peer_id) is None:
+            log.warning("[Chat] Error: Peer %s desconocido.", target_peer_id)
+            return
+
+        rel = self.reliable.next_seq(target_peer_id)
+        msg = build_message(
+            MSG_CHAT,
+            sender_id=self.peer_id,
+            to=target_peer_id,
+            content=message_content,
+            rel=rel,
+            trace=self.tracer.start()
+        )
+        # Se guarda antes de enviar: si el envío falla (ahora o en el outbox),
+        # queda guardado y el timer lo reintenta
+        self.reliable.track(target_peer_id, rel['seq'], msg)
+        if self.send_message(target_peer_id, msg):
+            log.debug("[Chat] Mensaje encolado para %s", target_peer_id)
 
-        if not peer_info:
-            print(f"[Chat] Error: Peer {target_peer_id} desconocido.")
+    def send_message(self, target_peer_id: str, message: dict) -> bool:
+        """
+        Encola un mensaje (dict) hacia un peer. El outbox lo junta con otros
+        mensajes al mismo destino y lo envía por la conexión persistente.
+        """
+        if target_peer_id not in self.membership.snapshot and self.directory.get(target_peer_id) is None:
+            return False
+        message = self.tracer.fork(message) # Cada intento marca sus etapas en su copia
+        self.tracer.stamp(message, "queued")
+        self.outbox.send(target_peer_id, message)
+        return True
+
+    def handle_send_failure(self, target_peer_id: str):
+        """El outbox no pudo conectar con el peer."""
+        log.warning("[Chat] Error: No se pudo conectar con %s. Marcando como caído.", target_peer_id)
+        self.send_failures.inc()
+        self.remove_dead_peer(target_peer_id)
+
+    # --- 5. Lógica de Entrega Confiable ---
+
+    def handle_reliable_receive(self, msg: dict) -> bool:
+        """Registra el seq recibido. Devuelve False si el mensaje es duplicado."""
+        sender_id = msg['sender_id']
+        deliver, ack_now = self.reliable.on_receive(sender_id, msg['rel'])
+        if ack_now:
+            # Muchos mensajes sin tráfico de vuelta: confirmar ya
+            self.send_ack(sender_id, self.reliable.take_ack(sender_id))
+        return deliver
+
+    def handle_ack(self, sender_id: str, ack: dict):
+        """Procesa un ACK; retransmite lo que el ACK selectivo marca como hueco."""
+        for message in self.reliable.on_ack(sender_id, ack):
+            self.send_message(sender_id, message)
+
+    def send_ack(self, target_peer_id: str, ack: dict | None):
+        """Envía un MSG_ACK independiente (cuando no hay un CHAT donde viajar)."""
+        if not ack:
             return
+        msg = build_message(MSG_ACK, sender_id=self.peer_id, to=target_peer_id, ack=ack)
+        self.send_message(target_peer_id, msg)
 
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(5.0)
-            s.connect((peer_info['ip'], peer_info['port']))
-
-            msg = create_message(
-                MSG_CHAT,
-                sender_id=self.peer_id,
-                to=target_peer_id,
-                content=message_content
-            )
-            s.sendall(msg)
-            s.close()
-            print(f"[Chat] Mensaje enviado a {target_peer_id}")
+    def piggyback_ack(self, target_peer_id: str) -> dict | None:
+        """Campos extra para el próximo lote hacia el peer: el ACK pendiente."""
+        ack = self.reliable.take_ack(target_peer_id)
+        return {"ack": ack} if ack else None
 
-        except (ConnectionRefusedError, TimeoutError):
-            print(f"[Chat] Error: No se pudo conectar con {target_peer_id}. Marcando como caído.")
-            self.remove_dead_peer(target_peer_id)
-        except Exception as e:
-            print(f"[Chat] Error enviando a {target_peer_id}: {e}")
+    def start_reliability_timer(self):
+        """Envía ACKs demorados y retransmite mensajes sin confirmar."""
+        while self.running:
+            time.sleep(ACK_DELAY / 2)
+            self.reliability_round()
+
+    def reliability_round(self):
+        """ACKs demorados y retransmisiones vencidas (cada ACK_DELAY / 2)."""
+        for peer_id, ack in self.reliable.due_acks():
+            self.send_ack(peer_id, ack)
+
+        to_resend, given_up = self.reliable.due_retransmits()
+        for peer_id, message in to_resend:
+            log.debug("[Reliable] Retransmitiendo mensaje a %s", peer_id)
+            self.retransmits.inc()
+            self.send_message(peer_id, message)
+        for peer_id in given_up:
+            log.warning("[Reliable] Sin ACK de %s tras varios intentos. Mensajes descartados.", peer_id)
 
     def broadcast_chat_message(self, message_content: str):
         """Envía un mensaje a todos los peers conocidos."""
-        print(f"[Chat] Enviando broadcast: {message_content}")
-        with self.peer_list_lock:
-            # Copiar la lista para evitar problemas si se modifica durante la iteración
-            all_peers_ids = list(self.peer_list.keys())
-
-        for peer_id in all_peers_ids:
+        log.debug("[Chat] Enviando broadcast: %s", message_content)
+        if self.partial:
+            # Sin lista completa: se difunde por el overlay (sin ACK por destino)
+            self.flood_message(build_message(MSG_CHAT, sender_id=self.peer_id, content=message_content))
+            return
+        # El snapshot no cambia mientras se recorre: no hace falta copiarlo
+        for peer_id in self.membership.snapshot.peers:
             if peer_id == self.peer_id:
                 continue # No enviarse a sí mismo
 
-            # Usar threading para no bloquear el broadcast si un peer es lento
-            threading.Thread(
-                target=self.send_chat_message,
-                args=(peer_id, message_content),
-                daemon=True
-            ).start()
+            # No bloquea: cada destino tiene su propia cola en el outbox
+            self.send_chat_message(peer_id, message_content)
+
+    # --- 6. Lógica de Transferencia de Archivos ---
+
+    def share_file(self, path: str) -> dict:
+        """Publica un archivo local y lo ofrece a todos los peers."""
+        meta = self.files.share(path)
+        log.info("[Files] Compartiendo %s (%s bytes)", meta['name'], meta['size'])
+        self.broadcast_message(build_message(MSG_FILE_OFFER, sender_id=self.peer_id, content=meta))
+        return meta
+
+    def download_file(self, file_id: str, dest_path: str | None = None) -> str:
+        """Descarga un archivo ofrecido en paralelo desde todos sus holders."""
+        path = self.files.download(file_id, self.resolve_peer_address, dest_path)
+        # Ahora también somos fuente para los demás
+        self.broadcast_message(build_message(
+            MSG_FILE_HAVE, sender_id=self.peer_id, content={"file_id": file_id}
+        ))
+        return path
+
+    def resolve_peer_address(self, peer_id: str) -> tuple | None:
+        info = self.membership.snapshot.get(peer_id) or self.directory.get(peer_id)
+        return local_link.peer_address(info, self.local_info) if info else None
+
+    def broadcast_message(self, message: dict):
+        """Encola un mensaje (sin confirmación) hacia todos los peers conocidos."""
+        if self.partial:
+            self.flood_message(message)
+            return
+        for peer_id in self.membership.snapshot.peers:
+            if peer_id == self.peer_id:
+                continue
+            self.outbox.send(peer_id, message)
+
+    # --- 7. Vista Parcial (HyParView) ---
+
+    def send_view_message(self, target_peer_id: str, target_peer_info: dict, message: dict):
+        """Transporte de PartialView: por el outbox si el peer está en una vista, si no una conexión suelta."""
+        if target_peer_id in self.membership.snapshot:
+            self.outbox.send(target_peer_id, message)
+        else:
+            # Ej. la respuesta a un SHUFFLE: el origen no está en nuestras vistas
+            if self.host:
+                self.host.submit_io(self.send_direct, target_peer_id, target_peer_info, message)
+            else:
+                threading.Thread(target=self.send_direct, args=(target_peer_id, target_peer_info, message),
+                                 daemon=True).start()
+
+    def send_direct(self, target_peer_id: str, target_peer_info: dict, message: dict):
+        """Envía un mensaje por una conexión de un solo uso (sin outbox)."""
+        try:
+            with local_link.connect_peer(local_link.peer_address(target_peer_info, self.local_info), timeout=SYNC_TIMEOUT) as s:
+                s.sendall(encode_message(message))
+        except OSError as e:
+            log.debug("[View] No se pudo enviar %s a %s: %s", message['type'], target_peer_id, e)
+            self.remove_dead_peer(target_peer_id)
+
+    def flood_message(self, message: dict):
+        """Difunde un mensaje a toda la red por la vista activa de cada peer."""
+        flood = build_message(MSG_FLOOD, sender_id=self.peer_id, content=message, id=uuid.uuid4().hex)
+        self.partial.first_seen(flood['id'])
+        for peer_id in self.partial.flood_targets():
+            self.outbox.send(peer_id, flood)
+
+    def handle_flood(self, conn: socket.socket, addr: tuple, msg: dict):
+        """Entrega un MSG_FLOOD la primera vez que llega y lo reenvía a los demás vecinos."""
+        if not self.partial or not self.partial.first_seen(msg['id']):
+            return
+        forward = dict(msg, sender_id=self.peer_id)
+        for peer_id in self.partial.flood_targets(exclude=msg['sender_id']):
+            self.outbox.send(peer_id, forward)
+        inner = msg['content']
+        if inner.get('type') in FLOODABLE:
+            self.dispatch_p2p_message(conn, addr, inner)
+
+    # --- 8. Consultas al Servidor (GET_PEERS) ---
+
+    def query_peers(self, **query) -> dict | None:
+        """
+        Consulta GET_PEERS al servidor (ver DiscoveryServer.query_peers). Las
+        entradas recibidas quedan en el directorio. None si no responde.
+        """
+        content = {key: value for key, value in query.items() if value is not None}
+        try:
+            with socket.create_connection((self.discovery_server_ip, self.discovery_server_port), timeout=QUERY_TIMEOUT) as s:
+                s.sendall(create_message(MSG_GET_PEERS, sender_id=self.peer_id, content=content))
+                frame = FrameReader(s).read_frame()
+        except OSError as e:
+            log.debug("[Discovery] GET_PEERS sin respuesta: %s", e)
+            return None
+        msg = parse_message(frame) if frame is not None else None
+        if not msg or msg['type'] != MSG_GET_PEERS_RESPONSE:
+            return None
+        self.directory.update(msg['content']['peers'])
+        return msg['content']
+
+    def lookup_peer(self, peer_id: str) -> dict | None:
+        """Entrada de un peer: de la lista, del directorio o, si no, consultada al servidor."""
+        info = self.membership.snapshot.get(peer_id) or self.directory.get(peer_id)
+        if info is None and self.discovery_server_status == "UP":
+            result = self.query_peers(peer_id=peer_id)
+            info = result['peers'].get(peer_id) if result else None
+        return info
+
+    def username_of(self, peer_id: str, default: str | None = None) -> str | None:
+        info = self.lookup_peer(peer_id)
+        return info['username'] if info else default
+
+    def list_peers(self, prefix: str | None = None, after: str | None = None, limit: int = PEERS_PAGE) -> dict:
+        """
+        Una página de los demás peers, como la respuesta de GET_PEERS: del
+        servidor si está arriba; si no, de la lista local.
+        """
+        if self.discovery_server_status == "UP":
+            result = self.query_peers(prefix=prefix or None, after=after, limit=limit)
+            if result:
+                if not prefix or self.peer_id.startswith(prefix):
+                    result['total'] -= 1 # El servidor también nos cuenta a nosotros
+                result['peers'].pop(self.peer_id, None)
+                return result
+
+        # Índice ordenado de la versión actual de la lista (sin recorrerla)
+        snapshot = self.membership.snapshot
+        ids, cursor, total = snapshot.search(prefix, after, limit)
+        return {"peers": {pid: snapshot.get(pid) for pid in ids}, "next": cursor, "total": total}
 
     def demo_message_sender(self):
         """Función de demostración que envía un broadcast cada 20 seg."""
@@ -471,46 +920,47 @@ class PeerNode:
         Ejecuta un ciclo de sincronización Gossip con un peer aleatorio.
         Esto es para ser llamado manualmente (ej. desde la UI).
         """
-        print("[Gossip] Ejecutando ciclo de Gossip manual.")
+        with self.gossip_rounds.time():
+            log.info("[Gossip] Ejecutando ciclo de Gossip manual.")
+
+            if self.partial:
+                self.partial.tick()
+                return
         
-        result = self.get_random_peer()
-        if not result:
-            print("[Gossip] No hay otros peers con quien sincronizar.")
-            return
+            result = self.get_random_peer()
+            if not result:
+                log.info("[Gossip] No hay otros peers con quien sincronizar.")
+                return
 
-        target_peer_id, target_peer_info = result
+            self.sync_with_peer(*result)
 
+    def sync_with_peer(self, target_peer_id: str, target_peer_info: dict):
+        """SYNC_PEERS_REQUEST por TCP y fusión de la respuesta (lista completa)."""
         try:
-            print(f"[Gossip] Sincronizando con {target_peer_info['username']}...")
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(5.0)
-            s.connect((target_peer_info['ip'], target_peer_info['port']))
+            log.debug("[Gossip] Sincronizando con %s...", target_peer_info['username'])
+            s = local_link.connect_peer(local_link.peer_address(target_peer_info, self.local_info), timeout=SYNC_TIMEOUT)
 
             # Pedirle su lista
-            msg = create_message(MSG_SYNC_PEERS_REQUEST, sender_id=self.peer_id)
-            s.sendall(msg)
+            s.sendall(self.build_sync_request())
 
             # Esperar la respuesta aquí mismo para forzar la actualización de la UI
-            buffer = b""
-            data = s.recv(4096) # Asumir < 4k
-            s.close()
-            if not data:
+            # (la lista completa puede ocupar muchos paquetes)
+            response_data = FrameReader(s).read_frame()
+            if response_data is None:
+                s.close()
                 raise ConnectionError("No data received from peer")
-            
-            buffer += data
-
-            if b'\n' in buffer:
-                response_data, _ = buffer.split(b'\n', 1)
-                response_msg = parse_message(response_data)
-                if response_msg and response_msg['type'] == MSG_SYNC_PEERS_RESPONSE:
-                    self.handle_sync_response(response_msg)
-                    print("[Gossip] Sincronización manual completada.")
-                    return
-            
-            print("[Gossip] Respuesta de sincronización inválida.")
+
+            response_msg = parse_message(response_data)
+            s.close()
+            if response_msg and response_msg['type'] == MSG_SYNC_PEERS_RESPONSE:
+                self.handle_sync_response(response_msg)
+                log.debug("[Gossip] Sincronización completada con %s.", target_peer_info['username'])
+                return
+
+            log.warning("[Gossip] Respuesta de sincronización inválida.")
 
         except (ConnectionRefusedError, TimeoutError, ConnectionError):
-            print(f"[Gossip] Peer {target_peer_info['username']} no responde. Eliminando.")
+            log.info("[Gossip] Peer %s no responde. Eliminando.", target_peer_info['username'])
             self.remove_dead_peer(target_peer_id)
         except Exception as e:
-            print(f"[Gossip] Error al sincronizar con {target_peer_info.get('username')}: {e}")
\ No newline at end of file
+            log.warning("[Gossip] Error al sincronizar con %s: %s", target_peer_info.get('username'), e)
@@ -0,0 +1,185 @@
+"""#### Entrega Confiable entre Peers
+
+Números de secuencia por enlace (emisor -> receptor), ACKs acumulativos
+y selectivos agrupados, retransmisión y supresión de duplicados.
+
+Esta clase solo mantiene el estado; el envío real lo hace el PeerNode.
+"""
+
+import threading
+import time
+import uuid
+
+ACK_DELAY = 0.2          # Máx. segundos que un ACK espera para ir "a caballito"
+ACK_BATCH = 32           # Mensajes recibidos que fuerzan un ACK inmediato
+RETRANSMIT_TIMEOUT = 2.0 # Reenviar si no llegó ACK en este tiempo
+MAX_RETRIES = 5          # Después de esto, el mensaje se descarta
+
+
+class OutboundLink:
+    """Estado del emisor hacia un peer destino."""
+
+    def __init__(self):
+        self.next_seq = 1
+        # { seq: [mensaje (dict), last_sent, retries] }
+        self.unacked = {}
+
+
+class InboundLink:
+    """Estado del receptor para un peer origen (una encarnación = un epoch)."""
+
+    def __init__(self, epoch: str):
+        self.epoch = epoch
+        self.cum = 0                 # Todo seq <= cum ya fue recibido
+        self.out_of_order = set()    # seq > cum + 1 ya recibidos
+        self.pending = 0             # Mensajes recibidos aún sin confirmar
+        self.pending_since = None
+
+    def accept(self, seq: int, base: int = 1) -> bool:
+        """Registra un seq. Devuelve False si es un duplicado."""
+        if base - 1 > self.cum:
+            # El emisor abandonó todo lo anterior a base
+            self.cum = base - 1
+            self.out_of_order = {s for s in self.out_of_order if s > self.cum}
+        if seq <= self.cum or seq in self.out_of_order:
+            return False
+        self.out_of_order.add(seq)
+        while self.cum + 1 in self.out_of_order:
+            self.cum += 1
+            self.out_of_order.discard(self.cum)
+        return True
+
+    def ack_content(self) -> dict:
+        return {"epoch": self.epoch, "cum": self.cum, "sack": sorted(self.out_of_order)}
+
+
+class ReliableLinks:
+    def __init__(self):
+        # Identifica esta encarnación del peer: si reinicia, los seq vuelven a 1
+        self.epoch = uuid.uuid4().hex[:8]
+        self.outbound = {}  # { peer_id: OutboundLink }
+        self.inbound = {}   # { peer_id: InboundLink }
+        self.lock = threading.Lock()
+
+    # --- Lado Emisor ---
+
+    def next_seq(self, peer_id: str) -> dict:
+        """Reserva el próximo número de secuencia hacia peer_id."""
+        with self.lock:
+            link = self.outbound.setdefault(peer_id, OutboundLink())
+            seq = link.next_seq
+            link.next_seq += 1
+            # "base": seq más bajo que aún puede llegar. Lo anterior fue
+            # confirmado o descartado, así el receptor no espera huecos eternos.
+            base = min(link.unacked) if link.unacked else seq
+            # Reservado pero aún sin datos: cuenta como pendiente para "base"
+            link.unacked[seq] = [None, time.time(), 0]
+        return {"epoch": self.epoch, "seq": seq, "base": base}
+
+    def track(self, peer_id: str, seq: int, message: dict):
+        """Guarda el mensaje hasta que sea confirmado."""
+        with self.lock:
+            link = self.outbound.get(peer_id)
+            if link and seq in link.unacked:
+                link.unacked[seq] = [message, time.time(), 0]
+
+    def on_ack(self, peer_id: str, ack: dict) -> list[dict]:
+        """
+        Procesa un ACK de peer_id. Devuelve los mensajes a retransmitir
+        de inmediato porque el ACK selectivo revela un hueco.
+        """
+        if ack.get("epoch") != self.epoch:
+            return [] # ACK de una encarnación anterior
+        cum = ack.get("cum", 0)
+        sack = set(ack.get("sack", []))
+        to_resend = []
+        now = time.time()
+        with self.lock:
+            link = self.outbound.get(peer_id)
+            if not link:
+                return []
+            for seq in list(link.unacked):
+                if seq <= cum or seq in sack:
+                    del link.unacked[seq]
+            if sack:
+                highest = max(sack)
+                for seq, entry in link.unacked.items():
+                    # Hueco: algo posterior llegó pero esto no.
+                    # No reenviar si ya se reenvió hace muy poco.
+                    if seq < highest and entry[0] and now - entry[1] >= ACK_DELAY:
+                        entry[1] = now
+                        entry[2] += 1
+                        to_resend.append(entry[0])
+        return to_resend
+
+    def due_retransmits(self) -> tuple[list[tuple[str, dict]], list[str]]:
+        """
+        Devuelve (mensajes vencidos a reenviar, peers que agotaron reintentos).
+        """
+        to_resend = []
+        given_up = []
+        now = time.time()
+        with self.lock:
+            for peer_id, link in self.outbound.items():
+                for seq, entry in list(link.unacked.items()):
+                    if entry[0] is None or now - entry[1] < RETRANSMIT_TIMEOUT:
+                        continue
+                    if entry[2] >= MAX_RETRIES:
+                        del link.unacked[seq]
+                        if peer_id not in given_up:
+                            given_up.append(peer_id)
+                        continue
+                    entry[1] = now
+                    entry[2] += 1
+                    to_resend.append((peer_id, entry[0]))
+        return to_resend, given_up
+
+    def forget(self, peer_id: str):
+        """Descarta el estado de ambos sentidos con un peer eliminado."""
+        with self.lock:
+            self.outbound.pop(peer_id, None)
+            self.inbound.pop(peer_id, None)
+
+    # --- Lado Receptor ---
+
+    def on_receive(self, peer_id: str, rel: dict) -> tuple[bool, bool]:
+        """
+        Registra un mensaje con campo "rel".
+        Devuelve (entregar, ack_inmediato).
+        """
+        epoch = rel.get("epoch")
+        seq = rel.get("seq")
+        with self.lock:
+            link = self.inbound.get(peer_id)
+            if not link or link.epoch != epoch:
+                # Primer mensaje o el peer reinició: nuevo enlace
+                link = InboundLink(epoch)
+                self.inbound[peer_id] = link
+            deliver = link.accept(seq, rel.get("base", 1))
+            # Los duplicados también se confirman: el ACK anterior pudo perderse
+            link.pending += 1
+            if link.pending_since is None:
+                link.pending_since = time.time()
+            return deliver, link.pending >= ACK_BATCH
+
+    def take_ack(self, peer_id: str) -> dict | None:
+        """Toma el ACK pendiente para peer_id (para enviarlo a caballito)."""
+        with self.lock:
+            link = self.inbound.get(peer_id)
+            if not link or not link.pending:
+                return None
+            link.pending = 0
+            link.pending_since = None
+            return link.ack_content()
+
+    def due_acks(self) -> list[tuple[str, dict]]:
+        """ACKs que esperaron más de ACK_DELAY sin tráfico de vuelta."""
+        now = time.time()
+        due = []
+        with self.lock:
+            for peer_id, link in self.inbound.items():
+                if link.pending and now - link.pending_since >= ACK_DELAY:
+                    link.pending = 0
+                    link.pending_since = None
+                    due.append((peer_id, link.ack_content()))
+        return due
@@ -1,6 +1,7 @@
 
 """#### Lanzador del Servidor"""
 
+import argparse
 import os
 import sys
 
@@ -8,15 +9,40 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 from discovery_server.discovery_server import DiscoveryServer
+from discovery_server.workers import run_workers
+from common.metrics import serve_http
+from common.log import set_level
 
 # Configuración
 HOST = '0.0.0.0'
 PORT = 9999
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de Descubrimiento")
+    parser.add_argument("--metrics-port", type=int, help="Exponer métricas por HTTP local en este puerto (worker i: puerto + i)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos que comparten el puerto con SO_REUSEPORT (1 = un solo proceso)")
+    parser.add_argument("--bootstrap-contacts", type=int, default=0,
+                        help="Entregar solo K contactos al azar en el REGISTER_ACK, sin PEER_LIST_UPDATE "
+                             "(para peers con vista parcial; 0 = lista completa)")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Nivel de log (por defecto P2P_LOG_LEVEL o INFO)")
+    args = parser.parse_args()
+    if args.log_level:
+        set_level(args.log_level)
+
     print("Iniciando Servidor de Descubrimiento...")
-    server = DiscoveryServer(HOST, PORT)
+    if args.workers > 1:
+        try:
+            run_workers(HOST, PORT, args.workers, args.metrics_port, args.bootstrap_contacts)
+        except KeyboardInterrupt:
+            print("\n[Server] Cerrando servidor.")
+        sys.exit(0)
+
+    server = DiscoveryServer(HOST, PORT, bootstrap_contacts=args.bootstrap_contacts)
+    if args.metrics_port:
+        serve_http(server.metrics, args.metrics_port)
     try:
         server.start()
     except KeyboardInterrupt:
-        print("\n[Server] Cerrando servidor.")
\ No newline at end of file
+        print("\n[Server] Cerrando servidor.")
@@ -0,0 +1,454 @@
+"""#### Clúster Simulado de PeerNodes
+
+Corre PeerNodes y un DiscoveryServer reales sobre la red virtual. Del
+código real se usa la lógica de membresía y gossip (register_peer,
+unregister_peer, broadcast_peer_update, check_peer_timeouts,
+handle_register_ack, handle_peer_list_update, get_random_peer,
+handle_sync_request, merge_peer_lists, remove_dead_peer); el clúster solo
+reemplaza los hilos y sockets por timers y conexiones virtuales.
+
+Estrategias de gossip:
+- "pull": la del código real (run_gossip_cycle): pedir la lista a un peer
+  al azar y fusionarla.
+- "push": enviar la propia lista (un SYNC_PEERS_RESPONSE) a un peer al azar.
+- "push-pull": ambas en cada ciclo.
+- "digest-pull": la de start_gossip_protocol con UDP: un ping con el digest
+  de la lista (handle_datagram real del destino) y el pull solo si los
+  digests difieren. Un ping perdido pasa directo al pull (sin reintentos).
+- "hyparview": PeerNodes con vista parcial (peer/partial_view.py) y el
+  servidor en modo bootstrap_contacts. Cada ciclo es un tick() (SHUFFLE y
+  reparación de la vista activa). La membresía "converge" cuando las vistas
+  activas solo tienen peers vivos y forman un overlay conexo.
+"""
+
+import random
+from collections import deque
+
+from common.protocol import (
+    create_message, parse_message, encode_message, SUPPORTED_CODECS,
+    MSG_REGISTER, MSG_REGISTER_ACK, MSG_HEARTBEAT, MSG_UNREGISTER, MSG_PEER_LIST_UPDATE, MSG_PING
+)
+from discovery_server.discovery_server import DiscoveryServer, MONITOR_INTERVAL
+from peer.peer_node import PeerNode, GOSSIP_INTERVAL, HEARTBEAT_INTERVAL, RECONNECT_INTERVAL, SYNC_TIMEOUT
+from simulation.network import SimClock, VirtualNetwork, VirtualConnection
+
+SERVER_ADDR = ("10.255.255.254", 9999)
+BASE_PORT = 10000
+STRATEGIES = ("pull", "push", "push-pull", "digest-pull", "hyparview")
+BOOTSTRAP_CONTACTS = 5 # Contactos por REGISTER_ACK con "hyparview"
+
+
+class SimNode:
+    """Un PeerNode real más el estado que en producción viven en sus hilos."""
+
+    def __init__(self, index: int, peer: PeerNode, addr: tuple[str, int]):
+        self.index = index
+        self.peer = peer
+        self.addr = addr
+        self.alive = True
+        self.to_server = None   # VirtualConnection peer -> servidor
+        self.from_server = None # VirtualConnection servidor -> peer
+
+    @property
+    def info(self) -> dict:
+        return {"ip": self.addr[0], "port": self.addr[1], "username": self.peer.username}
+
+
+class VirtualDatagrams:
+    """Lo que handle_datagram usa de un DatagramChannel: send(addr, frame)."""
+
+    def __init__(self, net: VirtualNetwork, src: tuple[str, int], on_data):
+        self.net = net
+        self.src = src
+        self.on_data = on_data
+
+    def send(self, addr: tuple[str, int], frame: bytes):
+        self.net.deliver(self.src, addr, frame, self.on_data)
+
+
+class SimCluster:
+    def __init__(self, seed: int = 0, latency: tuple[float, float] = (0.001, 0.010), loss: float = 0.0,
+                 strategy: str = "pull", fanout: int = 1, gossip_interval: float = GOSSIP_INTERVAL,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL, with_server: bool = True):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Estrategia desconocida: {strategy}")
+        # get_random_peer usa el módulo random: sembrarlo hace la corrida reproducible
+        random.seed(seed)
+        self.rng = random.Random(seed)
+        self.clock = SimClock()
+        self.net = VirtualNetwork(self.clock, self.rng, latency=latency, loss=loss)
+        self.strategy = strategy
+        self.fanout = fanout
+        self.gossip_interval = gossip_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.partial = strategy == "hyparview"
+
+        self.nodes = []
+        self.by_addr = {}
+        self.server = None
+        self.server_peer_ids = {} # { addr: peer_id } según el servidor
+        self.sync_exchanges = 0
+        self.sync_timeouts = 0
+        self.probes = 0         # Pings con digest (digest-pull)
+        self.probes_in_sync = 0 # ... que evitaron el SYNC por TCP
+        self.view_messages = 0  # Mensajes de vista parcial (hyparview)
+        if with_server:
+            self.start_server()
+
+    # --- Servidor de Descubrimiento ---
+
+    def start_server(self):
+        """Arranca (o reinicia, sin estado) el servidor de descubrimiento."""
+        self.server = DiscoveryServer(*SERVER_ADDR, bootstrap_contacts=BOOTSTRAP_CONTACTS if self.partial else 0)
+        self.server.clock = self.clock.time
+        self.net.add(SERVER_ADDR)
+        self.clock.call_later(MONITOR_INTERVAL, self._monitor, self.server)
+
+    def crash_server(self):
+        """El proceso del servidor muere: los peers ven la conexión cerrada."""
+        self.net.crash(SERVER_ADDR)
+        self.server = None
+        for node in self.nodes:
+            if node.from_server:
+                self.clock.call_later(self.rng.uniform(*self.net.latency),
+                                      self._discovery_lost, node, node.from_server)
+
+    def _monitor(self, server: DiscoveryServer):
+        if server is not self.server:
+            return # Servidor caído o reemplazado
+        server.check_peer_timeouts()
+        self.clock.call_later(MONITOR_INTERVAL, self._monitor, server)
+
+    def _server_receive(self, node: SimNode, frame: bytes):
+        """Lo que hace handle_client con cada mensaje de un peer."""
+        if not self.server:
+            return
+        msg = parse_message(frame)
+        if not msg:
+            return
+        if msg['type'] == MSG_REGISTER:
+            peer_id = self.server.register_peer(node.from_server, node.addr, msg['content'])
+            self.server_peer_ids[node.addr] = peer_id
+        elif msg['type'] == MSG_HEARTBEAT:
+            self.server.update_heartbeat(msg['sender_id'])
+        elif msg['type'] == MSG_UNREGISTER:
+            self.server.unregister_peer(msg['sender_id'])
+
+    # --- Peers ---
+
+    def add_node(self, register: bool | None = None) -> SimNode:
+        """
+        Crea un PeerNode en una dirección nueva y arranca sus timers. Con
+        servidor, se registra (salvo register=False).
+        """
+        index = len(self.nodes)
+        # IP distinta por peer; el puerto también, porque get_random_peer
+        # excluye a los peers que comparten el propio puerto
+        addr = (f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}", BASE_PORT + index % 55000)
+        peer = PeerNode(f"n{index}", addr[1], *SERVER_ADDR, partial_view=self.partial)
+        peer.peer_id = f"{peer.username}@{addr[0]}:{addr[1]}" # Mismo formato que asigna el servidor
+        peer.heartbeat_interval = self.heartbeat_interval
+        peer.gossip_interval = self.gossip_interval
+
+        node = SimNode(index, peer, addr)
+        if peer.partial:
+            peer.partial.send = lambda target_id, info, message: self._send_view(node, target_id, info, message)
+        self.nodes.append(node)
+        self.by_addr[addr] = node
+        self.net.add(addr)
+
+        if register is None:
+            register = self.server is not None
+        if register:
+            self._connect_to_discovery(node)
+        # Cada peer arrancó en un momento distinto: fase de gossip al azar
+        self.clock.call_later(self.rng.uniform(0, self.gossip_interval), self._gossip, node)
+        return node
+
+    def add_nodes(self, n: int, register: bool | None = None, arrival_interval: float = 0.0) -> list[SimNode]:
+        """Agrega n peers, espaciando sus llegadas arrival_interval segundos."""
+        added = []
+        for i in range(n):
+            if arrival_interval and i:
+                self.clock.run(until=self.clock.now + arrival_interval)
+            added.append(self.add_node(register))
+        return added
+
+    def bootstrap(self, kind: str = "ring", k: int = 1):
+        """
+        Vistas iniciales sin servidor: "ring" (cada uno conoce al siguiente),
+        "random" (k peers al azar) o "full" (todos conocen a todos).
+        """
+        infos = {node.peer.peer_id: node.info for node in self.nodes}
+        ids = list(infos)
+        for i, node in enumerate(self.nodes):
+            if kind == "full":
+                view = dict(infos)
+            elif kind == "ring":
+                view = {ids[(i + j) % len(ids)]: infos[ids[(i + j) % len(ids)]] for j in range(k + 1)}
+            elif kind == "random":
+                view = {pid: infos[pid] for pid in self.rng.sample(ids, min(k, len(ids)))}
+                view[node.peer.peer_id] = node.info
+            else:
+                raise ValueError(f"Bootstrap desconocido: {kind}")
+            if node.peer.partial:
+                node.peer.partial.join(view)
+            else:
+                node.peer.merge_peer_lists(view)
+
+    def crash(self, node: SimNode):
+        """El peer muere sin desregistrarse."""
+        node.alive = False
+        self.net.crash(node.addr)
+
+    def leave(self, node: SimNode):
+        """Salida limpia: UNREGISTER al servidor y luego se apaga."""
+        if node.to_server:
+            node.to_server.sendall(create_message(MSG_UNREGISTER, sender_id=node.peer.peer_id))
+        # Dar tiempo a que el UNREGISTER salga antes de bajar la dirección
+        self.clock.call_later(self.net.latency[1], self.crash, node)
+
+    def alive_nodes(self) -> list[SimNode]:
+        return [node for node in self.nodes if node.alive]
+
+    # --- Cliente de Descubrimiento (connect_to_discovery / start_discovery_heartbeat) ---
+
+    def _connect_to_discovery(self, node: SimNode):
+        if not node.alive:
+            return
+        if not self.net.connect(node.addr, SERVER_ADDR):
+            node.peer.discovery_server_status = "DOWN"
+            self.clock.call_later(RECONNECT_INTERVAL, self._connect_to_discovery, node)
+            return
+        node.to_server = VirtualConnection(self.net, node.addr, SERVER_ADDR,
+                                           lambda frame: self._server_receive(node, frame))
+        node.from_server = VirtualConnection(self.net, SERVER_ADDR, node.addr,
+                                             lambda frame: self._discovery_receive(node, frame))
+        conn = node.from_server
+        conn.on_close = lambda: self._discovery_lost(node, conn)
+        node.to_server.sendall(node.peer.build_register_request())
+
+    def _discovery_receive(self, node: SimNode, frame: bytes):
+        msg = parse_message(frame)
+        if not msg or not node.alive:
+            return
+        if msg['type'] == MSG_REGISTER_ACK:
+            node.peer.handle_register_ack(msg)
+            self.clock.call_later(self.heartbeat_interval, self._heartbeat, node, node.to_server)
+        elif msg['type'] == MSG_PEER_LIST_UPDATE:
+            node.peer.handle_peer_list_update(msg)
+
+    def _heartbeat(self, node: SimNode, conn: VirtualConnection):
+        if not node.alive or node.to_server is not conn:
+            return # Peer caído o conexión reemplazada
+        conn.sendall(create_message(MSG_HEARTBEAT, sender_id=node.peer.peer_id))
+        self.clock.call_later(self.heartbeat_interval, self._heartbeat, node, conn)
+
+    def _discovery_lost(self, node: SimNode, conn: VirtualConnection):
+        """El servidor cerró la conexión (o murió): reintentar como connect_to_discovery."""
+        if not node.alive or node.from_server is not conn:
+            return # Aviso de una conexión vieja
+        node.peer.discovery_server_status = "DOWN"
+        node.to_server = node.from_server = None
+        self.clock.call_later(RECONNECT_INTERVAL, self._connect_to_discovery, node)
+
+    # --- Gossip (start_gossip_protocol / run_gossip_cycle) ---
+
+    def _gossip(self, node: SimNode):
+        if not node.alive:
+            return
+        if node.peer.partial:
+            node.peer.partial.tick()
+            self.clock.call_later(self.gossip_interval, self._gossip, node)
+            return
+        for _ in range(self.fanout):
+            target = node.peer.get_random_peer()
+            if not target:
+                break
+            target_id, info = target
+            dst = (info['ip'], info['port'])
+            if self.strategy == "digest-pull":
+                self._probe(node, target_id, dst)
+            if self.strategy in ("pull", "push-pull"):
+                self._pull(node, target_id, dst)
+            if self.strategy in ("push", "push-pull"):
+                self._push(node, target_id, dst)
+        self.clock.call_later(self.gossip_interval, self._gossip, node)
+
+    def _pull(self, node: SimNode, target_id: str, dst: tuple[str, int]):
+        """SYNC_PEERS_REQUEST -> SYNC_PEERS_RESPONSE, con timeout como en run_gossip_cycle."""
+        self.sync_exchanges += 1
+        exchange = {"done": False}
+        self.clock.call_later(SYNC_TIMEOUT, self._sync_timeout, node, target_id, exchange)
+        if not self.net.connect(node.addr, dst):
+            return
+        target = self.by_addr[dst]
+
+        def on_response(frame: bytes):
+            exchange["done"] = True
+            msg = parse_message(frame)
+            if msg and node.alive:
+                node.peer.dispatch_p2p_message(None, dst, msg)
+
+        reply = VirtualConnection(self.net, dst, node.addr, on_response)
+        request = VirtualConnection(self.net, node.addr, dst,
+                                    lambda frame: self._p2p_receive(target, node.addr, reply, frame))
+        request.sendall(node.peer.build_sync_request())
+
+    def _probe(self, node: SimNode, target_id: str, dst: tuple[str, int]):
+        """Ping con el digest (probe_in_sync); SYNC por TCP solo si las listas difieren."""
+        self.probes += 1
+        if not self.net.connect(node.addr, dst):
+            # Ping perdido o destino caído: como al agotar los reintentos UDP
+            self._pull(node, target_id, dst)
+            return
+        target = self.by_addr[dst]
+        digest = node.peer.membership.snapshot.digest
+
+        def on_pong(frame: bytes):
+            msg = parse_message(frame)
+            if not (msg and node.alive):
+                return
+            if (msg.get('content') or {}).get('digest') == digest:
+                self.probes_in_sync += 1
+            else:
+                self._pull(node, target_id, dst)
+
+        def on_ping(frame: bytes):
+            msg = parse_message(frame)
+            if msg and target.alive:
+                target.peer.handle_datagram(msg, node.addr, VirtualDatagrams(self.net, dst, on_pong))
+
+        self.net.deliver(node.addr, dst, create_message(
+            MSG_PING, sender_id=node.peer.peer_id, content={"digest": digest}, nonce=1), on_ping)
+
+    def _push(self, node: SimNode, target_id: str, dst: tuple[str, int]):
+        """Enviar la propia lista sin que la pidan (reusa handle_sync_request del emisor)."""
+        self.sync_exchanges += 1
+        if not self.net.connect(node.addr, dst):
+            exchange = {"done": False}
+            self.clock.call_later(SYNC_TIMEOUT, self._sync_timeout, node, target_id, exchange)
+            return
+        target = self.by_addr[dst]
+        conn = VirtualConnection(self.net, node.addr, dst,
+                                 lambda frame: self._p2p_receive(target, node.addr, None, frame))
+        node.peer.handle_sync_request(conn, {"sender_id": target_id,
+                                             "content": {"compression": SUPPORTED_CODECS}})
+
+    def _send_view(self, node: SimNode, target_id: str, info: dict, message: dict):
+        """Transporte de PartialView (send_view_message): un frame por una conexión virtual."""
+        if not node.alive:
+            return
+        self.view_messages += 1
+        dst = (info['ip'], info['port'])
+        if not self.net.connect(node.addr, dst):
+            # Como el outbox: tras el timeout de conexión, el peer se da por caído
+            self.clock.call_later(SYNC_TIMEOUT, self._view_send_failed, node, target_id)
+            return
+        target = self.by_addr[dst]
+        VirtualConnection(self.net, node.addr, dst,
+                          lambda frame: self._p2p_receive(target, node.addr, None, frame)).sendall(encode_message(message))
+
+    def _view_send_failed(self, node: SimNode, target_id: str):
+        if node.alive:
+            node.peer.remove_dead_peer(target_id)
+
+    def _p2p_receive(self, node: SimNode, addr: tuple[str, int], conn: VirtualConnection | None, frame: bytes):
+        """Lo que hace handle_p2p_connection con cada frame."""
+        msg = parse_message(frame)
+        if msg and node.alive:
+            node.peer.dispatch_p2p_message(conn, addr, msg)
+
+    def _sync_timeout(self, node: SimNode, target_id: str, exchange: dict):
+        if exchange["done"] or not node.alive:
+            return
+        self.sync_timeouts += 1
+        node.peer.remove_dead_peer(target_id)
+
+    # --- Observación ---
+
+    def membership_converged(self) -> bool:
+        """Todos los peers vivos conocen exactamente a los peers vivos."""
+        if self.partial:
+            return self.overlay_healthy()
+        alive = self.alive_nodes()
+        expected = {node.peer.peer_id for node in alive}
+        return all(node.peer.peer_list.keys() == expected for node in alive)
+
+    def stale_entries(self) -> int:
+        """Entradas de peers muertos que siguen en alguna lista."""
+        dead = {node.peer.peer_id for node in self.nodes if not node.alive}
+        return sum(len(dead & node.peer.peer_list.keys()) for node in self.alive_nodes())
+
+    def missing_entries(self) -> int:
+        """
+        Peers vivos que alguna lista todavía no conoce. Con vista parcial nadie
+        conoce a todos: peers vivos fuera del overlay (los que no alcanzaría un MSG_FLOOD).
+        """
+        alive = self.alive_nodes()
+        if self.partial:
+            return len(alive) - self.overlay_reach(alive[0]) if alive else 0
+        expected = {node.peer.peer_id for node in alive}
+        return sum(len(expected - node.peer.peer_list.keys()) for node in alive)
+
+    def overlay_reach(self, node: SimNode) -> int:
+        """Peers vivos alcanzables desde node por las vistas activas (lo que cubre un MSG_FLOOD)."""
+        by_id = {n.peer.peer_id: n for n in self.alive_nodes()}
+        seen = {node.peer.peer_id}
+        pending = deque([node])
+        while pending:
+            for pid in pending.popleft().peer.partial.active:
+                if pid in by_id and pid not in seen:
+                    seen.add(pid)
+                    pending.append(by_id[pid])
+        return len(seen)
+
+    def overlay_healthy(self) -> bool:
+        """Vistas activas sin peers muertos y overlay conexo entre los vivos."""
+        alive = self.alive_nodes()
+        if not alive:
+            return True
+        ids = {node.peer.peer_id for node in alive}
+        if any(not node.peer.partial.active.keys() <= ids for node in alive):
+            return False
+        return self.overlay_reach(alive[0]) == len(alive)
+
+    def run_until_converged(self, timeout: float, check_every: float | None = None) -> float | None:
+        """
+        Avanza la simulación hasta que la membresía converja. Devuelve el
+        tiempo virtual que tardó, o None si no convergió antes de timeout.
+        """
+        check_every = check_every or self.gossip_interval / 2
+        start = self.clock.now
+        deadline = start + timeout
+        while self.clock.now < deadline:
+            if self.membership_converged():
+                return round(self.clock.now - start, 3)
+            self.clock.run(until=min(self.clock.now + check_every, deadline))
+        return round(self.clock.now - start, 3) if self.membership_converged() else None
+
+    def stats(self) -> dict:
+        return {
+            "virtual_time_s": round(self.clock.now, 3),
+            "events": self.clock.events_run,
+            "frames": self.net.frames_sent,
+            "bytes": self.net.bytes_sent,
+            "failed_connections": self.net.connections_failed,
+            "sync_exchanges": self.sync_exchanges,
+            "sync_timeouts": self.sync_timeouts,
+            "probes": self.probes,
+            "probes_in_sync": self.probes_in_sync,
+        } | (self.view_stats() if self.partial else {})
+
+    def view_stats(self) -> dict:
+        """Tamaño de las vistas: el estado de membresía por peer."""
+        alive = self.alive_nodes()
+        known = [len(node.peer.peer_list) for node in alive] or [0]
+        active = [len(node.peer.partial.active) for node in alive] or [0]
+        return {
+            "view_messages": self.view_messages,
+            "known_peers_avg": round(sum(known) / len(known), 1),
+            "known_peers_max": max(known),
+            "active_view_min": min(active),
+            "active_view_avg": round(sum(active) / len(active), 2),
+        }
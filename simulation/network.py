@@ -0,0 +1,148 @@
+"""#### Red Virtual y Reloj Simulado
+
+Transporte en memoria para correr la lógica real de PeerNode y
+DiscoveryServer sin sockets ni hilos:
+
+- SimClock: tiempo virtual y cola de eventos. Todo corre en un solo hilo,
+  en orden de tiempo, así que una misma semilla da siempre el mismo resultado.
+- VirtualNetwork: entrega frames entre direcciones (ip, port) con latencia
+  configurable, pérdida y particiones.
+- VirtualConnection: lo único que el código real usa de un socket en los
+  handlers (sendall/close), para pasarlo donde esperan un `conn`.
+
+La pérdida se modela a nivel de conexión, como la vería TCP: un intento
+de conexión/intercambio falla entero (el emisor ve un timeout), no se
+pierden frames sueltos dentro de una conexión establecida.
+"""
+
+import heapq
+import random
+
+Address = tuple[str, int]
+
+
+class SimClock:
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self.queue = []
+        self.counter = 0 # Desempate estable entre eventos del mismo instante
+        self.events_run = 0
+
+    def time(self) -> float:
+        """Reemplazo de time.time para el código bajo simulación."""
+        return self.now
+
+    def call_at(self, when: float, callback, *args):
+        self.counter += 1
+        heapq.heappush(self.queue, (when, self.counter, callback, args))
+
+    def call_later(self, delay: float, callback, *args):
+        self.call_at(self.now + delay, callback, *args)
+
+    def run(self, until: float | None = None, stop=None) -> bool:
+        """
+        Ejecuta eventos hasta `until` (tiempo virtual) o hasta que stop()
+        devuelva True. Devuelve True si paró por stop().
+        """
+        while self.queue:
+            when = self.queue[0][0]
+            if until is not None and when > until:
+                break
+            _, _, callback, args = heapq.heappop(self.queue)
+            self.now = when
+            callback(*args)
+            self.events_run += 1
+            if stop and stop():
+                return True
+        if until is not None:
+            self.now = max(self.now, until)
+        return False
+
+
+class VirtualConnection:
+    """Extremo de una conexión virtual: sendall entrega en el otro extremo."""
+
+    def __init__(self, network: "VirtualNetwork", src: Address, dst: Address, on_data):
+        self.network = network
+        self.src = src
+        self.dst = dst
+        self.on_data = on_data # on_data(frame: bytes) en el destino
+        self.on_close = None   # on_close() en el destino, cuando este lado cierra
+        self.closed = False
+
+    def sendall(self, data: bytes):
+        if self.closed:
+            raise BrokenPipeError("Conexión virtual cerrada")
+        self.network.deliver(self.src, self.dst, data, self.on_data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.on_close:
+            # El otro extremo ve el EOF tras la latencia de la red
+            self.network.clock.call_later(self.network.rng.uniform(*self.network.latency), self.on_close)
+
+
+class VirtualNetwork:
+    def __init__(self, clock: SimClock, rng: random.Random,
+                 latency: tuple[float, float] = (0.001, 0.010), loss: float = 0.0):
+        """
+        latency: (mínimo, máximo) en segundos, uniforme por frame
+        loss: probabilidad de que falle un intento de conexión
+        """
+        self.clock = clock
+        self.rng = rng
+        self.latency = latency
+        self.loss = loss
+        self.up = set()      # Direcciones con un proceso vivo
+        self.groups = {}     # Partición: { address: grupo }. Vacío = red completa
+
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.connections_failed = 0
+
+    # --- Topología ---
+
+    def add(self, addr: Address):
+        self.up.add(addr)
+
+    def crash(self, addr: Address):
+        """El proceso muere sin avisar: nadie recibe un RST."""
+        self.up.discard(addr)
+
+    def partition(self, groups: list[set[Address]]):
+        """Separa la red: solo se alcanzan direcciones del mismo grupo."""
+        self.groups = {addr: i for i, group in enumerate(groups) for addr in group}
+
+    def heal(self):
+        self.groups = {}
+
+    def reachable(self, src: Address, dst: Address) -> bool:
+        if dst not in self.up or src not in self.up:
+            return False
+        return self.groups.get(src) == self.groups.get(dst)
+
+    # --- Transporte ---
+
+    def connect(self, src: Address, dst: Address) -> bool:
+        """Intento de conexión: False si el destino no responde (caído, partición o pérdida)."""
+        if not self.reachable(src, dst) or (self.loss and self.rng.random() < self.loss):
+            self.connections_failed += 1
+            return False
+        return True
+
+    def deliver(self, src: Address, dst: Address, data: bytes, on_data):
+        """Programa la entrega de `data` (uno o más frames) tras la latencia."""
+        self.frames_sent += 1
+        self.bytes_sent += len(data)
+        delay = self.rng.uniform(*self.latency)
+        self.clock.call_later(delay, self._arrive, src, dst, data, on_data)
+
+    def _arrive(self, src: Address, dst: Address, data: bytes, on_data):
+        # Lo que estaba en vuelo cuando el destino cayó o se partió la red se pierde
+        if not self.reachable(src, dst):
+            return
+        for frame in data.split(b'\n'):
+            if frame:
+                on_data(frame)
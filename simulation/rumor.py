@@ -0,0 +1,104 @@
+"""#### Difusión de un Evento a Gran Escala
+
+Con membresía completa cada PeerNode guarda la lista de todos, así que
+50k peers reales son 2.500 millones de entradas: no entra en memoria. Para
+comparar estrategias a esa escala se modela solo la difusión de UN evento
+de membresía (ej. el `removed_peer` de un PEER_LIST_UPDATE): cada peer
+guarda si ya lo conoce, y elige destinos al azar entre todos los demás,
+como get_random_peer con la lista completa.
+
+Usa el mismo SimClock y VirtualNetwork que el clúster, así que latencia,
+pérdida, caídas y particiones se comportan igual.
+"""
+
+import random
+
+from simulation.network import SimClock, VirtualNetwork
+
+STRATEGIES = ("push", "pull", "push-pull")
+RUMOR = b"R"
+
+
+def spread_rumor(n: int, strategy: str = "push-pull", fanout: int = 1, seed: int = 0,
+                 latency: tuple[float, float] = (0.001, 0.010), loss: float = 0.0,
+                 round_interval: float = 1.0, crashed: float = 0.0, max_rounds: int = 500) -> dict:
+    """
+    Un peer conoce el evento en t=0. En cada ronda (round_interval) cada peer
+    vivo contacta a `fanout` peers al azar:
+    - push: si lo conoce, lo envía.
+    - pull: si no lo conoce, pregunta; el destino responde si lo conoce.
+    - push-pull: ambas cosas en el mismo contacto.
+    `crashed` es la fracción de peers caídos (no responden ni cuentan para el total).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Estrategia desconocida: {strategy}")
+    rng = random.Random(seed)
+    clock = SimClock()
+    net = VirtualNetwork(clock, rng, latency=latency, loss=loss)
+    addrs = [(f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}", 10000) for i in range(n)]
+    for addr in addrs:
+        net.add(addr)
+
+    dead = set(rng.sample(range(1, n), int((n - 1) * crashed))) if crashed else set()
+    for i in dead:
+        net.crash(addrs[i])
+    alive = n - len(dead)
+
+    informed = bytearray(n)
+    informed[0] = 1
+    informed_at = {1: 0.0} # { cantidad de informados: tiempo }
+    count = 1
+    push = strategy in ("push", "push-pull")
+    pull = strategy in ("pull", "push-pull")
+
+    def learn(i: int):
+        nonlocal count
+        if not informed[i]:
+            informed[i] = 1
+            count += 1
+            informed_at[count] = clock.now
+
+    def ask(src: int, dst: int):
+        # El destino recibe la consulta y responde si conoce el evento
+        if informed[dst]:
+            net.deliver(addrs[dst], addrs[src], RUMOR, lambda _frame: learn(src))
+
+    def do_round(round_number: int):
+        for i in range(n):
+            if i in dead:
+                continue
+            knows = informed[i]
+            for _ in range(fanout):
+                j = rng.randrange(n - 1)
+                j += j >= i # Cualquiera menos uno mismo
+                if not net.connect(addrs[i], addrs[j]):
+                    continue
+                if knows and push:
+                    net.deliver(addrs[i], addrs[j], RUMOR, lambda _frame, j=j: learn(j))
+                elif not knows and pull:
+                    net.deliver(addrs[i], addrs[j], RUMOR, lambda _frame, i=i, j=j: ask(i, j))
+        if count < alive and round_number + 1 < max_rounds:
+            clock.call_later(round_interval, do_round, round_number + 1)
+
+    clock.call_at(0.0, do_round, 0)
+    clock.run(stop=lambda: count >= alive)
+
+    def time_to(fraction: float) -> float | None:
+        target = max(1, int(alive * fraction + 0.999999))
+        return round(informed_at[target], 3) if target in informed_at else None
+
+    return {
+        "nodes": n,
+        "alive": alive,
+        "strategy": strategy,
+        "fanout": fanout,
+        "informed": count,
+        "complete": count >= alive,
+        "t50_s": time_to(0.5),
+        "t99_s": time_to(0.99),
+        "t100_s": time_to(1.0),
+        "rounds": round(clock.now / round_interval, 2),
+        "messages": net.frames_sent,
+        "messages_per_node": round(net.frames_sent / alive, 2),
+        "failed_connections": net.connections_failed,
+    }
@@ -0,0 +1,175 @@
+"""#### Experimentos de Membresía y Gossip Simulados
+
+Experimentos reproducibles (misma semilla = mismo resultado) sobre la red
+virtual, con tiempo simulado:
+
+- join: n peers se unen (vía servidor o con vistas iniciales sin servidor)
+  hasta que todos conocen a todos.
+- failure: cae una fracción de peers; tiempo hasta que nadie los lista.
+- partition: la red se parte en dos durante un tiempo y luego se cura.
+- rumor: difusión de un evento con push / pull / push-pull a gran escala
+  (modelo liviano, ver simulation/rumor.py).
+
+Uso:
+    python simulation/run_simulation.py join --nodes 500 --bootstrap ring --no-server
+    python simulation/run_simulation.py failure --nodes 500 --fraction 0.1
+    python simulation/run_simulation.py rumor --nodes 50000 --strategy push push-pull
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.log import ROOT_LOGGER, set_level
+from simulation.cluster import SimCluster, SERVER_ADDR, STRATEGIES
+from simulation.rumor import spread_rumor
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    El log de PeerNode y DiscoveryServer no es parte del resultado. Con miles
+    de nodos en un proceso, subir el nivel evita además encolar cada evento.
+    """
+    level = logging.getLogger(ROOT_LOGGER).level
+    set_level(logging.CRITICAL)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        set_level(level)
+
+
+def make_cluster(args, strategy: str) -> SimCluster:
+    return SimCluster(
+        seed=args.seed, latency=(args.latency_min, args.latency_max), loss=args.loss,
+        strategy=strategy, fanout=args.fanout, gossip_interval=args.gossip_interval,
+        with_server=not args.no_server,
+    )
+
+
+def build_network(cluster: SimCluster, args, bootstrap: str) -> float | None:
+    """Agrega los peers y espera a que la membresía converja."""
+    if bootstrap == "server":
+        if not cluster.server:
+            raise SystemExit("--bootstrap server requiere el servidor (sin --no-server)")
+        cluster.add_nodes(args.nodes, arrival_interval=args.arrival)
+    else:
+        cluster.add_nodes(args.nodes, register=False)
+        cluster.bootstrap(bootstrap, k=args.k)
+    return cluster.run_until_converged(args.timeout)
+
+
+def experiment_join(args, strategy: str) -> dict:
+    cluster = make_cluster(args, strategy)
+    converged_in = build_network(cluster, args, args.bootstrap)
+    return {
+        "converged_in_s": converged_in,
+        "rounds": round(converged_in / args.gossip_interval, 1) if converged_in is not None else None,
+        "missing_entries": cluster.missing_entries(),
+    } | cluster.stats()
+
+
+def experiment_failure(args, strategy: str) -> dict:
+    cluster = make_cluster(args, strategy)
+    # Partir de una red ya convergida
+    build_network(cluster, args, "server" if cluster.server else "full")
+    start = cluster.clock.now
+    frames_before = cluster.net.frames_sent
+    victims = cluster.rng.sample(cluster.nodes, int(len(cluster.nodes) * args.fraction))
+    for node in victims:
+        cluster.crash(node)
+    converged_in = cluster.run_until_converged(args.timeout)
+    return {
+        "crashed": len(victims),
+        "converged_in_s": converged_in,
+        "stale_entries": cluster.stale_entries(),
+        "frames_after_crash": cluster.net.frames_sent - frames_before,
+        "crash_at_s": round(start, 3),
+    } | cluster.stats()
+
+
+def experiment_partition(args, strategy: str) -> dict:
+    cluster = make_cluster(args, strategy)
+    build_network(cluster, args, "server" if cluster.server else "full")
+    half = len(cluster.nodes) // 2
+    side_a = {node.addr for node in cluster.nodes[:half]}
+    side_b = {node.addr for node in cluster.nodes[half:]}
+    if cluster.server:
+        side_a.add(SERVER_ADDR)
+    cluster.net.partition([side_a, side_b])
+    cluster.clock.run(until=cluster.clock.now + args.duration)
+    missing_during = cluster.missing_entries()
+    cluster.net.heal()
+    converged_in = cluster.run_until_converged(args.timeout)
+    return {
+        "partition_s": args.duration,
+        "missing_entries_at_heal": missing_during,
+        "converged_after_heal_s": converged_in,
+        "missing_entries": cluster.missing_entries(),
+    } | cluster.stats()
+
+
+def experiment_rumor(args, strategy: str) -> dict:
+    return spread_rumor(
+        args.nodes, strategy=strategy, fanout=args.fanout, seed=args.seed,
+        latency=(args.latency_min, args.latency_max), loss=args.loss,
+        round_interval=args.gossip_interval, crashed=args.fraction,
+    )
+
+
+EXPERIMENTS = {
+    "join": experiment_join,
+    "failure": experiment_failure,
+    "partition": experiment_partition,
+    "rumor": experiment_rumor,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("experiment", choices=EXPERIMENTS)
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--strategy", nargs="+", choices=STRATEGIES, default=["pull"],
+                        help="Una o más estrategias a comparar")
+    parser.add_argument("--fanout", type=int, default=1, help="Peers contactados por ciclo")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gossip-interval", type=float, default=5.0)
+    parser.add_argument("--latency-min", type=float, default=0.001)
+    parser.add_argument("--latency-max", type=float, default=0.010)
+    parser.add_argument("--loss", type=float, default=0.0, help="Probabilidad de fallo por conexión")
+    parser.add_argument("--no-server", action="store_true", help="Sin servidor de descubrimiento")
+    parser.add_argument("--bootstrap", choices=["server", "ring", "random", "full"], default="server",
+                        help="Vistas iniciales para 'join'")
+    parser.add_argument("--k", type=int, default=1, help="Peers iniciales por vista (ring/random)")
+    parser.add_argument("--arrival", type=float, default=0.01, help="Segundos entre registros (bootstrap server)")
+    parser.add_argument("--fraction", type=float, default=0.1, help="Fracción de peers caídos (failure/rumor)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Duración de la partición")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Tiempo virtual máximo por fase")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+    if args.no_server and args.bootstrap == "server":
+        args.bootstrap = "ring"
+
+    results = []
+    for strategy in args.strategy:
+        wall_start = time.perf_counter()
+        with quiet():
+            result = EXPERIMENTS[args.experiment](args, strategy)
+        result = {"strategy": strategy} | result | {"wall_s": round(time.perf_counter() - wall_start, 2)}
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"experiment": args.experiment, "params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
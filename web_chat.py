@@ -9,10 +9,36 @@ import threading
 # Añadir el path para que encuentre los módulos (common, peer)
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 from peer.peer_node import PeerNode
+from peer.host import PeerHost
+from common.metrics import request_stats
 
 # --- Configuración de la Página ---
 st.set_page_config(page_title="Chat P2P", layout="wide")
 
+PEERS_REFRESH = 15.0 # Segundos que vale la página de peers guardada en la sesión
+
+
+@st.cache_resource
+def get_peer_host() -> PeerHost:
+    """Un solo PeerHost por proceso: todas las sesiones comparten su bucle, timers y pool."""
+    return PeerHost()
+
+
+def cached_peers_page(peer: PeerNode, search: str, cursor: str | None) -> dict:
+    """
+    La página de peers de la sesión. El auto-refresh re-ejecuta el script cada
+    segundo: se consulta de nuevo (una conexión y un GET_PEERS al servidor)
+    solo si cambió la búsqueda o la página, o pasaron PEERS_REFRESH segundos.
+    """
+    key = (search, cursor)
+    cached = st.session_state.get("peers_page")
+    if cached and cached[0] == key and time.monotonic() - cached[1] < PEERS_REFRESH:
+        return cached[2]
+    page = peer.list_peers(prefix=search or None, after=cursor)
+    st.session_state.peers_page = (key, time.monotonic(), page)
+    return page
+
+
 # Inicializar el estado de la sesión
 if 'peer' not in st.session_state:
     st.session_state.peer = None
@@ -20,6 +46,8 @@ if 'peer' not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.server_ip = "127.0.0.1"
     st.session_state.auto_refresh = True
+    st.session_state.peers_cursors = [None] # Cursor GET_PEERS de cada página visitada
+    st.session_state.peers_page = None # (búsqueda, cursor), cuándo, página
 
 # --- 1. Pantalla de Conexión (Login) ---
 if not st.session_state.logged_in:
@@ -67,7 +95,7 @@ if not st.session_state.logged_in:
                             discovery_server_ip=st.session_state.server_ip,
                             discovery_server_port=9999
                         )
-                        peer.start()
+                        peer.start(host=get_peer_host())
                         
                         # Esperar registro
                         max_wait = 10
@@ -82,6 +110,8 @@ if not st.session_state.logged_in:
                         else:
                             st.session_state.peer = peer
                             st.session_state.messages = []
+                            st.session_state.peers_cursors = [None]
+                            st.session_state.peers_page = None
                             st.session_state.logged_in = True
                             # Limpiar el puerto temporal
                             del st.session_state.temp_port
@@ -97,6 +127,11 @@ else:
     peer: PeerNode = st.session_state.peer
     
     st.title(f"💬 Chat P2P - `{peer.username}`")
+
+    # Una página de peers para todo el render: consultada al servidor (o de la
+    # lista local si está caído), sin recorrer la lista completa
+    peers_search = st.session_state.get("peers_search", "").strip()
+    peers_page = cached_peers_page(peer, peers_search, st.session_state.peers_cursors[-1])
     
     # --- Barra Superior ---
     col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
@@ -108,9 +143,9 @@ else:
             st.warning("🟡 Modo P2P")
     
     with col2:
-        with peer.peer_list_lock:
-            peer_count = len([p for p in peer.peer_list.keys() if p != peer.peer_id])
-        st.info(f"👥 {peer_count} peers")
+        # Con la lista completa el conteo es local; con vista parcial, el del servidor
+        online = len(peer.membership.snapshot.others) if peer.partial is None else peers_page['total']
+        st.info(f"👥 {online} peers")
     
     with col3:
         # Toggle auto-refresh
@@ -129,25 +164,68 @@ else:
         st.header("👥 Peers Online")
         
         if st.button("🔄 Actualizar", use_container_width=True):
+            st.session_state.peers_page = None
             peer.run_gossip_cycle()
             time.sleep(0.3)
             st.rerun()
         
         st.divider()
         
-        with peer.peer_list_lock:
-            peers_to_show = {
-                pid: info for pid, info in peer.peer_list.items() 
-                if pid != peer.peer_id
-            }
-            
-            if not peers_to_show:
-                st.caption("👻 Esperando peers...")
-            else:
-                for peer_id, info in peers_to_show.items():
-                    st.markdown(f"**{info['username']}**")
-                    st.caption(f"`{info['ip']}:{info['port']}`")
-                    st.divider()
+        # Una búsqueda nueva vuelve a la primera página
+        st.text_input("🔍 Buscar", key="peers_search", placeholder="username",
+                      on_change=lambda: st.session_state.update(peers_cursors=[None]))
+
+        if not peers_page['peers']:
+            st.caption("👻 Esperando peers..." if not peers_search else "Sin resultados")
+        else:
+            for peer_id, info in peers_page['peers'].items():
+                st.markdown(f"**{info['username']}**")
+                st.caption(f"`{info['ip']}:{info['port']}`")
+                st.divider()
+
+        nav_prev, nav_next = st.columns(2)
+        if len(st.session_state.peers_cursors) > 1 and nav_prev.button("◀", use_container_width=True):
+            st.session_state.peers_cursors.pop()
+            st.rerun()
+        if peers_page['next'] and nav_next.button("▶", use_container_width=True):
+            st.session_state.peers_cursors.append(peers_page['next'])
+            st.rerun()
+
+        # --- Compartir Archivos ---
+        st.header("📎 Compartir Archivo")
+        uploaded = st.file_uploader("Archivo", label_visibility="collapsed")
+        if uploaded is not None and st.button("📤 Compartir", use_container_width=True):
+            shared_dir = os.path.join("shared", peer.username)
+            os.makedirs(shared_dir, exist_ok=True)
+            shared_path = os.path.join(shared_dir, uploaded.name)
+            with open(shared_path, "wb") as f:
+                f.write(uploaded.getbuffer())
+            peer.share_file(shared_path)
+            st.session_state.messages.append({
+                "role": "user",
+                "content": f"**{peer.username} (Tú)**: 📎 {uploaded.name}",
+                "sender": peer.username
+            })
+            st.rerun()
+
+        # --- Métricas ---
+        with st.expander("📊 Métricas"):
+            stats = peer.metrics.snapshot()
+            counters = stats["counters"]
+            m1, m2 = st.columns(2)
+            m1.metric("Enviados", counters["peer_messages_sent_total"]["value"])
+            m2.metric("Recibidos", counters["peer_messages_received_total"]["value"])
+            m1.metric("Fallos de envío", counters["peer_send_failures_total"]["value"])
+            m2.metric("Cola entrante", stats["gauges"]["peer_incoming_queue_depth"])
+            gossip = stats["histograms"]["peer_gossip_round_seconds"]
+            if gossip["count"]:
+                st.caption(f"🔁 Gossip: {gossip['count']} ciclos · p50 {gossip['p50'] * 1000:.1f} ms · p99 {gossip['p99'] * 1000:.1f} ms")
+
+            if st.button("🖥️ Métricas del servidor", use_container_width=True):
+                try:
+                    st.json(request_stats(st.session_state.server_ip, 9999))
+                except OSError as e:
+                    st.error(f"❌ Servidor no disponible: {e}")
 
     # --- ⭐ PROCESAR MENSAJES ENTRANTES ---
     new_messages_found = False
@@ -156,20 +234,21 @@ else:
     while True:
         try:
             new_msg = peer.incoming_messages.get_nowait()
+            peer.tracer.record_consumed(new_msg.get('trace'))
             
             sender_id = new_msg['sender']
-            sender_username = "Desconocido"
-            
-            with peer.peer_list_lock:
-                if sender_id in peer.peer_list:
-                    sender_username = peer.peer_list[sender_id].get('username', sender_id)
-                elif sender_id == peer.peer_id:
-                    sender_username = peer.username
+            if sender_id == peer.peer_id:
+                sender_username = peer.username
+            else:
+                # Lista local, directorio o consulta puntual al servidor (con
+                # vista parcial el remitente puede no estar en la lista)
+                sender_username = peer.username_of(sender_id, "Desconocido")
 
             st.session_state.messages.append({
                 "role": "assistant", 
                 "content": f"**{sender_username}**: {new_msg['content']}",
-                "sender": sender_username
+                "sender": sender_username,
+                "file": new_msg.get('file')
             })
             
             new_messages_found = True
@@ -187,6 +266,13 @@ else:
             for i, message in enumerate(st.session_state.messages):
                 with st.chat_message(message["role"]):
                     st.markdown(message["content"])
+                    if message.get("file"):
+                        if st.button("⬇️ Descargar", key=f"download_{i}"):
+                            try:
+                                path = peer.download_file(message["file"]["file_id"])
+                                st.success(f"✅ Guardado en `{path}`")
+                            except Exception as e:
+                                st.error(f"❌ Error al descargar: {e}")
 
     # --- INPUT DE MENSAJE ---
     prompt = st.chat_input("✏️ Escribe un mensaje...")